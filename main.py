@@ -3,10 +3,36 @@ import restapi.apiserver
 import sonoff.wsclientglb
 import sonoff.websockforwarder
 import threading
+import traceback
+import sys
+from config.config import Config
 
-sonoff.wsclientglb.init()
-sonoffThread = threading.Thread(target=sonoff.websockforwarder.main)
-print("MAIN: Starting Sonoff websocket forwarder thread")
-sonoffThread.start()
-print("MAIN: Starting API server")
-restapi.apiserver.main()
+
+def runVoiceControl():
+    # Built here so a missing microphone or model only stops voice control, not the API server
+    try:
+        import voicecontrol.voice_control_modern
+        # In the API server process the voice commands call the API views directly, no HTTP
+        voiceControl = voicecontrol.voice_control_modern.VoiceControlSystem(api_app=restapi.apiserver.app)
+        voiceControl.run()
+    except Exception as e:
+        print("MAIN: ERROR voice control stopped: " + str(e))
+        traceback.print_exc(file=sys.stdout)
+
+
+def main():
+    sonoff.wsclientglb.init()
+    sonoffThread = threading.Thread(target=sonoff.websockforwarder.main)
+    print("MAIN: Starting Sonoff websocket forwarder thread")
+    sonoffThread.start()
+    if Config().configOpt.get("voice_control", "off").strip() == "on":
+        voiceThread = threading.Thread(target=runVoiceControl, daemon=True)
+        print("MAIN: Starting voice control thread")
+        voiceThread.start()
+    print("MAIN: Starting API server")
+    restapi.apiserver.main()
+
+
+# The audio capture process (audio_capture_process) starts by importing this file again, it must not run main()
+if __name__ == "__main__":
+    main()
@@ -93,6 +93,10 @@ def sonoffSwitch():
     except:
        print("Sonoff: ERROR state param not supplied, assuming off")
        state="off"
+    ## direct LAN control first, it skips the websocket session and the cloud
+    lan=sonoff.wsclientglb.lanClient
+    if lan is not None and lan.available() and lan.switch(state):
+       return '{ "status" : "Switched boiler ' + state + ' over LAN" }'
     sonoff.wsclientglb.webSockClientForwarder.switchRelay(state)
     return '{ "status" : "Switched boiler ' + state + '" }'
 
@@ -101,6 +105,16 @@ def sonoffStatus():
     jsonresult=sonoff.wsclientglb.webSockClientForwarder.getRelayState()
     return jsonify(jsonresult)
     
+@app.route('/homeiot/api/v1.0/sonoff/energy', methods = ['GET'])
+def sonoffEnergy():
+    period=request.args.get('period', 'hour')
+    if period not in [ "hour", "day" ]:
+       print("Sonoff: ERROR period param not hour or day, assuming hour, suplied:" + period )
+       period="hour"
+    jsonresult=sonoff.wsclientglb.powerTelemetry.consumption(period)
+    jsonresult["boiler"]=sonoff.wsclientglb.powerTelemetry.dutyCycle()
+    return jsonify(jsonresult)
+
 @app.route('/homeiot/api/v1.0/shutters/command', methods = ['POST'])
 def shuttersCommand():
     try:
@@ -108,10 +122,12 @@ def shuttersCommand():
        conf = Config()
        broker=conf.configOpt["mqtt_broker"]
        shutters=ShuttersController(broker)
-       response=shutters.ShuttersCommand(command)
-       print("Shutters: sent message to mqtt broker " + broker+ " command:" + command + " " +  str(response))
+       shutter=request.form.get('shutter')
+       group=request.form.get('group')
+       response=shutters.ShuttersCommand(command, shutter, group)
+       print("Shutters: sent message to mqtt broker " + broker+ " command:" + command + " shutter:" + str(shutter) + " group:" + str(group) + " " +  str(response))
     except Exception as e:
-       print("RestAPIShutters: ERROR command param not supplied, please specify either OPEN,CLOSE,SEMIOPEN,UP,DOWN or error connecting " + str(e))
+       print("RestAPIShutters: ERROR command param not supplied, please specify either OPEN,CLOSE,SEMIOPEN,STOP,UP,DOWN,POSITION <0-100>% or error connecting " + str(e))
        response= str(e)
     return jsonify(response)
 
@@ -120,6 +136,12 @@ def lights():
     try:
        lstate=request.form['state']
        print("Lights command received: {lstate}".format(lstate=lstate))
+       ## checked before the bulbs are touched, a bad value must not leave them half switched
+       brightness=request.form.get('brightness')
+       if brightness:
+           brightness=int(brightness)
+           if not 1 <= brightness <= 100:
+               raise ValueError("brightness " + str(brightness) + " out of range, expected 1-100")
        conf = Config()
        light1token=conf.configOpt["milight_tok1"]
        light2token=conf.configOpt["milight_tok2"]
@@ -132,6 +154,10 @@ def lights():
            state="on"
            bulb1.on()
            bulb2.on()
+           if brightness:
+               state="on at " + str(brightness) + "%"
+               bulb1.set_brightness(brightness)
+               bulb2.set_brightness(brightness)
        else:
            state="off"
            bulb1.off()
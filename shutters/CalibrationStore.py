@@ -0,0 +1,96 @@
+from __future__ import print_function
+import json
+import os
+import threading
+
+
+class CalibrationStore(object):
+    """
+    Travel times of full runs (end stop to end stop) per shutter and direction,
+    kept in a small json file so they survive restarts. Only the last `window`
+    runs are kept, so the numbers follow the shutters as they wear.
+
+    The limits come from the median and the median absolute deviation of the
+    kept runs, which a single odd run can't drag around the way it would a
+    mean and standard deviation.
+    """
+
+    # MAD to standard deviation for normally distributed run times
+    MAD_SCALE = 1.4826
+
+    def __init__(self, path, window=20, k=4.0, margin=2.0, minSamples=3):
+        """
+        :param path: json file, None or empty keeps the runs in memory only
+        :param k: number of scaled MADs above the median before a run is a fault
+        :param margin: seconds added on top, covers shutters that are very consistent
+        :param minSamples: runs needed before the learned values are used
+        """
+        self.path = path
+        self.window = window
+        self.k = k
+        self.margin = margin
+        self.minSamples = minSamples
+        self.lock = threading.Lock()
+        self.runs = dict()
+        self.load()
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                self.runs = json.load(f)
+            print("Loaded shutter calibration from " + self.path)
+        except (IOError, OSError, ValueError) as e:
+            print("No shutter calibration loaded from " + self.path + ", using the defaults " + str(e))
+            self.runs = dict()
+
+    def save(self):
+        if not self.path:
+            return
+        # write aside and rename so a power cut never leaves half a file
+        tmpPath = self.path + ".tmp"
+        try:
+            with open(tmpPath, "w") as f:
+                json.dump(self.runs, f, indent=1, sort_keys=True)
+            os.rename(tmpPath, self.path)
+        except (IOError, OSError) as e:
+            print("Failed to save shutter calibration to " + self.path + " " + str(e))
+
+    def record(self, name, direction, seconds):
+        with self.lock:
+            samples = self.runs.setdefault(name, dict()).setdefault(direction, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.window]
+            self.save()
+
+    def samples(self, name, direction):
+        with self.lock:
+            return list(self.runs.get(name, dict()).get(direction, []))
+
+    def _median(self, values):
+        values = sorted(values)
+        middle = len(values) // 2
+        if len(values) % 2:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2.0
+
+    def median(self, name, direction):
+        """
+        :return: the typical full travel time in seconds, None while there are too few runs
+        """
+        samples = self.samples(name, direction)
+        if len(samples) < self.minSamples:
+            return None
+        return self._median(samples)
+
+    def envelope(self, name, direction):
+        """
+        :return: the longest a full run may take before it counts as a fault, None while there are too few runs
+        """
+        samples = self.samples(name, direction)
+        if len(samples) < self.minSamples:
+            return None
+        median = self._median(samples)
+        mad = self._median([abs(sample - median) for sample in samples])
+        return median + self.k * self.MAD_SCALE * mad + self.margin
@@ -0,0 +1,135 @@
+from __future__ import print_function
+import os
+import select
+import threading
+import time
+
+
+class EndStopSensor(object):
+    """
+    Watches one end stop input and calls listener(timestamp) as soon as it goes
+    low. Only one listener is armed at a time, the motor run heading for this
+    sensor.
+    """
+
+    def __init__(self, pin, readPin):
+        self.pin = pin
+        self.readPin = readPin
+        self.lock = threading.Lock()
+        self.listener = None
+        self.closed = False
+
+    def arm(self, listener):
+        with self.lock:
+            self.listener = listener
+        self._armed()
+
+    def disarm(self):
+        with self.lock:
+            self.listener = None
+
+    def _armed(self):
+        pass
+
+    def _fire(self, timestamp):
+        with self.lock:
+            listener = self.listener
+            self.listener = None
+        if listener is not None:
+            listener(timestamp)
+
+    def close(self):
+        self.closed = True
+        self.disarm()
+
+
+class SysfsEdgeSensor(EndStopSensor):
+    """
+    Falling edge events from the kernel through /sys/class/gpio: a thread
+    blocks in poll() on the value file and wakes up when the edge happens.
+    Needs the pin number to be the linux gpio number, which is what pyA20's
+    port constants are (PG7 = 6*32+7).
+    """
+
+    SYSFS = "/sys/class/gpio"
+
+    def __init__(self, pin, readPin):
+        EndStopSensor.__init__(self, pin, readPin)
+        gpioDir = os.path.join(self.SYSFS, "gpio%d" % pin)
+        if not os.path.exists(gpioDir):
+            with open(os.path.join(self.SYSFS, "export"), "w") as f:
+                f.write(str(pin))
+        with open(os.path.join(gpioDir, "direction"), "w") as f:
+            f.write("in")
+        with open(os.path.join(gpioDir, "edge"), "w") as f:
+            f.write("falling")
+        self.fd = os.open(os.path.join(gpioDir, "value"), os.O_RDONLY | os.O_NONBLOCK)
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLPRI | select.POLLERR)
+        # the first poll returns straight away with the current value, consume it
+        self._readValue()
+        self.thread = threading.Thread(target=self._watch)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _readValue(self):
+        os.lseek(self.fd, 0, 0)
+        return os.read(self.fd, 2)
+
+    def _watch(self):
+        while not self.closed:
+            events = self.poller.poll(1000)
+            if not events:
+                continue
+            stamp = time.time()
+            if self._readValue().startswith(b"0"):
+                self._fire(stamp)
+
+    def close(self):
+        EndStopSensor.close(self)
+        os.close(self.fd)
+
+
+class PolledEndStopSensor(EndStopSensor):
+    """
+    Fallback when edge events are not available: a thread reads the pin every
+    pollPeriod seconds, but only while a listener is armed. clock and sleep
+    come from the backend, so it also runs on the simulator's virtual time.
+    """
+
+    def __init__(self, pin, readPin, pollPeriod=0.001, clock=time.time, sleep=time.sleep):
+        EndStopSensor.__init__(self, pin, readPin)
+        self.pollPeriod = pollPeriod
+        self.clock = clock
+        self.sleep = sleep
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._watch)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _armed(self):
+        self.wake.set()
+
+    def _watch(self):
+        while not self.closed:
+            if self.listener is None:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            if not self.readPin(self.pin):
+                self._fire(self.clock())
+            else:
+                self.sleep(self.pollPeriod)
+
+    def close(self):
+        EndStopSensor.close(self)
+        self.wake.set()
+
+
+def createSensor(pin, readPin, useEdgeEvents=True, pollPeriod=0.001, clock=time.time, sleep=time.sleep):
+    if useEdgeEvents:
+        try:
+            return SysfsEdgeSensor(pin, readPin)
+        except (IOError, OSError) as e:
+            print("Edge events not available for pin " + str(pin) + ", polling every " + str(pollPeriod) + "s: " + str(e))
+    return PolledEndStopSensor(pin, readPin, pollPeriod, clock, sleep)
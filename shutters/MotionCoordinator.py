@@ -0,0 +1,329 @@
+from __future__ import print_function
+import threading
+from collections import deque
+from RampProfile import RampProfile
+
+
+class MotorRun(object):
+    """One motor driven towards one stop sensor as part of a coordinated motion"""
+
+    RAMP_UP = "ramp_up"
+    RUNNING = "running"
+    RAMP_DOWN = "ramp_down"
+    SETTLING = "settling"
+    STOPPED = "stopped"
+
+    def __init__(self, name, motor, ramp, timeout, stopSensorPin, duration=None, onStopped=None, rampDown=None):
+        """
+        :param ramp: RampProfile up to full speed
+        :param rampDown: RampProfile from full speed to standing still for controlled stops,
+                         the ramp up backwards when None
+        :param timeout: seconds after the ramp before the motor is stopped even without the sensor
+        :param duration: stop after this many seconds from the start, for moves between the end stops
+        :param onStopped: called with the run from the motion loop once the motor is stopped
+        """
+        self.name = name
+        self.motor = motor
+        self.ramp = ramp
+        if rampDown is None:
+            rampDown = RampProfile(ramp.times, list(reversed(ramp.speeds)))
+        self.rampDownProfile = rampDown
+        self.timeout = timeout
+        self.stopSensorPin = stopSensorPin
+        self.duration = duration
+        self.onStopped = onStopped
+        self.state = None
+        # the profile being stepped through and when it started
+        self.profile = None
+        self.rampStart = None
+        self.speed = 0
+        self.deadline = None
+        self.nextTick = 0.0
+        # set when the sensor cut the motor, from the sensor's thread
+        self.lock = threading.Lock()
+        self.cut = False
+        self.startTime = None
+        self.sensorTime = None
+        self.stopTime = None
+        # why the motor stopped: "sensor", "target", "limit", "cancelled"
+        self.result = None
+        self.done = threading.Event()
+
+    def setSpeed(self, speed):
+        # never turn the motor back on after the sensor cut it
+        with self.lock:
+            if not self.cut:
+                self.motor.setSpeed(speed)
+                self.speed = speed
+
+    def sensorLatency(self):
+        if self.sensorTime is None or self.stopTime is None:
+            return None
+        return self.stopTime - self.sensorTime
+
+    def elapsed(self):
+        if self.startTime is None or self.stopTime is None:
+            return None
+        return self.stopTime - self.startTime
+
+
+class MotionCoordinator(object):
+    """
+    Drives several motors at the same time. Every motor gets its own ramp and
+    its own stop sensor and is stopped on its own, so opening or closing both
+    shutters takes as long as the slower one instead of the sum of both.
+
+    Runs can be submitted while others are moving. A new run for a motor that
+    is still busy (same name) preempts it: the old run ramps down, settles and
+    only then the new one starts. cancel() ramps down without a replacement.
+    With start() the loop lives in its own thread, otherwise run() drives it
+    until the given runs are finished.
+
+    The stop sensors are edge triggered (see EndStopSensor): the sensor thread
+    cuts the motor itself, the loop only books the result. The pin level is
+    still checked every safetyCheckInterval in case an edge was missed.
+
+    All timing goes through the backend (see MotorBackend), so the same loop
+    drives the real motors or the simulator on its virtual clock.
+    """
+
+    def __init__(self, backend, settleTime=1.0, useEdgeEvents=True, sensorPollPeriod=0.001,
+                 safetyCheckInterval=1.0):
+        self.backend = backend
+        self.settleTime = settleTime
+        self.useEdgeEvents = useEdgeEvents
+        self.sensorPollPeriod = sensorPollPeriod
+        self.safetyCheckInterval = safetyCheckInterval
+        self.sensors = dict()
+        self.lock = threading.RLock()
+        self.wake = threading.Event()
+        self.active = []
+        self.pending = []
+        self.thread = None
+        # sensor to motor stop latency of the last runs, in seconds
+        self.stopLatencies = deque(maxlen=100)
+
+    def atStopSensor(self, run):
+        # sensors pull the pin low when the shutter reaches them
+        return not self.backend.input(run.stopSensorPin)
+
+    def sensor(self, pin):
+        if pin not in self.sensors:
+            self.sensors[pin] = self.backend.createSensor(pin, self.useEdgeEvents, self.sensorPollPeriod)
+        return self.sensors[pin]
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, args=(False,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, runs):
+        """
+        Queue runs without waiting for them, busy motors are ramped down first
+        """
+        with self.lock:
+            names = [run.name for run in runs]
+            self._cancelLocked(names)
+            self.pending.extend(runs)
+        self.wake.set()
+        return runs
+
+    def cancel(self, names=None):
+        """
+        Ramp down the given motors (all if None) and drop their queued runs
+        """
+        with self.lock:
+            self._cancelLocked(names)
+        self.wake.set()
+
+    def _cancelLocked(self, names):
+        for run in list(self.pending):
+            if names is None or run.name in names:
+                self.pending.remove(run)
+                run.result = "cancelled"
+                run.state = MotorRun.STOPPED
+                run.done.set()
+        for run in self.active:
+            if (names is None or run.name in names) and run.state in (MotorRun.RAMP_UP, MotorRun.RUNNING):
+                print("Preempting motor " + run.name)
+                run.result = "cancelled"
+                # continue the ramp down from whatever speed the motor is at
+                run.profile = run.rampDownProfile.tailFrom(run.speed)
+                run.rampStart = self.backend.time()
+                run.state = MotorRun.RAMP_DOWN
+                run.nextTick = run.rampStart
+
+    def busy(self, names=None):
+        with self.lock:
+            return any(names is None or run.name in names for run in self.active + self.pending)
+
+    def run(self, runs):
+        """
+        Start all runs together and return once every motor has stopped
+        :param runs: list of MotorRun
+        :return: the same runs with result filled in
+        """
+        self.submit(runs)
+        if self.thread is None:
+            self._loop(True)
+        for run in runs:
+            run.done.wait()
+        return runs
+
+    def _loop(self, untilIdle):
+        try:
+            while True:
+                with self.lock:
+                    now = self.backend.time()
+                    busyNames = [run.name for run in self.active]
+                    for run in list(self.pending):
+                        if run.name not in busyNames:
+                            self.pending.remove(run)
+                            self._startRun(run, now)
+                            self.active.append(run)
+                            busyNames.append(run.name)
+                    for run in self.active:
+                        if now >= run.nextTick or (run.cut and run.state in (MotorRun.RAMP_UP, MotorRun.RUNNING, MotorRun.RAMP_DOWN)):
+                            self._tick(run, now)
+                    self.active = [run for run in self.active if run.state != MotorRun.STOPPED]
+                    if not self.active and not self.pending and untilIdle:
+                        return
+                    delay = None
+                    if self.pending:
+                        # a run is waiting for a motor that just stopped
+                        delay = 0.0
+                    elif self.active:
+                        delay = max(0.0, min(run.nextTick for run in self.active) - self.backend.time())
+                # new submissions, cancels and sensors wake us up early
+                self.backend.wait(self.wake, delay)
+                self.wake.clear()
+        finally:
+            # Stop the motors, even if there is an exception
+            # or the user presses Ctrl+C to kill the process.
+            with self.lock:
+                for run in self.active + self.pending:
+                    run.motor.setSpeed(0)
+                    self.sensor(run.stopSensorPin).disarm()
+                    if run in self.active and run.state != MotorRun.SETTLING:
+                        run.stopTime = self.backend.time()
+                        run.result = "cancelled"
+                        self._notify(run)
+                    run.state = MotorRun.STOPPED
+                    run.done.set()
+                self.active = []
+                self.pending = []
+
+    def _sensorListener(self, run):
+        def listener(timestamp):
+            with run.lock:
+                if run.cut:
+                    return
+                run.motor.setSpeed(0)
+                run.cut = True
+                run.stopTime = self.backend.time()
+                run.sensorTime = timestamp
+            self.wake.set()
+        return listener
+
+    def _startRun(self, run, now):
+        print("Motor start " + run.name)
+        run.startTime = now
+        # arm before looking at the level so an edge in between isn't lost
+        self.sensor(run.stopSensorPin).arm(self._sensorListener(run))
+        if self.atStopSensor(run):
+            print("Already at stop sensor " + run.name)
+            self.sensor(run.stopSensorPin).disarm()
+            run.motor.setSpeed(0)
+            run.stopTime = now
+            run.result = "sensor"
+            run.state = MotorRun.STOPPED
+            self._notify(run)
+            run.done.set()
+        else:
+            run.state = MotorRun.RAMP_UP
+            run.profile = run.ramp
+            run.rampStart = now
+            run.nextTick = now
+
+    def _tick(self, run, now):
+        if run.state == MotorRun.SETTLING:
+            ## stop again in case this fails occationally
+            run.motor.setSpeed(0)
+            run.state = MotorRun.STOPPED
+            run.done.set()
+        elif run.cut:
+            self._stop(run, "sensor")
+        elif run.duration is not None and now >= run.startTime + run.duration \
+                and run.state in (MotorRun.RAMP_UP, MotorRun.RUNNING):
+            self._stop(run, "target")
+        elif run.state == MotorRun.RAMP_UP:
+            if self._step(run, now):
+                print("Ramp done " + run.name + " in %.3fs, waiting for the sensor for up to %.1fs" % (now - run.rampStart, run.timeout))
+                run.state = MotorRun.RUNNING
+                run.deadline = now + run.timeout
+                run.nextTick = self._nextCheck(run, now)
+        elif run.state == MotorRun.RUNNING:
+            if self.atStopSensor(run):
+                # the edge got lost, stop on the level
+                self._sensorListener(run)(now)
+                self._stop(run, "sensor")
+            elif now >= run.deadline:
+                self._stop(run, "limit")
+            else:
+                run.nextTick = self._nextCheck(run, now)
+        elif run.state == MotorRun.RAMP_DOWN:
+            if self._step(run, now):
+                self._stop(run, "cancelled")
+
+    def _step(self, run, now):
+        """
+        Set the speed of the ramp step due now. Steps are due at fixed times
+        from the start of the ramp, a late wakeup skips to the current step
+        instead of pushing the rest of the ramp back.
+        :return: True once the last step is set
+        """
+        profile = run.profile
+        index = profile.stepAt(now - run.rampStart)
+        if profile.speeds[index] != run.speed:
+            run.setSpeed(profile.speeds[index])
+        if index + 1 < len(profile.times):
+            run.nextTick = run.rampStart + profile.times[index + 1]
+            return False
+        return True
+
+    def _nextCheck(self, run, now):
+        nextTick = min(run.deadline, now + self.safetyCheckInterval)
+        if run.duration is not None:
+            nextTick = min(nextTick, run.startTime + run.duration)
+        return nextTick
+
+    def _notify(self, run):
+        if run.onStopped is None:
+            return
+        try:
+            run.onStopped(run)
+        except Exception as e:
+            print("Error in stop callback of motor " + run.name + " " + str(e))
+
+    def _stop(self, run, reason):
+        self.sensor(run.stopSensorPin).disarm()
+        with run.lock:
+            run.motor.setSpeed(0)
+            if run.stopTime is None:
+                run.stopTime = self.backend.time()
+        run.state = MotorRun.SETTLING
+        run.nextTick = self.backend.time() + self.settleTime
+        if reason == "sensor" or run.result is None:
+            run.result = reason
+        elapsed = run.stopTime - run.startTime
+        if reason == "sensor":
+            latency = run.sensorLatency()
+            self.stopLatencies.append(latency)
+            print("Motor " + run.name + " was stopped from sensor after %.2fs, sensor to stop latency %.3f ms" % (elapsed, latency * 1000))
+        elif reason == "target":
+            print("Motor " + run.name + " reached its target after %.2fs" % elapsed)
+        elif reason == "limit":
+            print("Motor " + run.name + " was stopped by the set limit after %.2fs" % elapsed)
+        else:
+            print("Motor " + run.name + " was ramped down after being preempted")
+        self._notify(run)
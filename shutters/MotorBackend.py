@@ -0,0 +1,181 @@
+from __future__ import print_function
+import os
+import random
+import sys
+import threading
+import time
+import EndStopSensor
+
+
+class HardwareBackend(object):
+    """
+    The Orange Pi: motors on the DRV8835 driver through pololu_drv8835_rpi and
+    end stop sensors read through pyA20. The drivers are only imported here,
+    so the rest of the shutters code loads on any machine.
+    """
+
+    def __init__(self):
+        if not os.getegid() == 0:
+            sys.exit('Script must be run as root')
+        from pololu_drv8835_rpi import motors, MAX_SPEED
+        import OPi.GPIO as GPIO
+        import wiringpi
+        from pyA20.gpio import gpio
+        from pyA20.gpio import port
+        self.motors = motors
+        self.maxSpeed = MAX_SPEED
+        self.gpio = gpio
+        self.port = port
+        """Init gpio module"""
+        gpio.init()
+
+    def pin(self, name):
+        # port names as in pyA20, e.g. PA10
+        return getattr(self.port, name)
+
+    def setupInput(self, pin):
+        self.gpio.setcfg(pin, self.gpio.INPUT)
+        self.gpio.pullup(pin, self.gpio.PULLUP)
+
+    def input(self, pin):
+        return self.gpio.input(pin)
+
+    def motor(self, channel):
+        return getattr(self.motors, "motor%d" % channel)
+
+    def createSensor(self, pin, useEdgeEvents=True, pollPeriod=0.001):
+        return EndStopSensor.createSensor(pin, self.input, useEdgeEvents, pollPeriod)
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        return event.wait(timeout)
+
+
+class SimulatedMotor(object):
+    """
+    A motor moving a shutter between its end stops. The position is in
+    percent (0 closed, 100 open) and moves with the speed set, a full run at
+    maximum speed takes travelTime seconds of virtual time.
+
+    travelNoise varies the speed from one run to the next (relative standard
+    deviation), sensorNoise moves the point where the end stops trigger
+    (standard deviation in percent), both drawn every time the motor starts.
+    """
+
+    def __init__(self, backend, travelTime, openSign=1, position=50.0, travelNoise=0.0, sensorNoise=0.0):
+        self.backend = backend
+        self.travelTime = travelTime
+        self.openSign = openSign
+        self.position = position
+        self.travelNoise = travelNoise
+        self.sensorNoise = sensorNoise
+        self.lock = threading.Lock()
+        self.speed = 0
+        self.speedFactor = 1.0
+        self.jamFactor = 1.0
+        self.openTrigger = 100.0
+        self.closedTrigger = 0.0
+        self.lastUpdate = backend.time()
+        self.starts = 0
+
+    def _update(self):
+        now = self.backend.time()
+        rate = self.openSign * float(self.speed) / self.backend.maxSpeed * 100.0 / self.travelTime
+        self.position += rate * self.speedFactor * self.jamFactor * (now - self.lastUpdate)
+        self.position = max(0.0, min(100.0, self.position))
+        self.lastUpdate = now
+
+    def setSpeed(self, speed):
+        with self.lock:
+            self._update()
+            if self.speed == 0 and speed != 0:
+                self.starts += 1
+                self.speedFactor = max(0.1, random.gauss(1.0, self.travelNoise)) if self.travelNoise else 1.0
+                self.openTrigger = 100.0 - abs(random.gauss(0.0, self.sensorNoise)) if self.sensorNoise else 100.0
+                self.closedTrigger = abs(random.gauss(0.0, self.sensorNoise)) if self.sensorNoise else 0.0
+            self.speed = speed
+
+    def jam(self, factor=0.0):
+        """
+        Slow the shutter down to factor of its speed, 0 stops it moving at all
+        """
+        with self.lock:
+            self._update()
+            self.jamFactor = factor
+
+    def getPosition(self):
+        with self.lock:
+            self._update()
+            return self.position
+
+    def atOpen(self):
+        return self.getPosition() >= self.openTrigger
+
+    def atClosed(self):
+        return self.getPosition() <= self.closedTrigger
+
+
+class SimulatedBackend(object):
+    """
+    Motors and end stops simulated in process, on a virtual clock that runs
+    speedup times faster than the wall clock. Every time, sleep and wait of
+    the motion code goes through here, so a minute of shutter motion takes a
+    second with speedup=60 and the timing still adds up. Sensors are polled,
+    there are no edge events.
+    """
+
+    def __init__(self, speedup=50.0, maxSpeed=480, seed=None):
+        self.speedup = float(speedup)
+        self.maxSpeed = maxSpeed
+        self.realStart = time.time()
+        self.virtualStart = self.realStart
+        self.pins = dict()
+        self.sensors = dict()
+        self.motors = dict()
+        if seed is not None:
+            random.seed(seed)
+
+    def addShutter(self, channel, openPin, closedPin, travelTime, openSign=1, position=50.0, travelNoise=0.0,
+                   sensorNoise=0.0):
+        """
+        :param openPin: name of the open end stop pin, as passed to pin()
+        :return: the SimulatedMotor on that channel
+        """
+        motor = SimulatedMotor(self, travelTime, openSign, position, travelNoise, sensorNoise)
+        self.motors[channel] = motor
+        self.sensors[self.pin(openPin)] = motor.atOpen
+        self.sensors[self.pin(closedPin)] = motor.atClosed
+        return motor
+
+    def pin(self, name):
+        if name not in self.pins:
+            self.pins[name] = len(self.pins) + 1
+        return self.pins[name]
+
+    def setupInput(self, pin):
+        pass
+
+    def input(self, pin):
+        # sensors pull the pin low when the shutter reaches them, unconnected pins stay high
+        reached = self.sensors.get(pin)
+        return 0 if reached is not None and reached() else 1
+
+    def motor(self, channel):
+        return self.motors[channel]
+
+    def createSensor(self, pin, useEdgeEvents=True, pollPeriod=0.001):
+        return EndStopSensor.PolledEndStopSensor(pin, self.input, pollPeriod, self.time, self.sleep)
+
+    def time(self):
+        return self.virtualStart + (time.time() - self.realStart) * self.speedup
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speedup)
+
+    def wait(self, event, timeout):
+        return event.wait(None if timeout is None else timeout / self.speedup)
@@ -0,0 +1,72 @@
+from __future__ import print_function
+import bisect
+import math
+
+
+class RampProfile(object):
+    """
+    Motor speeds over time for a ramp, computed once per motor. times are
+    offsets in seconds from the start of the ramp, speeds[i] is set at
+    times[i]. The stepper in MotionCoordinator sets the step that is due at
+    the current time, so a late wakeup skips steps instead of stretching the
+    ramp, and the ramp always takes the same time.
+    """
+
+    LINEAR = "linear"
+    SCURVE = "scurve"
+
+    def __init__(self, times, speeds):
+        self.times = times
+        self.speeds = speeds
+
+    @staticmethod
+    def shapeAt(shape, fraction):
+        if shape == RampProfile.SCURVE:
+            # half a cosine, no jerk at either end
+            return (1.0 - math.cos(math.pi * fraction)) / 2.0
+        return fraction
+
+    @classmethod
+    def up(cls, maxSpeed, duration, shape=LINEAR, stepInterval=0.02):
+        """
+        :param maxSpeed: speed at the end of the ramp, negative to turn the other way
+        """
+        steps = max(1, int(math.ceil(duration / stepInterval)))
+        times = [duration * i / steps for i in range(steps + 1)]
+        speeds = [int(round(maxSpeed * cls.shapeAt(shape, float(i) / steps))) for i in range(steps + 1)]
+        return cls(times, speeds)
+
+    @classmethod
+    def down(cls, maxSpeed, duration, shape=LINEAR, stepInterval=0.02):
+        """
+        From maxSpeed down to standing still
+        """
+        steps = max(1, int(math.ceil(duration / stepInterval)))
+        times = [duration * i / steps for i in range(steps + 1)]
+        speeds = [int(round(maxSpeed * (1.0 - cls.shapeAt(shape, float(i) / steps)))) for i in range(steps + 1)]
+        return cls(times, speeds)
+
+    @classmethod
+    def fromSpeeds(cls, speeds, stepDelay):
+        # a plain list of speeds set every stepDelay seconds, as motorAction used to do
+        return cls([i * stepDelay for i in range(len(speeds))], list(speeds))
+
+    def duration(self):
+        return self.times[-1] if self.times else 0.0
+
+    def stepAt(self, elapsed):
+        """
+        :return: index of the step due after elapsed seconds
+        """
+        return max(0, bisect.bisect_right(self.times, elapsed) - 1)
+
+    def tailFrom(self, speed):
+        """
+        The rest of a ramp down profile from the first step slower than speed,
+        for stopping a motor that isn't at full speed
+        """
+        for index, stepSpeed in enumerate(self.speeds):
+            if abs(stepSpeed) < abs(speed):
+                start = self.times[index]
+                return RampProfile([t - start for t in self.times[index:]], self.speeds[index:])
+        return RampProfile([0.0], [0])
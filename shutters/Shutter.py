@@ -0,0 +1,178 @@
+from __future__ import print_function
+import threading
+from MotionCoordinator import MotorRun
+from CalibrationStore import CalibrationStore
+
+
+class Shutter(object):
+    """
+    One shutter: its motor, its two end stop sensors and an estimate of where
+    it is.
+
+    The position is in percent, 0 closed and 100 open, None until the shutter
+    hit an end stop. In between it is estimated from how long the motor ran
+    and the travel time of a full run, which is measured every time the
+    shutter goes from one end stop to the other. Every sensor hit puts the
+    estimate back on the end stop, so the error never adds up over moves.
+    The ramp up covers about as much as half its time at full speed.
+
+    Full runs are recorded in the CalibrationStore. Once there are enough of
+    them the run limits and the half open move come from their statistics
+    instead of the hand tuned defaults, and a run that doesn't reach its
+    sensor inside the learned envelope is flagged as a fault.
+    """
+
+    OPEN = "open"
+    CLOSE = "close"
+
+    # seconds for a full open or close until an end to end run was timed
+    DEFAULT_TRAVEL = 25.0
+    # percent moved by one UP or DOWN
+    NUDGE_STEP = 10
+
+    def __init__(self, name, motor, openRamp, closeRamp, openSensorPin, closedSensorPin, timeout, halfopenStep,
+                 calibration=None, semiopen=15, openRampDown=None, closeRampDown=None):
+        """
+        :param timeout: seconds before an end to end run is stopped even without the sensor, until calibrated
+        :param halfopenStep: seconds opened from closed for SEMIOPEN, until calibrated
+        :param openRamp: RampProfile up to full speed in the opening direction
+        :param openRampDown: RampProfile for controlled stops while opening
+        :param calibration: CalibrationStore shared by the shutters
+        :param semiopen: percent open for SEMIOPEN once calibrated
+        """
+        self.name = name
+        self.motor = motor
+        self.openRamp = openRamp
+        self.closeRamp = closeRamp
+        self.openRampDown = openRampDown
+        self.closeRampDown = closeRampDown
+        self.openSensorPin = openSensorPin
+        self.closedSensorPin = closedSensorPin
+        self.timeout = timeout
+        self.halfopenStep = halfopenStep
+        self.rampTime = openRamp.duration()
+        self.calibration = calibration if calibration is not None else CalibrationStore(None)
+        self.semiopen = semiopen
+        self.lock = threading.Lock()
+        self.position = None
+        # last full run, used until the store has enough of them
+        self.travel = {self.OPEN: None, self.CLOSE: None}
+        self.lastFault = None
+
+    def getPosition(self):
+        with self.lock:
+            return self.position
+
+    def travelTime(self, direction):
+        """
+        :return: seconds at full speed for a full run
+        """
+        median = self.calibration.median(self.name, direction)
+        if median is not None:
+            return self._fullSpeedTime(median)
+        with self.lock:
+            return self.travel[direction] or self.DEFAULT_TRAVEL
+
+    def runTimeout(self, direction):
+        # MotorRun timeouts count from the end of the ramp
+        envelope = self.calibration.envelope(self.name, direction)
+        if envelope is None:
+            return self.timeout
+        return max(1.0, envelope - self.rampTime)
+
+    def calibrated(self):
+        return self.calibration.median(self.name, self.OPEN) is not None
+
+    def halfopenDuration(self):
+        if self.calibrated():
+            return self.semiopen / 100.0 * self.travelTime(self.OPEN) + self.rampTime / 2.0
+        return self.halfopenStep
+
+    def semiopenPosition(self):
+        if self.calibrated():
+            return self.semiopen
+        return min(100.0, 100.0 * self._fullSpeedTime(self.halfopenStep) / self.travelTime(self.OPEN))
+
+    def _fullSpeedTime(self, elapsed):
+        return max(0.0, elapsed - self.rampTime / 2.0)
+
+    def _run(self, direction, timeout, duration=None):
+        if direction == self.OPEN:
+            run = MotorRun(self.name, self.motor, self.openRamp, timeout, self.openSensorPin, duration, self._stopped,
+                           self.openRampDown)
+        else:
+            run = MotorRun(self.name, self.motor, self.closeRamp, timeout, self.closedSensorPin, duration, self._stopped,
+                           self.closeRampDown)
+        run.direction = direction
+        return run
+
+    def openRun(self):
+        return self._run(self.OPEN, self.runTimeout(self.OPEN))
+
+    def closeRun(self):
+        return self._run(self.CLOSE, self.runTimeout(self.CLOSE))
+
+    def halfopenStepRun(self):
+        # short opening step from closed to let light trough
+        return self._run(self.OPEN, self.runTimeout(self.OPEN), self.halfopenDuration())
+
+    def moveRun(self, target):
+        """
+        :param target: position in percent
+        :return: a run covering only the distance from the current position, None if
+                 there is nothing to do or the position is not known yet
+        """
+        if target >= 100:
+            return self.openRun()
+        if target <= 0:
+            return self.closeRun()
+        position = self.getPosition()
+        if position is None or abs(target - position) < 1:
+            return None
+        direction = self.OPEN if target > position else self.CLOSE
+        duration = abs(target - position) / 100.0 * self.travelTime(direction) + self.rampTime / 2.0
+        return self._run(direction, self.runTimeout(direction), duration)
+
+    def nudgeRun(self, direction):
+        position = self.getPosition()
+        if position is not None:
+            if direction == self.OPEN:
+                return self.moveRun(min(100, position + self.NUDGE_STEP))
+            return self.moveRun(max(0, position - self.NUDGE_STEP))
+        # without a position move by time, the sensors still stop it at the ends
+        duration = self.NUDGE_STEP / 100.0 * self.travelTime(direction) + self.rampTime / 2.0
+        return self._run(direction, self.runTimeout(direction), duration)
+
+    def _stopped(self, run):
+        # runs of one shutter never overlap, so position still is where this run started
+        elapsed = run.elapsed() or 0.0
+        travel = self.travelTime(run.direction)
+        fullRun = False
+        with self.lock:
+            start = self.position
+            end = 100.0 if run.direction == self.OPEN else 0.0
+            run.fault = None
+            if run.result == "sensor":
+                if start is not None and start == 100.0 - end and elapsed > 0:
+                    self.travel[run.direction] = self._fullSpeedTime(elapsed)
+                    fullRun = True
+                self.position = end
+            elif run.result == "limit":
+                # the sensor should have been hit by now, jammed shutter or broken sensor
+                run.fault = {"shutter": self.name, "direction": run.direction, "elapsed": round(elapsed, 2),
+                             "envelope": round(run.timeout + self.rampTime, 2), "ts": run.stopTime}
+                self.lastFault = run.fault
+                self.position = None
+            elif start is not None:
+                moved = 100.0 * self._fullSpeedTime(elapsed) / travel
+                if run.direction == self.OPEN:
+                    self.position = min(100.0, start + moved)
+                else:
+                    self.position = max(0.0, start - moved)
+            position = self.position
+        if fullRun:
+            print("Shutter " + self.name + " full " + run.direction + " takes %.2fs" % elapsed)
+            self.calibration.record(self.name, run.direction, elapsed)
+        if run.fault is not None:
+            print("FAULT: shutter " + self.name + " did not reach the " + run.direction + " sensor within %.2fs" % run.fault["envelope"])
+        print("Shutter " + self.name + " position " + ("unknown" if position is None else "%.0f%%" % position))
@@ -0,0 +1,69 @@
+from __future__ import print_function
+import configparser
+import os
+import socket
+
+
+class ShutterConfig(object):
+    """One [shutter:<id>] section of shutters.ini"""
+
+    def __init__(self, shutterId, section):
+        self.id = shutterId
+        # empty means every board, for single board setups
+        self.board = section.get("board", "").strip()
+        self.motor = int(section.get("motor"))
+        self.openSensor = section.get("open_sensor").strip()
+        self.closedSensor = section.get("closed_sensor").strip()
+        # which way the motor turns to open, depends on how it is wired
+        self.openReverse = section.get("open_direction", "forward").strip() == "reverse"
+        self.timeout = float(section.get("timeout", "160"))
+        self.halfopenStep = float(section.get("halfopen_step", "4.6"))
+        self.semiopen = float(section.get("semiopen", "15"))
+        # the old ramp was 240 steps of 5ms up to full speed, as a line
+        self.rampShape = section.get("ramp_shape", "linear").strip()
+        if self.rampShape not in ("linear", "scurve"):
+            print("ERROR: unknown ramp_shape " + self.rampShape + " for shutter " + shutterId + ", using linear")
+            self.rampShape = "linear"
+        self.rampTime = float(section.get("ramp_time", "1.2"))
+        self.rampDownTime = float(section.get("ramp_down_time", "0.6"))
+        self.rampStep = float(section.get("ramp_step", "0.02"))
+        self.groups = [group.strip() for group in section.get("groups", "").split(",") if group.strip()]
+
+
+class ShuttersConfig(object):
+    """
+    Shutters and controller boards from shutters.ini, see default_shutters.ini.
+    The same file can go to every board, each board only drives the shutters
+    assigned to it (or to no board in particular).
+    """
+
+    CONF_PATH = "/usr/local/bin/home-iot/shutters.ini"
+    SHUTTER_PREFIX = "shutter:"
+
+    def __init__(self, path=None):
+        if path is None:
+            path = self.CONF_PATH
+            if not os.path.exists(path):
+                print("INFO: " + path + " not found, using the default shutters configuration")
+                path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'default_shutters.ini')
+        self.path = path
+        self.cfg = configparser.ConfigParser()
+        self.cfg.read(path)
+        board = self.cfg["board"] if self.cfg.has_section("board") else dict()
+        self.boardId = board.get("id", "").strip() or socket.gethostname()
+        self.mqttBroker = board.get("mqtt_broker", "192.168.1.2").strip()
+        self.mqttPort = int(board.get("mqtt_port", "1883"))
+        # seconds after which a command is too old to run
+        self.commandMaxAge = float(board.get("command_max_age", "30"))
+        self.calibrationPath = board.get("calibration_path", "/usr/local/bin/home-iot/shutters_calibration.json").strip()
+        self.shutters = []
+        for name in self.cfg.sections():
+            if name.startswith(self.SHUTTER_PREFIX):
+                shutterId = name[len(self.SHUTTER_PREFIX):].strip()
+                if shutterId in ("", "group") or any(c in shutterId for c in "/+#"):
+                    print("ERROR: invalid shutter id " + shutterId + " in " + path)
+                    continue
+                self.shutters.append(ShutterConfig(shutterId, self.cfg[name]))
+
+    def boardShutters(self):
+        return [shutter for shutter in self.shutters if shutter.board in ("", self.boardId)]
@@ -3,27 +3,24 @@ import paho.mqtt.client as mqtt
 import time
 import logging
 
-from pololu_drv8835_rpi import motors, MAX_SPEED
-import time
-import OPi.GPIO as GPIO
-import wiringpi
-import os
-import sys
-
-if not os.getegid() == 0:
-    sys.exit('Script must be run as root')
-
-
-from pyA20.gpio import gpio
-from pyA20.gpio import connector
-from pyA20.gpio import port
-
+from MotionCoordinator import MotionCoordinator, MotorRun
+from RampProfile import RampProfile
+from Shutter import Shutter
+from CalibrationStore import CalibrationStore
+from MotorBackend import HardwareBackend
+from ShuttersConfig import ShuttersConfig
 
 
 class ShuttersMotorControl(object):
 
 
-    def __init__(self, broker_address="localhost", broker_port=1883):
+    def __init__(self, broker_address="localhost", broker_port=1883, useEdgeEvents=True, sensorPollPeriod=0.001,
+                 calibrationPath=None, backend=None, config=None):
+        """
+        :param calibrationPath: learned travel times, from the config when None
+        :param backend: HardwareBackend when None, or a SimulatedBackend to run without the Orange Pi
+        :param config: ShuttersConfig, read from shutters.ini when None
+        """
         self.client = mqtt.Client() #create new instance
         #logging.basicConfig(level=logging.DEBUG)
         logger = logging.getLogger(__name__)
@@ -35,96 +32,124 @@ class ShuttersMotorControl(object):
         #print("Subscribed to shutters/commandreply")
         #self.client.on_message=self.on_message
 
-        # Set up sequences of motor speeds.
-        self.forward_speeds = list(range(0, MAX_SPEED, 2))
-        self.reverse_speeds = list(range(0, -MAX_SPEED, -2))
-
-        # pinShutter2closedSensor = connector.gpio3p37
-        self.pinShutter2openSensor = port.PA10
-        self.pinShutter2closedSensor = port.PA20
-        self.pinShutter1openSensor = port.PG7
-        self.pinShutter1closedSensor = port.PG6
-
-        """Init gpio module"""
-        gpio.init()
-
-        """Set directions"""
-        gpio.setcfg(self.pinShutter2openSensor, gpio.INPUT)
-        gpio.setcfg(self.pinShutter2closedSensor, gpio.INPUT)
-        gpio.setcfg(self.pinShutter1openSensor, gpio.INPUT)
-        gpio.setcfg(self.pinShutter1closedSensor, gpio.INPUT)
-
-        """Enable pullup resistor"""
-        gpio.pullup(self.pinShutter2openSensor, gpio.PULLUP)
-        gpio.pullup(self.pinShutter2closedSensor, gpio.PULLUP)
-        gpio.pullup(self.pinShutter1openSensor, gpio.PULLUP)
-        gpio.pullup(self.pinShutter1closedSensor, gpio.PULLUP)
-        # gpio.pullup(button, gpio.PULLDOWN)     # Optionally you can use pull-down resistor
+        if config is None:
+            config = ShuttersConfig()
+        self.config = config
+        if backend is None:
+            backend = HardwareBackend()
+        self.backend = backend
+
+        # end stops cut the motor from edge events, or from a poll thread every sensorPollPeriod seconds
+        self.coordinator = MotionCoordinator(backend, useEdgeEvents=useEdgeEvents, sensorPollPeriod=sensorPollPeriod)
+
+        # run times of full runs, the limits and the half open move are learned from them
+        self.calibration = CalibrationStore(calibrationPath if calibrationPath is not None else config.calibrationPath)
+
+        self.shutters = [self.createShutter(shutterConfig) for shutterConfig in config.boardShutters()]
+        self.groups = dict()
+        for shutterConfig in config.boardShutters():
+            for group in shutterConfig.groups:
+                self.groups.setdefault(group, []).append(self.shutter(shutterConfig.id))
+        print("Board " + config.boardId + " drives shutters " + ", ".join(shutter.name for shutter in self.shutters))
+
+    def createShutter(self, shutterConfig):
+        openSensor = self.backend.pin(shutterConfig.openSensor)
+        closedSensor = self.backend.pin(shutterConfig.closedSensor)
+        """Set directions and enable pullup resistor"""
+        self.backend.setupInput(openSensor)
+        self.backend.setupInput(closedSensor)
+        # ramps are worked out once here, the motion loop only looks up the step that is due
+        openSpeed = -self.backend.maxSpeed if shutterConfig.openReverse else self.backend.maxSpeed
+        ramps = dict()
+        for name, speed in [("open", openSpeed), ("close", -openSpeed)]:
+            ramps[name] = RampProfile.up(speed, shutterConfig.rampTime, shutterConfig.rampShape, shutterConfig.rampStep)
+            ramps[name + "Down"] = RampProfile.down(speed, shutterConfig.rampDownTime, shutterConfig.rampShape,
+                                                    shutterConfig.rampStep)
+        # timeouts in seconds until calibrated, the old loop protect limits were 800/900 (17/19) polls of 0.2s.
+        # The half open steps used to start after the ramp (240 steps of 5ms), now they count from the start.
+        return Shutter(shutterConfig.id, self.backend.motor(shutterConfig.motor), ramps["open"], ramps["close"],
+                       openSensor, closedSensor, shutterConfig.timeout, shutterConfig.halfopenStep,
+                       self.calibration, shutterConfig.semiopen, ramps["openDown"], ramps["closeDown"])
+
+    def shutter(self, shutterId):
+        for shutter in self.shutters:
+            if shutter.name == shutterId:
+                return shutter
+        return None
+
+    def group(self, name):
+        return self.groups.get(name, [])
+
+    def positions(self):
+        return dict((shutter.name, shutter.getPosition()) for shutter in self.shutters)
+
+    def positionKnown(self, shutters=None):
+        return all(shutter.getPosition() is not None for shutter in shutters or self.shutters)
+
+    def openRuns(self, shutters=None):
+        return [shutter.openRun() for shutter in shutters or self.shutters]
+
+    def closeRuns(self, shutters=None):
+        return [shutter.closeRun() for shutter in shutters or self.shutters]
+
+    def halfopenStepRuns(self, shutters=None):
+        return [shutter.halfopenStepRun() for shutter in shutters or self.shutters]
+
+    def homeRuns(self, shutters=None):
+        # close the shutters that don't know where they are yet
+        return [shutter.closeRun() for shutter in shutters or self.shutters if shutter.getPosition() is None]
+
+    def positionRuns(self, target, shutters=None):
+        runs = [shutter.moveRun(target) for shutter in shutters or self.shutters]
+        return [run for run in runs if run is not None]
+
+    def semiopenRuns(self, shutters=None):
+        runs = [shutter.moveRun(shutter.semiopenPosition()) for shutter in shutters or self.shutters]
+        return [run for run in runs if run is not None]
+
+    def nudgeRuns(self, direction, shutters=None):
+        runs = [shutter.nudgeRun(direction) for shutter in shutters or self.shutters]
+        return [run for run in runs if run is not None]
 
     def open(self):
-        print("Opening shutters")
-        print("Motor 1 opening")
-        self.motorAction(motors.motor1,self.reverse_speeds,800,self.pinShutter1openSensor)
-        print("Motor 2 opening")
-        self.motorAction(motors.motor2,self.forward_speeds,900,self.pinShutter2openSensor)
+        print("Opening shutters - all motors together")
+        return self.coordinator.run(self.openRuns())
 
 
     def close(self):
-        print("Closing shutters")
-        #print("Motor 1 closing")
-        self.motorAction(motors.motor1,self.forward_speeds,800,self.pinShutter1closedSensor)
-        print("Motor 2 closing")
-        self.motorAction(motors.motor2,self.reverse_speeds,900,self.pinShutter2closedSensor)
+        print("Closing shutters - all motors together")
+        return self.coordinator.run(self.closeRuns())
 
     def halfopen(self):
-        print("Ensure both shutters are closed")
-        print("Motor 1 closing")
-        self.motorAction(motors.motor1,self.forward_speeds,800,self.pinShutter1closedSensor)
-        print("Motor 2 closing")
-        self.motorAction(motors.motor2,self.reverse_speeds,900,self.pinShutter2closedSensor)
-        print("Shutter 1 opening with the step to let light trough")
-        self.motorAction(motors.motor1,self.reverse_speeds,17,self.pinShutter1openSensor)
-        print("Shutter 2 opening with the step to let light trough")
-        self.motorAction(motors.motor2,self.forward_speeds,19,self.pinShutter2openSensor)
+        print("Ensure all shutters are closed")
+        self.close()
+        print("All shutters opening with the step to let light trough")
+        return self.coordinator.run(self.halfopenStepRuns())
+
+    def stop(self, shutters=None):
+        # controlled ramp-down of whatever is moving
+        self.coordinator.cancel(self._names(shutters))
+
+    def stopAndWait(self, shutters=None):
+        # positions are only up to date once nothing moves
+        names = self._names(shutters)
+        self.coordinator.cancel(names)
+        while self.coordinator.busy(names):
+            self.backend.sleep(0.05)
+
+    def _names(self, shutters):
+        if shutters is None:
+            return None
+        return [shutter.name for shutter in shutters]
 
     def stopAllMotors(self):
-        motors.setSpeeds(0, 0)
-
-
-    def motorAction(self,motor,listSpeed,intLoopProtectLimit,stopSensorPin):
-        print("Motor start")
-
-        try:
-            motors.setSpeeds(0, 0)
-        
-            if not gpio.input(stopSensorPin) :
-                print("Already at stop sensor")
-                motors.setSpeeds(0, 0)
-                return
-            for s in listSpeed:
-            #for s in test_reverse_speeds:
-                motor.setSpeed(s)
-                time.sleep(0.005)
-            loopprotect = 0
-            print("Right Before sensor loop:" + str(gpio.input(stopSensorPin)))
-            while gpio.input(stopSensorPin) and loopprotect < intLoopProtectLimit :
-                #print(gpio.input(pinShutter2closedSensor))
-                time.sleep(0.2)
-                loopprotect += 1
-            print("Stopping motor - stop condition met - sensor or limit " + str(loopprotect))
-            motor.setSpeed(0)
-            print("Set speed to 0 after 1 sec in case motor didn't stop:" + str(gpio.input(stopSensorPin)))
-            time.sleep(1)  ## stop again in case this fails occationally
-            motors.setSpeeds(0, 0)
-            if loopprotect < intLoopProtectLimit:
-                print("Motor was stopped from sensor , counter is at "+str(loopprotect))
-            else:
-                print("Motor was stopped by the set limit:"+str(loopprotect) )
-        
-        finally:
-          # Stop the motors, even if there is an exception
-          # or the user presses Ctrl+C to kill the process.
-          motors.setSpeeds(0, 0)
+        for shutter in self.shutters:
+            shutter.motor.setSpeed(0)
+
+
+    def motorAction(self,motor,listSpeed,timeout,stopSensorPin):
+        # single motor, kept for running one shutter by hand
+        self.coordinator.run([MotorRun("motor", motor, RampProfile.fromSpeeds(listSpeed, 0.005), timeout, stopSensorPin)])
 
 
 
@@ -1,62 +1,306 @@
 import paho.mqtt.client as mqtt
 import time
+import json
 import logging
+import random
+import re
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 from ShuttersMotorControl import ShuttersMotorControl
+from Shutter import Shutter
+from ShuttersConfig import ShuttersConfig
 ## temporary while I write the controller class
 from subprocess import call
 
+## sender and board clocks may differ this much before a timestamp counts as from the future
+CLOCK_SKEW_TOLERANCE = 2.0
+
+POSITION_COMMAND = re.compile(r"^POSITION\s+(\d{1,3})\s*%?$")
+
+
+def parsePosition(cmd):
+    """
+    :return: the target percent of a POSITION <n>% command, None for other commands
+    """
+    match = POSITION_COMMAND.match(cmd)
+    if match is None or int(match.group(1)) > 100:
+        return None
+    return int(match.group(1))
+
+
+def parseCommand(payload):
+    """
+    Commands are either plain text (OPEN) or json with the time they were sent,
+    {"command": "OPEN", "ts": 1546300800.0}
+    :return: (command, ts), ts is None for plain commands
+    """
+    payload = payload.strip()
+    if payload.startswith("{"):
+        message = json.loads(payload)
+        return str(message.get("command", "")).strip(), message.get("ts")
+    return payload, None
+
+
+class Backoff(object):
+    """
+    Exponential reconnect delays with jitter, so boards that lost the broker
+    together don't all come back at the same moment
+    """
+
+    def __init__(self, initial=0.5, maximum=30.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = initial
+
+    def next(self):
+        delay = self.delay
+        self.delay = min(self.maximum, self.delay * 2)
+        # half fixed, half random
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self):
+        self.delay = self.initial
+
+
 class ShuttersMqtt(object):
+    """
+    Takes commands from mqtt for the shutters of this board:
+    shutters/<id>/command for one shutter, shutters/group/<group>/command for
+    a group and shutters/command for all of them. Every board subscribes to
+    the groups of its own shutters, so one group command moves the shutters
+    on all boards at the same time.
 
+    listen() keeps the connection up: subscriptions are renewed in
+    on_connect and a lost broker is retried with a growing, jittered delay.
+    Commands older than command_max_age seconds are dropped, so nothing
+    queued on the broker while the board was away replays an old motion.
+    A timestamp from the future means the sender's clock is off: it is
+    logged and only accepted for live commands within the same window.
+    command_max_age = 0 turns the timestamp check off for senders without
+    a synchronized clock, retained commands are then always dropped.
+    """
 
-    def __init__(self, broker_address, broker_port=1883):
-        self.client = mqtt.Client(client_id="shutters", clean_session=False) #create new instance
+    def __init__(self, broker_address, broker_port=1883, config=None):
+        if config is None:
+            config = ShuttersConfig()
+        self.broker_address = broker_address
+        self.broker_port = broker_port
+        self.maxCommandAge = config.commandMaxAge
+        self.backoff = Backoff()
+        # one session per board
+        self.client = mqtt.Client(client_id="shutters-" + config.boardId, clean_session=False) #create new instance
         #logging.basicConfig(level=logging.DEBUG)
         logger = logging.getLogger(__name__)
         self.client.enable_logger(logger)
-        self.client.connect(broker_address,broker_port,60) #connect to broker
-        print("Connected to " + broker_address + ":"+ str(broker_port))
-        time.sleep(1)
-        self.client.subscribe("shutters/command")
-        print("Subscribed to shutters ")
+        self.motcontrol = ShuttersMotorControl(config=config)
+        self.client.on_connect=self.on_connect
+        self.client.on_disconnect=self.on_disconnect
         self.client.on_message=self.on_message
-        self.motcontrol = ShuttersMotorControl()
+        # motion runs outside of paho's network loop so it keeps processing
+        # messages (and STOP can interrupt a motion) while the motors move.
+        # Every shutter has its own worker, so they all move at the same time.
+        self.motcontrol.coordinator.start()
+        self.commands = dict()
+        for shutter in self.motcontrol.shutters:
+            self.commands[shutter.name] = queue.Queue()
+            worker = threading.Thread(target=self.motionWorker, args=(shutter,))
+            worker.daemon = True
+            worker.start()
+
+    def topics(self):
+        topics = ["shutters/command"]
+        topics += ["shutters/" + shutter.name + "/command" for shutter in self.motcontrol.shutters]
+        topics += ["shutters/group/" + group + "/command" for group in sorted(self.motcontrol.groups)]
+        return topics
+
+    def targets(self, topic):
+        """
+        :return: the shutters of this board a command topic is meant for
+        """
+        parts = topic.split("/")
+        if topic == "shutters/command":
+            return self.motcontrol.shutters
+        if len(parts) == 4 and parts[1] == "group" and parts[3] == "command":
+            return self.motcontrol.group(parts[2])
+        if len(parts) == 3 and parts[2] == "command":
+            shutter = self.motcontrol.shutter(parts[1])
+            return [shutter] if shutter is not None else []
+        return []
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print("Broker refused the connection rc=" + str(rc))
+            return
+        print("Connected to " + self.broker_address + ":" + str(self.broker_port))
+        self.backoff.reset()
+        # a new session after a broker restart doesn't know our subscriptions
+        client.subscribe([(topic, 1) for topic in self.topics()])
+        print("Subscribed to " + ", ".join(self.topics()))
+
+    def on_disconnect(self, client, userdata, rc):
+        print("Disconnected from broker rc=" + str(rc))
+
+    def stale(self, ts, retained):
+        if ts is None:
+            # a retained plain command would run again on every subscribe
+            return retained
+        if self.maxCommandAge <= 0:
+            return retained
+        try:
+            age = time.time() - float(ts)
+        except (TypeError, ValueError):
+            return True
+        if age < -CLOCK_SKEW_TOLERANCE:
+            print("Command timestamp " + str(ts) + " is " + str(round(-age, 1)) + "s in the future, sender clock skew")
+            # a retained one would replay on every subscribe until the sender's clock catches up
+            return retained or -age > self.maxCommandAge
+        return age > self.maxCommandAge
 
     def on_message(self,client, userdata, message):
         print("message received " ,str(message.payload.decode("utf-8")))
         print("message topic=",message.topic)
         print("message qos=",message.qos)
         print("message retain flag=",message.retain)
-        cmd = str(message.payload.decode("utf-8"))
-        if cmd == "OPEN":
-            self.motcontrol.open()
-            #call(['python','/root/shutters-pyh3.py'])
-            #call(['python','/root/shutters-mot1-pyh3-copy-goup.py'])
+        try:
+            cmd, ts = parseCommand(message.payload.decode("utf-8"))
+        except ValueError as e:
+            print("Unreadable command " + str(e))
+            return
+        if self.stale(ts, message.retain):
+            print("Dropping stale command " + cmd + " sent at " + str(ts))
+            return
+        if cmd not in ["OPEN", "CLOSE", "SEMIOPEN", "STOP", "UP", "DOWN"] and parsePosition(cmd) is None:
+            print("Unsupported command " + cmd)
+            return
+        shutters = self.targets(message.topic)
+        if not shutters:
+            print("No shutters on this board for " + message.topic)
+            return
+        if cmd == "STOP":
+            # don't wait for the workers, ramp down right away
+            self.motcontrol.stop(shutters)
+        for shutter in shutters:
+            self.commands[shutter.name].put(cmd)
+
+    def publishState(self, shutter, state, cmd):
+        self.client.publish("shutters/" + shutter.name + "/state",
+                            json.dumps({"state": state, "command": cmd, "ts": time.time(),
+                                        "position": shutter.getPosition()}), qos=1, retain=True)
+        # board wide state, as before there were several shutters
+        self.client.publish("shutters/state", json.dumps({"shutter": shutter.name, "state": state, "command": cmd,
+                                                          "ts": time.time(), "positions": self.motcontrol.positions()}),
+                            qos=1, retain=True)
+
+    def motionWorker(self, shutter):
+        commands = self.commands[shutter.name]
+        while True:
+            cmd = commands.get()
+            # a burst of commands only needs its last one
+            while not commands.empty():
+                print("Skipping " + cmd + " for " + shutter.name + ", a newer command is queued")
+                cmd = commands.get()
+            try:
+                self.execute(shutter, cmd)
+            except Exception as e:
+                print("Error while executing shutters command " + cmd + " for " + shutter.name + " " + str(e))
+                self.motcontrol.stop([shutter])
+                self.publishState(shutter, "error", cmd)
+
+    def waitForRuns(self, shutter, runs):
+        """
+        :return: False if a newer command for the shutter arrived before the runs finished
+        """
+        commands = self.commands[shutter.name]
+        for run in runs:
+            while not run.done.wait(0.1):
+                if not commands.empty():
+                    return False
+        return commands.empty()
+
+    def publishFaults(self, runs):
+        for run in runs:
+            fault = getattr(run, "fault", None)
+            if fault is not None:
+                self.client.publish("shutters/fault", json.dumps(fault), qos=1)
+
+    def motionState(self, runs, finished):
+        results = [run.result for run in runs]
+        if "limit" in results:
+            # ran past the learned envelope without reaching the sensor
+            self.publishFaults(runs)
+            return "fault"
+        if "cancelled" in results:
+            return "stopped"
+        return finished
+
+    def execute(self, shutter, cmd):
+        coordinator = self.motcontrol.coordinator
+        shutters = [shutter]
+        if cmd == "STOP":
+            self.publishState(shutter, "stopped", cmd)
+        elif cmd == "OPEN":
+            self.publishState(shutter, "opening", cmd)
+            runs = coordinator.submit(self.motcontrol.openRuns(shutters))
+            if self.waitForRuns(shutter, runs):
+                self.publishState(shutter, self.motionState(runs, "open"), cmd)
         elif cmd == "CLOSE":
-            self.motcontrol.close()
-            #call(['python','/root/shutters-pyh3-copy-godown.py'])
-            #call(['python','/root/shutters-mot1-pyh3-copy-godown.py'])
+            self.publishState(shutter, "closing", cmd)
+            runs = coordinator.submit(self.motcontrol.closeRuns(shutters))
+            if self.waitForRuns(shutter, runs):
+                self.publishState(shutter, self.motionState(runs, "closed"), cmd)
+        elif cmd == "SEMIOPEN" and self.motcontrol.positionKnown(shutters):
+            self.publishState(shutter, "semiopening", cmd)
+            self.motcontrol.stopAndWait(shutters)
+            runs = coordinator.submit(self.motcontrol.semiopenRuns(shutters))
+            if self.waitForRuns(shutter, runs):
+                self.publishState(shutter, self.motionState(runs, "semiopen"), cmd)
         elif cmd == "SEMIOPEN":
-            self.motcontrol.halfopen()
-            #call(['python','/root/shutters-pyh3-copy-halfopen.py'])
-            #call(['python','/root/shutters-mot1-halfopen.py'])
-  
+            self.publishState(shutter, "semiopening", cmd)
+            runs = coordinator.submit(self.motcontrol.closeRuns(shutters))
+            if not self.waitForRuns(shutter, runs):
+                return
+            runs = coordinator.submit(self.motcontrol.halfopenStepRuns(shutters))
+            if self.waitForRuns(shutter, runs):
+                self.publishState(shutter, self.motionState(runs, "semiopen"), cmd)
+        elif cmd in ["UP", "DOWN"]:
+            self.publishState(shutter, "moving", cmd)
+            self.motcontrol.stopAndWait(shutters)
+            runs = coordinator.submit(self.motcontrol.nudgeRuns(Shutter.OPEN if cmd == "UP" else Shutter.CLOSE, shutters))
+            if self.waitForRuns(shutter, runs):
+                self.publishState(shutter, self.motionState(runs, "position"), cmd)
+        else:
+            target = parsePosition(cmd)
+            self.publishState(shutter, "moving", cmd)
+            # only move the difference, a shutter that doesn't know where it is gets closed first
+            self.motcontrol.stopAndWait(shutters)
+            if target > 0:
+                runs = coordinator.submit(self.motcontrol.homeRuns(shutters))
+                if not self.waitForRuns(shutter, runs):
+                    return
+            runs = coordinator.submit(self.motcontrol.positionRuns(target, shutters))
+            if self.waitForRuns(shutter, runs):
+                self.publishState(shutter, self.motionState(runs, "position"), cmd)
+
     def listen(self):
-        #self.client.loop_start()
-        self.client.loop_forever()
-        print("Started mqtt loop")
         while True:
-            time.sleep(4)
+            try:
+                self.client.connect(self.broker_address, self.broker_port, 60) #connect to broker
+            except Exception as e:
+                delay = self.backoff.next()
+                print("Failed to connect to broker " + str(e) + ", retrying in %.1fs" % delay)
+                time.sleep(delay)
+                continue
+            rc = mqtt.MQTT_ERR_SUCCESS
+            while rc == mqtt.MQTT_ERR_SUCCESS:
+                rc = self.client.loop(1.0)
+            delay = self.backoff.next()
+            print("Lost the broker rc=" + str(rc) + ", reconnecting in %.1fs" % delay)
+            time.sleep(delay)
 
 if __name__ == "__main__":
-    bNotConnected=True
-    while bNotConnected:
-        try:
-            shutterListener=ShuttersMqtt("192.168.1.2")
-            bNotConnected=False
-        except Exception as e:
-            print("Failed to connecto to broker "  + str(e) )
-            print("Will try to reconnect")
-            time.sleep(15)
+    config = ShuttersConfig()
+    shutterListener=ShuttersMqtt(config.mqttBroker, config.mqttPort, config)
     shutterListener.listen()
-
-
@@ -1,3 +1,6 @@
+import re
+import json
+import time
 import paho.mqtt.client as mqtt
 
 class ShuttersController(object):
@@ -8,10 +11,20 @@ class ShuttersController(object):
         self.client.connect(broker_address,port=broker_port) #connect to broker
 
 
-    def ShuttersCommand(self, cmd):
-        if cmd not in  [ "OPEN","CLOSE","SEMIOPEN","UP","DOWN" ]:
-            print("ERROR: ShuttersController.ShuttersCommand wrong command supplied "+cmd+", please specify either OPEN,CLOSE,SEMIOPEN,UP,DOWN")
-            return { shutters: "wrong command supplied "+cmd+", please specify either OPEN,CLOSE,SEMIOPEN,UP,DOWN" }
-        self.client.publish("shutters/command",cmd)#publish
+    def ShuttersCommand(self, cmd, shutter=None, group=None):
+        """
+        :param shutter: id of one shutter from shutters.ini, all shutters when neither shutter nor group is given
+        :param group: a group of shutters from shutters.ini
+        """
+        position = re.match(r"^POSITION\s+(\d{1,3})\s*%?$", cmd)
+        if cmd not in  [ "OPEN","CLOSE","SEMIOPEN","STOP","UP","DOWN" ] and (position is None or int(position.group(1)) > 100):
+            print("ERROR: ShuttersController.ShuttersCommand wrong command supplied "+cmd+", please specify either OPEN,CLOSE,SEMIOPEN,STOP,UP,DOWN,POSITION <0-100>%")
+            return { "shutters": "wrong command supplied "+cmd+", please specify either OPEN,CLOSE,SEMIOPEN,STOP,UP,DOWN,POSITION <0-100>%" }
+        topic = "shutters/command"
+        if shutter:
+            topic = "shutters/" + shutter + "/command"
+        elif group:
+            topic = "shutters/group/" + group + "/command"
+        # with the time it was sent, the shutters drop commands that arrive too late
+        self.client.publish(topic,json.dumps({"command": cmd, "ts": time.time()}),qos=1)#publish
         return {"shutters" : "command accepted" }
-
@@ -0,0 +1,99 @@
+from __future__ import print_function
+import argparse
+import os
+import random
+import time
+from MotorBackend import SimulatedBackend
+from ShuttersMotorControl import ShuttersMotorControl
+from ShuttersConfig import ShuttersConfig
+from Shutter import Shutter
+
+## Runs the shutters motion code against simulated motors and end stops on a
+## virtual clock, so timing, preemption and calibration can be checked and
+## benchmarked without the Orange Pi:
+##   python simulate.py --speedup 50 --cycles 5 --moves 20
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated shutters benchmark")
+    parser.add_argument("--speedup", type=float, default=50.0, help="virtual seconds per wall clock second")
+    parser.add_argument("--travel", type=float, default=20.0, help="seconds for a full run at full speed")
+    parser.add_argument("--travel-noise", type=float, default=0.02, help="run to run speed variation")
+    parser.add_argument("--sensor-noise", type=float, default=0.2, help="end stop trigger point variation, percent")
+    parser.add_argument("--cycles", type=int, default=4, help="full close/open cycles to calibrate")
+    parser.add_argument("--moves", type=int, default=10, help="random POSITION moves")
+    parser.add_argument("--calibration", default=None, help="calibration file, in memory when not given")
+    parser.add_argument("--config", default=None, help="shutters.ini, the default two shutters when not given")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = ShuttersConfig(args.config or os.path.join(os.path.dirname(os.path.abspath(__file__)), "default_shutters.ini"))
+    backend = SimulatedBackend(args.speedup, seed=args.seed)
+    simulated = dict()
+    for index, shutterConfig in enumerate(config.boardShutters()):
+        # every shutter a bit slower than the one before
+        simulated[shutterConfig.id] = backend.addShutter(shutterConfig.motor, shutterConfig.openSensor,
+                                                         shutterConfig.closedSensor, args.travel * (1 + 0.15 * index),
+                                                         -1 if shutterConfig.openReverse else 1, random.uniform(10, 90),
+                                                         args.travel_noise, args.sensor_noise)
+    control = ShuttersMotorControl(calibrationPath=args.calibration or "", backend=backend, config=config)
+    control.coordinator.start()
+
+    wallStart = time.time()
+    virtualStart = backend.time()
+
+    for cycle in range(args.cycles):
+        control.coordinator.run(control.closeRuns())
+        control.coordinator.run(control.openRuns())
+
+    errors = []
+    for move in range(args.moves):
+        target = random.randint(0, 100)
+        control.coordinator.run(control.homeRuns())
+        control.coordinator.run(control.positionRuns(target))
+        for shutter in control.shutters:
+            errors.append(abs(shutter.getPosition() - simulated[shutter.name].getPosition()))
+
+    # preempt an opening half way with a close
+    control.coordinator.run(control.closeRuns())
+    opening = control.coordinator.submit(control.openRuns())
+    backend.sleep(args.travel / 2)
+    preemptStart = backend.time()
+    control.coordinator.run(control.closeRuns())
+    preemptTime = backend.time() - preemptStart
+
+    # jam a shutter and see how long it takes to notice
+    jammedShutter = simulated[control.shutters[-1].name]
+    jammedShutter.jam(0.0)
+    jamStart = backend.time()
+    jammed = control.coordinator.run(control.openRuns())
+    jamTime = backend.time() - jamStart
+    jammedShutter.jam(1.0)
+
+    wallTime = time.time() - wallStart
+    virtualTime = backend.time() - virtualStart
+    latencies = [latency * 1000 for latency in control.coordinator.stopLatencies if latency is not None]
+
+    print("")
+    print("virtual time      %.1fs in %.1fs wall clock, %.1fx real time" % (virtualTime, wallTime, virtualTime / wallTime))
+    print("sensor to stop    p50 %.2fms p99 %.2fms virtual, %d stops" % (percentile(latencies, 50), percentile(latencies, 99), len(latencies)))
+    if errors:
+        print("position error    mean %.1f%% max %.1f%% over %d moves" % (sum(errors) / len(errors), max(errors), len(errors)))
+    for shutter in control.shutters:
+        for direction in [Shutter.OPEN, Shutter.CLOSE]:
+            envelope = control.calibration.envelope(shutter.name, direction)
+            print("%s %-5s       median %s envelope %s" % (shutter.name, direction,
+                                                        control.calibration.median(shutter.name, direction), envelope))
+    print("preempted open    results %s, close done %.1fs after the preempt" % ([run.result for run in opening], preemptTime))
+    print("jammed open       results %s, noticed after %.1fs" % ([run.result for run in jammed], jamTime))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import logging
+import logging.handlers
+import atexit
+import queue
+
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler formats the record in the calling thread before queueing it.
+    We leave the formatting to the listener thread so the websocket loop only
+    pays for a queue put. Arguments passed to the logger must not be mutated
+    after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _install():
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    sonoff_logger = logging.getLogger("sonoff")
+    sonoff_logger.addHandler(_DeferredQueueHandler(log_queue))
+    sonoff_logger.setLevel(logging.INFO)
+    # don't let the api server's basicConfig print everything a second time
+    sonoff_logger.propagate = False
+
+
+def getLogger(name):
+    _install()
+    if not name.startswith("sonoff"):
+        name = "sonoff." + name
+    return logging.getLogger(name)
+
+
+def setLevel(level_name):
+    _install()
+    level = getattr(logging, str(level_name).upper(), logging.INFO)
+    logging.getLogger("sonoff").setLevel(level)
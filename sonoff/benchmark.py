@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""
+Throughput benchmark for the Sonoff websocket forwarder.
+
+Starts a stand-in cloud, the real sonoff.websockforwarder pointed at it and N
+stand-in relays, then reports messages/sec, latency percentiles for the
+relay->cloud and cloud->relay hops, memory and thread counts.
+
+    python3 -m sonoff.benchmark --relays 20 --rate 5 --duration 30
+    python3 -m sonoff.benchmark --recording /tmp/sonoff-traffic.log
+
+The forwarder keeps a single upstream connection and sends cloud frames to the
+relay that spoke last, so with several relays replies can arrive on another
+relay's socket. Replies are matched by sequence, not by socket, for that reason.
+"""
+import argparse
+import json
+import resource
+import sys
+import threading
+import time
+import sonoff.wsclientglb
+import sonoff.websockforwarder
+from sonoff.standins import StandInCloud, StandInRelay
+from sonoff.trafficrecorder import loadRecording, FROM_RELAY
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ForwarderBenchmark(object):
+
+    def __init__(self, relays=10, rate=5.0, duration=10.0, recording=None, forwarder_port=15001, cloud_port=15443):
+        self.relay_count = relays
+        self.rate = rate
+        self.duration = duration
+        self.forwarder_port = forwarder_port
+        self.cloud_port = cloud_port
+        self.lock = threading.Lock()
+        self.sent_at = dict()
+        self.cloud_at = dict()
+        self.relay_to_cloud = []
+        self.cloud_to_relay = []
+        self.round_trip = []
+        self.peak_threads = 0
+        # deviceid -> error of the send that ended the relay's loop
+        self.send_errors = dict()
+        self.recording = None
+        self.templates = [{"action": "update", "userAgent": "device", "params": {"switch": "on", "power": "1520.30"}}]
+        if recording is not None:
+            self.recording = loadRecording(recording)
+            relay_frames = [json.loads(message) for ts, direction, message in self.recording if direction == FROM_RELAY]
+            if relay_frames:
+                self.templates = relay_frames
+
+    def onCloudFrame(self, msg, received):
+        seq = msg.get("sequence")
+        with self.lock:
+            sent = self.sent_at.get(seq)
+            if sent is not None:
+                self.cloud_at[seq] = received
+                self.relay_to_cloud.append(received - sent)
+
+    def onRelayReply(self, message, received):
+        try:
+            seq = json.loads(message).get("sequence")
+        except Exception:
+            return
+        with self.lock:
+            sent = self.sent_at.pop(seq, None)
+            at_cloud = self.cloud_at.pop(seq, None)
+            if sent is None or at_cloud is None:
+                return
+            self.cloud_to_relay.append(received - at_cloud)
+            self.round_trip.append(received - sent)
+
+    def startServers(self):
+        cloud = StandInCloud(port=self.cloud_port, recording=self.recording, on_frame=self.onCloudFrame)
+        cloud.start()
+        sonoff.wsclientglb.init()
+        forwarder = threading.Thread(target=sonoff.websockforwarder.main,
+                                     kwargs={"listen_address": "127.0.0.1", "ws_port": self.forwarder_port,
+                                             "cloud_host": "127.0.0.1", "cloud_port": self.cloud_port,
+                                             "cloud_scheme": "ws"})
+        forwarder.daemon = True
+        forwarder.start()
+        deadline = time.time() + 10
+        while cloud.connections == 0:
+            if time.time() > deadline:
+                raise RuntimeError("forwarder did not connect to the stand-in cloud")
+            time.sleep(0.05)
+
+    def relayLoop(self, relay, index):
+        interval = 1.0 / self.rate
+        start = time.time()
+        n = 0
+        while True:
+            # deadline based so a slow send doesn't lower the offered rate
+            next_send = start + n * interval
+            if next_send - start >= self.duration:
+                break
+            delay = next_send - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            msg = dict(self.templates[n % len(self.templates)])
+            seq = "%s-%d" % (relay.deviceid, n)
+            msg["sequence"] = seq
+            with self.lock:
+                self.sent_at[seq] = time.time()
+            try:
+                relay.send(msg)
+            except Exception as e:
+                # usually the forwarder closed the socket, this relay can't send any more
+                print("relay %s: send failed after %d messages: %r" % (relay.deviceid, n, e))
+                with self.lock:
+                    self.sent_at.pop(seq, None)
+                    self.send_errors[relay.deviceid] = repr(e)
+                break
+            n += 1
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def run(self):
+        self.startServers()
+        url = "ws://127.0.0.1:%d/api/ws" % self.forwarder_port
+        relays = []
+        for i in range(self.relay_count):
+            relay = StandInRelay(url, "bench%05d" % i, on_reply=self.onRelayReply)
+            relay.connect()
+            relays.append(relay)
+        senders = [threading.Thread(target=self.relayLoop, args=(relay, i)) for i, relay in enumerate(relays)]
+        started = time.time()
+        for t in senders:
+            t.start()
+        for t in senders:
+            t.join()
+        # let the last replies drain
+        time.sleep(1.0)
+        elapsed = time.time() - started
+        for relay in relays:
+            relay.close()
+        return self.report(relays, elapsed)
+
+    def report(self, relays, elapsed):
+        sent = sum(relay.sent for relay in relays)
+        result = {
+            "relays": self.relay_count,
+            "sent": sent,
+            "completed": len(self.round_trip),
+            "sent_per_sec": sent / elapsed,
+            "completed_per_sec": len(self.round_trip) / elapsed,
+            "failed_relays": len(self.send_errors),
+            "send_errors": self.send_errors,
+            "peak_threads": self.peak_threads,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        for name, values in (("relay_to_cloud_ms", self.relay_to_cloud), ("cloud_to_relay_ms", self.cloud_to_relay),
+                             ("round_trip_ms", self.round_trip)):
+            result[name] = dict(("p%d" % pct, percentile(values, pct) * 1000.0) for pct in (50, 90, 99))
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Sonoff websocket forwarder against stand-in relays and cloud")
+    parser.add_argument("--relays", type=int, default=10, help="number of simulated relays")
+    parser.add_argument("--rate", type=float, default=5.0, help="messages per second per relay")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to send for")
+    parser.add_argument("--recording", default=None, help="traffic log from sonoff_record_path to replay")
+    parser.add_argument("--forwarder-port", type=int, default=15001)
+    parser.add_argument("--cloud-port", type=int, default=15443)
+    args = parser.parse_args()
+    bench = ForwarderBenchmark(args.relays, args.rate, args.duration, args.recording, args.forwarder_port, args.cloud_port)
+    result = bench.run()
+    print(json.dumps(result, indent=2))
+    if result["completed"] == 0:
+        print("ERROR: no message completed the round trip, the numbers above are not a measurement")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config.config import Config
+import sonoff.asynclog
+
+logger = sonoff.asynclog.getLogger(__name__)
+
+
+class DispatchForwarder(object):
+    """
+    Forwards the relay's /dispatch/device request to the coolkit cloud in the
+    background. The relay gets its (static) local reply straight away, the cloud
+    call goes over one keep-alive HTTPS session and its answer is cached so
+    repeated dispatch calls inside the cache window don't reach the cloud at all.
+    """
+
+    def __init__(self, cache_ttl=None, cache_size=32):
+        main_config = Config()
+        self.url = "https://" + main_config.configOpt["sonoff_server"] + ":" + main_config.configOpt["sonoff_port"] + "/dispatch/device"
+        if cache_ttl is None:
+            cache_ttl = float(main_config.configOpt.get("sonoff_dispatch_cache_ttl", 300))
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.lock = threading.Lock()
+        # (deviceid, apikey) -> (time of the answer, response text)
+        self.cache = dict()
+        self.in_flight = set()
+
+    @staticmethod
+    def cacheKey(requestdata):
+        """
+        The body carries a timestamp and nonce that change on every call, so the
+        answer is cached per device instead of per body.
+        """
+        try:
+            data = json.loads(requestdata)
+            if data.get("deviceid") is not None:
+                return (data.get("deviceid"), data.get("apikey"))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        return requestdata
+
+    def _evict(self, now):
+        # caller holds self.lock
+        for key in [k for k, v in self.cache.items() if now - v[0] >= self.cache_ttl]:
+            del self.cache[key]
+        while len(self.cache) >= self.cache_size:
+            del self.cache[min(self.cache, key=lambda k: self.cache[k][0])]
+
+    def getCached(self, requestdata):
+        key = self.cacheKey(requestdata)
+        now = time.time()
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and now - cached[0] >= self.cache_ttl:
+                del self.cache[key]
+                cached = None
+        if cached is not None:
+            return cached[1]
+        return None
+
+    def forwardAsync(self, requestdata):
+        """
+        Schedule the cloud call unless an answer for the same body is cached or
+        already on its way. Returns immediately.
+        """
+        if self.getCached(requestdata) is not None:
+            logger.debug("dispatch: answer for this request is cached, not contacting %s", self.url)
+            return False
+        key = self.cacheKey(requestdata)
+        with self.lock:
+            if key in self.in_flight:
+                return False
+            self.in_flight.add(key)
+        t = threading.Thread(target=self._forward, args=(requestdata, key))
+        t.daemon = True
+        t.start()
+        return True
+
+    def _forward(self, requestdata, key):
+        try:
+            res = self.session.post(url=self.url, data=requestdata, timeout=30)
+            logger.info("dispatch: sent to %s data %s got back: %s", self.url, requestdata, res.text)
+            if res.ok:
+                now = time.time()
+                with self.lock:
+                    self._evict(now)
+                    self.cache[key] = (now, res.text)
+        except Exception as e:
+            logger.info("dispatch: failed to dispatch to central server, but that's ok %s", e)
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
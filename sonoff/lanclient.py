@@ -0,0 +1,163 @@
+import threading
+import time
+import socket
+import requests
+from requests.adapters import HTTPAdapter
+import sonoff.asynclog
+
+logger = sonoff.asynclog.getLogger(__name__)
+
+# Optional: mDNS discovery of relays, without it the relay address has to be in config
+try:
+    from zeroconf import Zeroconf, ServiceBrowser
+    ZEROCONF_AVAILABLE = True
+except ImportError:
+    ZEROCONF_AVAILABLE = False
+
+EWELINK_SERVICE = "_ewelink._tcp.local."
+
+
+class SonoffLanClient(object):
+    """
+    Switches a relay directly over its LAN API (Sonoff DIY mode,
+    POST http://<relay>:8081/zeroconf/switch) instead of going through the
+    websocket session and the cloud. Relays on stock firmware only expose the
+    encrypted LAN protocol and are not supported, switch() returns False for
+    them and the caller falls back to the websocket path.
+
+    The relay address comes from sonoff_lan_ip in config or from mDNS. Found
+    addresses are cached, and every relay gets its own keep-alive HTTP session.
+    """
+
+    def __init__(self, deviceid="", address=None, port=8081, timeout=2.0, discovery_ttl=600.0):
+        self.deviceid = deviceid
+        self.timeout = timeout
+        self.discovery_ttl = discovery_ttl
+        self.lock = threading.Lock()
+        # deviceid -> (time found, host, port, service name); time 0 marks an address that stopped answering
+        self.discovered = dict()
+        self.sessions = dict()
+        self.static = (address, int(port)) if address else None
+        self.zeroconf = None
+        if self.static is None and ZEROCONF_AVAILABLE:
+            try:
+                self.zeroconf = Zeroconf()
+                ServiceBrowser(self.zeroconf, EWELINK_SERVICE, self)
+                logger.info("LAN: browsing for relays on %s", EWELINK_SERVICE)
+            except Exception as e:
+                logger.error("LAN: mDNS discovery unavailable %s", e)
+                self.zeroconf = None
+
+    ## zeroconf ServiceBrowser listener interface
+    def add_service(self, zc, service_type, name):
+        self._resolve(zc, service_type, name)
+
+    def update_service(self, zc, service_type, name):
+        self._resolve(zc, service_type, name)
+
+    def remove_service(self, zc, service_type, name):
+        with self.lock:
+            self.discovered.pop(self._deviceidFromName(name), None)
+
+    def _deviceidFromName(self, name):
+        # service names look like eWeLink_10000bae1f._ewelink._tcp.local.
+        instance = name.split(".")[0]
+        return instance.split("_", 1)[-1]
+
+    def _resolve(self, zc, service_type, name, timeout=3000):
+        """
+        :return: True when the relay answered with its address
+        """
+        try:
+            info = zc.get_service_info(service_type, name, timeout)
+            if info is None or not info.addresses:
+                return False
+            host = socket.inet_ntoa(info.addresses[0])
+            deviceid = self._deviceidFromName(name)
+            with self.lock:
+                self.discovered[deviceid] = (time.time(), host, info.port, name)
+            logger.info("LAN: found relay %s at %s:%s", deviceid, host, info.port)
+            return True
+        except Exception as e:
+            logger.error("LAN: failed to resolve %s %s", name, e)
+            return False
+
+    def lookup(self, deviceid=None):
+        """
+        :return: (host, port) of the relay or None when it is not reachable over LAN
+        """
+        if self.static is not None:
+            return self.static
+        if deviceid is None:
+            deviceid = self.deviceid
+        now = time.time()
+        with self.lock:
+            found = self.discovered.get(deviceid)
+            if found is None and not deviceid and len(self.discovered) == 1:
+                found = list(self.discovered.values())[0]
+        if found is not None and now - found[0] <= self.discovery_ttl:
+            return found[1], found[2]
+
+        # zeroconf only calls add/update_service when the record changes, ask the relay again
+        if self.zeroconf is None:
+            return None
+        if found is not None:
+            name = found[3]
+        elif deviceid:
+            name = "eWeLink_%s.%s" % (deviceid, EWELINK_SERVICE)
+        else:
+            return None
+        if not self._resolve(self.zeroconf, EWELINK_SERVICE, name, int(self.timeout * 1000)):
+            return None
+        with self.lock:
+            found = self.discovered.get(self._deviceidFromName(name))
+        return (found[1], found[2]) if found is not None else None
+
+    def available(self, deviceid=None):
+        return self.lookup(deviceid) is not None
+
+    def _session(self, address):
+        with self.lock:
+            session = self.sessions.get(address)
+            if session is None:
+                session = requests.Session()
+                session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+                self.sessions[address] = session
+        return session
+
+    def switch(self, state, deviceid=None):
+        """
+        :param state: on or off
+        :return: True when the relay confirmed the switch
+        """
+        if deviceid is None:
+            deviceid = self.deviceid
+        address = self.lookup(deviceid)
+        if address is None:
+            return False
+        url = "http://%s:%d/zeroconf/switch" % address
+        try:
+            res = self._session(address).post(url, json={"deviceid": deviceid or "", "data": {"switch": state}},
+                                              timeout=self.timeout)
+            result = res.json()
+            if res.ok and result.get("error", 1) == 0:
+                logger.info("LAN: switched %s %s", url, state)
+                return True
+            logger.error("LAN: relay refused the switch %s", result)
+        except Exception as e:
+            logger.error("LAN: failed to switch relay at %s %s", url, e)
+            # drop the connection and mark the address stale, the next lookup resolves the relay again
+            with self.lock:
+                session = self.sessions.pop(address, None)
+                for key, found in self.discovered.items():
+                    if (found[1], found[2]) == address:
+                        self.discovered[key] = (0,) + found[1:]
+            if session is not None:
+                session.close()
+        return False
+
+    def close(self):
+        if self.zeroconf is not None:
+            self.zeroconf.close()
+        for session in self.sessions.values():
+            session.close()
@@ -0,0 +1,45 @@
+import json
+
+
+class RelayMessage(object):
+    """
+    A single websocket frame from the relay, parsed once and shared by the
+    websocket server and the forwarder. The original text is kept so it can be
+    forwarded as-is when nothing was changed.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.data = json.loads(raw)
+        if not isinstance(self.data, dict):
+            raise ValueError("relay message is not a json object")
+        self.modified = False
+
+    @property
+    def action(self):
+        return self.data.get("action")
+
+    @property
+    def deviceid(self):
+        return self.data.get("deviceid")
+
+    @property
+    def apikey(self):
+        return self.data.get("apikey")
+
+    @property
+    def params(self):
+        params = self.data.get("params")
+        if isinstance(params, dict):
+            return params
+        return {}
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def encode(self):
+        # Only re-serialize if somebody changed the message on the way
+        if self.modified:
+            return json.dumps(self.data)
+        return self.raw
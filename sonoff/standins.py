@@ -0,0 +1,214 @@
+import json
+import threading
+import time
+import websocket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gevent import pywsgi
+from geventwebsocket.handler import WebSocketHandler
+from sonoff.trafficrecorder import FROM_RELAY, FROM_CLOUD
+
+
+class StandInCloud(object):
+    """
+    Local replacement for the coolkit websocket server. Every frame a relay sends
+    through the forwarder is answered with the cloud frames that followed the
+    same action in a recording, or with a plain ack when there is no recording.
+    deviceid, apikey and sequence in the answer are taken from the request so
+    the relay side can match replies.
+    """
+
+    def __init__(self, listen_address="127.0.0.1", port=15443, recording=None, on_frame=None):
+        self.listen_address = listen_address
+        self.port = port
+        self.on_frame = on_frame
+        self.replies = dict()
+        self.connections = 0
+        self.frames_received = 0
+        if recording is not None:
+            self._buildReplies(recording)
+
+    def _buildReplies(self, recording):
+        # only the answers to the first frame of each action are kept
+        seen_actions = set()
+        last_action = None
+        for ts, direction, message in recording:
+            if direction == FROM_RELAY:
+                try:
+                    last_action = json.loads(message).get("action")
+                except Exception:
+                    last_action = None
+                if last_action in seen_actions:
+                    last_action = None
+                else:
+                    seen_actions.add(last_action)
+            elif direction == FROM_CLOUD and last_action is not None:
+                self.replies.setdefault(last_action, []).append(message)
+
+    def _reply(self, ws, msg):
+        templates = self.replies.get(msg.get("action"))
+        if not templates:
+            templates = ['{"error":0}']
+        for template in templates:
+            reply = json.loads(template)
+            for key in ("deviceid", "apikey", "sequence"):
+                if key in msg:
+                    reply[key] = msg[key]
+            ws.send(json.dumps(reply))
+
+    def _wsgiApp(self, environ, start_response):
+        ws = environ.get("wsgi.websocket")
+        if ws is None:
+            start_response("404 Not Found", [])
+            return [b""]
+        self.connections += 1
+        while not ws.closed:
+            message = ws.receive()
+            if message is None:
+                break
+            received = time.time()
+            self.frames_received += 1
+            try:
+                msg = json.loads(message)
+            except Exception:
+                continue
+            if self.on_frame is not None:
+                self.on_frame(msg, received)
+            self._reply(ws, msg)
+        self.connections -= 1
+        return [b""]
+
+    def serve(self):
+        server = pywsgi.WSGIServer((self.listen_address, self.port), self._wsgiApp, handler_class=WebSocketHandler, log=None)
+        server.serve_forever()
+
+    def start(self):
+        t = threading.Thread(target=self.serve)
+        t.daemon = True
+        t.start()
+        return t
+
+
+class StandInRelay(object):
+    """
+    Local replacement for a Sonoff relay: opens a websocket to the forwarder,
+    sends frames and hands every frame coming back to on_reply(message, time).
+    """
+
+    def __init__(self, url, deviceid, apikey="00000000-0000-0000-0000-000000000000", on_reply=None):
+        self.url = url
+        self.deviceid = deviceid
+        self.apikey = apikey
+        self.on_reply = on_reply
+        self.ws = None
+        self.running = False
+        self.sent = 0
+
+    def connect(self):
+        self.ws = websocket.create_connection(self.url)
+        self.running = True
+        t = threading.Thread(target=self._readLoop)
+        t.daemon = True
+        t.start()
+
+    def _readLoop(self):
+        while self.running:
+            try:
+                message = self.ws.recv()
+            except Exception:
+                break
+            if self.on_reply is not None and message:
+                self.on_reply(message, time.time())
+
+    def send(self, msg):
+        msg["deviceid"] = self.deviceid
+        msg["apikey"] = self.apikey
+        self.ws.send(json.dumps(msg))
+        self.sent += 1
+
+    def replay(self, recording, speed=1.0):
+        """
+        Send the relay frames of a recording keeping their original spacing,
+        divided by speed
+        """
+        relay_frames = [(ts, message) for ts, direction, message in recording if direction == FROM_RELAY]
+        if not relay_frames:
+            return
+        first_ts = relay_frames[0][0]
+        start = time.time()
+        for ts, message in relay_frames:
+            delay = start + (ts - first_ts) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.send(json.loads(message))
+
+    def close(self):
+        self.running = False
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+class StandInLanRelay(object):
+    """
+    Local replacement for a relay in DIY mode answering the LAN API
+    (POST /zeroconf/switch). Keeps the switch state, the number of requests and
+    the number of TCP connections so keep-alive can be checked.
+    """
+
+    def __init__(self, listen_address="127.0.0.1", port=18081, deviceid=""):
+        self.listen_address = listen_address
+        self.port = port
+        self.deviceid = deviceid
+        self.switch_state = "off"
+        self.requests = 0
+        self.connections = 0
+        self.server = None
+
+    def _handlerClass(self):
+        relay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                relay.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                relay.requests += 1
+                reply = {"seq": relay.requests, "error": 0}
+                try:
+                    msg = json.loads(body)
+                    if self.path != "/zeroconf/switch" or msg["data"]["switch"] not in ("on", "off"):
+                        reply["error"] = 400
+                    else:
+                        relay.switch_state = msg["data"]["switch"]
+                except Exception:
+                    reply["error"] = 400
+                data = json.dumps(reply).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.listen_address, self.port), self._handlerClass())
+        self.server.daemon_threads = True
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        return t
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import deque, OrderedDict
+import numpy as np
+
+
+class PowerTelemetry(object):
+    """
+    Keeps the power readings the relay reports in its update messages.
+
+    Raw samples go into a fixed size ring buffer. Energy is integrated as the
+    samples arrive (the relay reports sample-and-hold values, so each reading is
+    held until the next one) and every finished minute is compacted into a
+    per-minute aggregate that also feeds running hourly and daily totals, so
+    consumption queries never go back to the raw samples.
+    """
+
+    def __init__(self, capacity=8192, minute_history=7 * 24 * 60, on_threshold=5.0, max_gap=300.0,
+                 hour_history=31 * 24, day_history=366):
+        """
+        :param capacity: number of raw samples kept in the ring buffer
+        :param minute_history: number of per-minute aggregates kept
+        :param on_threshold: power in W above which the boiler counts as heating
+        :param max_gap: longest time in s a reading is held, longer silences are not integrated
+        """
+        self.capacity = capacity
+        self.on_threshold = on_threshold
+        self.max_gap = max_gap
+        self.hour_history = hour_history
+        self.day_history = day_history
+        self.lock = threading.Lock()
+
+        self.sample_ts = np.zeros(capacity, dtype=np.float64)
+        self.sample_power = np.zeros(capacity, dtype=np.float32)
+        self.written = 0
+
+        self.last_ts = None
+        self.last_power = 0.0
+        self.total_wh = 0.0
+
+        self.minute = None
+        self._resetMinute()
+        self.minutes = deque(maxlen=minute_history)
+        self.hourly = OrderedDict()
+        self.daily = OrderedDict()
+
+    def _resetMinute(self):
+        self.minute_wh = 0.0
+        self.minute_on_seconds = 0.0
+        self.minute_power_sum = 0.0
+        self.minute_power_max = 0.0
+        self.minute_samples = 0
+
+    def ingest(self, power, ts=None):
+        if ts is None:
+            ts = time.time()
+        power = float(power)
+        with self.lock:
+            if self.last_ts is not None and ts > self.last_ts:
+                # the held reading is credited to every minute the gap covers
+                start = self.last_ts
+                end = start + min(ts - self.last_ts, self.max_gap)
+                while start < end:
+                    minute = int(start // 60)
+                    if minute > self.minute:
+                        self._compactMinute()
+                        self.minute = minute
+                    boundary = min(end, (minute + 1) * 60.0)
+                    self._hold(boundary - start)
+                    start = boundary
+
+            minute = int(ts // 60)
+            if self.minute is None:
+                self.minute = minute
+            elif minute > self.minute:
+                self._compactMinute()
+                self.minute = minute
+
+            index = self.written % self.capacity
+            self.sample_ts[index] = ts
+            self.sample_power[index] = power
+            self.written += 1
+
+            self.minute_power_sum += power
+            self.minute_power_max = max(self.minute_power_max, power)
+            self.minute_samples += 1
+            self.last_ts = ts
+            self.last_power = power
+
+    def _hold(self, dt):
+        wh = self.last_power * dt / 3600.0
+        self.total_wh += wh
+        self.minute_wh += wh
+        if self.last_power > self.on_threshold:
+            self.minute_on_seconds += dt
+
+    def _compactMinute(self):
+        start = self.minute * 60
+        aggregate = {
+            "minute": start,
+            "energy_wh": self.minute_wh,
+            "avg_power": self.minute_power_sum / self.minute_samples if self.minute_samples else 0.0,
+            "max_power": self.minute_power_max,
+            "on_seconds": self.minute_on_seconds,
+            "samples": self.minute_samples,
+        }
+        self.minutes.append(aggregate)
+        self._addTotal(self.hourly, self._hourKey(start), self.minute_wh, self.hour_history)
+        self._addTotal(self.daily, self._dayKey(start), self.minute_wh, self.day_history)
+        self._resetMinute()
+
+    def _addTotal(self, totals, key, wh, history):
+        totals[key] = totals.get(key, 0.0) + wh
+        while len(totals) > history:
+            totals.popitem(last=False)
+
+    def _hourKey(self, ts):
+        return time.strftime("%Y-%m-%d %H:00", time.localtime(ts))
+
+    def _dayKey(self, ts):
+        return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+    def consumption(self, period="hour"):
+        """
+        :param period: hour or day
+        :return: dict of period start -> kWh, the current period includes the unfinished minute
+        """
+        with self.lock:
+            if period == "day":
+                totals = OrderedDict(self.daily)
+                key_fn = self._dayKey
+            else:
+                totals = OrderedDict(self.hourly)
+                key_fn = self._hourKey
+            if self.minute is not None and self.minute_wh:
+                key = key_fn(self.minute * 60)
+                totals[key] = totals.get(key, 0.0) + self.minute_wh
+            total_wh = self.total_wh
+        return {"period": period,
+                "kwh": OrderedDict((key, wh / 1000.0) for key, wh in totals.items()),
+                "total_kwh": total_wh / 1000.0}
+
+    def _orderedSamples(self):
+        count = min(self.written, self.capacity)
+        if self.written <= self.capacity:
+            return self.sample_ts[:count].copy(), self.sample_power[:count].copy()
+        start = self.written % self.capacity
+        return np.roll(self.sample_ts, -start), np.roll(self.sample_power, -start)
+
+    def dutyCycle(self):
+        """
+        Duty cycle statistics of the boiler over the raw samples currently in the buffer
+        """
+        with self.lock:
+            ts, power = self._orderedSamples()
+        if len(ts) < 2:
+            return {"samples": int(len(ts)), "duty_cycle": 0.0, "cycles": 0,
+                    "avg_on_seconds": 0.0, "avg_on_power": 0.0}
+        dt = np.minimum(np.diff(ts), self.max_gap)
+        on = power > self.on_threshold
+        held_on = on[:-1]
+        on_seconds = float(np.sum(dt[held_on]))
+        total_seconds = float(np.sum(dt))
+        cycles = int(np.count_nonzero(~on[:-1] & on[1:]) + (1 if on[0] else 0))
+        return {
+            "samples": int(len(ts)),
+            "window_seconds": total_seconds,
+            "duty_cycle": on_seconds / total_seconds if total_seconds else 0.0,
+            "cycles": cycles,
+            "avg_on_seconds": on_seconds / cycles if cycles else 0.0,
+            "avg_on_power": float(np.mean(power[on])) if np.any(on) else 0.0,
+        }
@@ -0,0 +1,50 @@
+import threading
+import time
+
+# Direction tags used in the log
+FROM_RELAY = "relay"
+FROM_CLOUD = "cloud"
+
+
+class TrafficRecorder(object):
+    """
+    Appends relay<->cloud websocket frames to a compact text log, one frame per
+    line: "<unix time>\\t<relay|cloud>\\t<frame>". The log is what the stand-in
+    relay and cloud in sonoff.standins replay.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.logfile = open(path, "a")
+
+    def record(self, direction, message):
+        if message is None:
+            return
+        if isinstance(message, bytes):
+            message = message.decode("utf-8", "replace")
+        # valid json never has a raw newline inside a string, so this is lossless
+        line = "%.6f\t%s\t%s\n" % (time.time(), direction, message.replace("\n", " "))
+        with self.lock:
+            self.logfile.write(line)
+            self.logfile.flush()
+
+    def close(self):
+        with self.lock:
+            self.logfile.close()
+
+
+def loadRecording(path):
+    """
+    :param path: log written by TrafficRecorder
+    :return: list of (timestamp, direction, frame) tuples in recorded order
+    """
+    frames = []
+    with open(path) as logfile:
+        for line in logfile:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            ts, direction, message = line.split("\t", 2)
+            frames.append((float(ts), direction, message))
+    return frames
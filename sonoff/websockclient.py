@@ -3,10 +3,17 @@ import ssl
 from config.config import Config
 from websocket import create_connection, enableTrace
 import websocket
-from pprint import pprint
 import threading
+from sonoff.relaymessage import RelayMessage
+from sonoff.trafficrecorder import FROM_CLOUD
+import sonoff.asynclog
+
+logger = sonoff.asynclog.getLogger(__name__)
 
 class Websocketclient(object):
+    # set by sonoff.wsclientglb.init() when traffic recording is enabled
+    trafficRecorder = None
+
     def _init__(self):
         self.wsclnt = ""
         self.wsToRelay = ""
@@ -18,18 +25,19 @@ class Websocketclient(object):
         print(error)
 
     def on_message(self, ws, message):
-        print("Got message from central server:" + str(message))
-        print("Will now forward to WiFi relay")
+        logger.debug("Got message from central server, forwarding to WiFi relay: %s", message)
+        if self.trafficRecorder is not None:
+            self.trafficRecorder.record(FROM_CLOUD, message)
         self.wsToRelay.sendMsgToRelay(message)
 
-    def connectToHost(self,host=None, port=None):
+    def connectToHost(self,host=None, port=None, scheme="wss"):
         main_config = Config()
         if host is None:
             host = main_config.configOpt["sonoff_ws_server"]
         if port is None:
             port = main_config.configOpt["sonoff_ws_port"]
         # Connect to Zio Host
-        addr = "wss://" + host + ":" + port + "/api/ws"
+        addr = scheme + "://" + host + ":" + str(port) + "/api/ws"
         print( "Connecting to " + addr )
         websocket.enableTrace(False)
         try:
@@ -52,7 +60,7 @@ class Websocketclient(object):
 
     def _send_json_cmd(self,str_json_cmd):
         try:
-            print("Trying to send " + str_json_cmd)
+            logger.debug("Trying to send %s", str_json_cmd)
             self.wsclnt.send(str_json_cmd)
             return "SUCC"
         except Exception as e:
@@ -83,17 +91,17 @@ class Websocketclient(object):
 
 
 
-    def forwardRequest(self,json_string):
-        try:
-            msg_dict = json.loads(json_string)
-        except:
-            print(" forwardRequest : Failed to parse json, please check the passed argument")
-            return "ERROR"
-        ## modify json if needed
-        #msg_dict["accessKey"] = "test"
-        try:
-            jsoncmd = json.dumps(msg_dict)
-        except:
-            print(" forwardRequest : Failed to build json")
-            return "ERROR"
-        return self._send_json_cmd(jsoncmd)
+    def forwardRequest(self,message):
+        """
+        :param message: RelayMessage already parsed by the websocket server, or a raw json string
+        :return: SUCC, SENDFAIL or ERROR
+        """
+        if not isinstance(message, RelayMessage):
+            try:
+                message = RelayMessage(message)
+            except Exception:
+                logger.error("forwardRequest : Failed to parse json, please check the passed argument")
+                return "ERROR"
+        ## modify json if needed, e.g. message.set("accessKey", "test")
+        ## untouched messages are forwarded byte for byte
+        return self._send_json_cmd(message.encode())
@@ -4,9 +4,12 @@ import imp
 import os
 import random
 from config.config import Config
-from pprint import pprint
+from sonoff.relaymessage import RelayMessage
+import sonoff.asynclog
 import sys
 
+logger = sonoff.asynclog.getLogger(__name__)
+
 class WebSocketSrv(object):
     #def __init__(self, ws):
     #    self.ws = ws
@@ -14,15 +17,16 @@ class WebSocketSrv(object):
     #    self.access_key = ""
     #    self.device_id = ""
 
-    def __init__(self, ws, ws_forwarder):
+    def __init__(self, ws, ws_forwarder, telemetry=None):
         self.ws = ws
         self.main_config = Config()
         self.access_key = ""
         self.device_id = ""
         self.wsclient = ws_forwarder
+        self.telemetry = telemetry
 
     def sendMsgToRelay(self, message):
-        print("websocksrv: sendMsgToRelay: Sending back remote result to relay: " + str(message))
+        logger.debug("sendMsgToRelay: Sending back remote result to relay: %s", message)
         self.ws.send(message)
 
     def switch(self,state="on"):
@@ -34,46 +38,51 @@ class WebSocketSrv(object):
         :param message: the message send via websocket - string in json format
         :return: no value
         """
-        print("Websocket on_message : We got a message from relay")
+        logger.debug("on_message : We got a message from relay")
 
         if message is None:
-            print("Websocket on_message : Empty message received. Skipping.")
+            logger.info("on_message : Empty message received. Skipping.")
             return
 
         try:
-            ## get useful data
-            msg_data = json.loads(message)
-            print("Websocket on_message : Message parsed")
-            if self.main_config.log_level == "debug":
-                pprint(msg_data)
-            if "deviceid" in msg_data:
-                self.device_id = msg_data["deviceid"]
-            if "apikey" in msg_data:
-                self.access_key = msg_data["apikey"]
-            if "action" in msg_data:
-                if msg_data["action"] == "update":
-                   self.switch_status = msg_data["params"]["switch"]
-                   self.power = msg_data["params"]["power"]
+            ## parse once, the same object is handed to the forwarder
+            msg = RelayMessage(message)
+            logger.debug("on_message : Message parsed %s", msg.data)
+            if msg.deviceid is not None:
+                self.device_id = msg.deviceid
+            if msg.apikey is not None:
+                self.access_key = msg.apikey
+            if msg.action == "update":
+                params = msg.params
+                if "switch" in params:
+                    self.switch_status = params["switch"]
+                if "power" in params:
+                    self.power = params["power"]
 
         except Exception as e:
-            print("Websocket on_message : There was an error parsing the json from the command " + str(e) +
-                           '  sending back ' + 'Error in JSON format.')
+            logger.error("on_message : There was an error parsing the json from the command %s sending back "
+                         "Error in JSON format.", e)
             return
-  
+
         ## just forward request:
         try:
-            print("Will try to forward request to central server")
-            result = self.wsclient.forwardRequest(message)
-            if result == "SENDFAIL" : 
-                print("TODO: Will try to handle request locally" + str(e) )
-                self.handleLocally(msg_data)
+            result = self.wsclient.forwardRequest(msg)
+            if result == "SENDFAIL" :
+                logger.info("Will try to handle request locally")
+                self.handleLocally(msg.data)
             elif result == "SUCC":
-                print("Request forwarded to central server")
+                logger.debug("Request forwarded to central server")
             else:
-                print("The return from forward request was:"+str(result))
-            return
+                logger.info("The return from forward request was: %s", result)
         except Exception as e:
-            print("Websocket on_message : There was an error forwarding the req. " + str(e) )
+            logger.error("on_message : There was an error forwarding the req. %s", e)
+
+        ## telemetry after forwarding, a bad reading must not drop the frame
+        if self.telemetry is not None and msg.action == "update" and "power" in msg.params:
+            try:
+                self.telemetry.ingest(msg.params["power"])
+            except Exception as e:
+                logger.error("on_message : Ignoring power reading %r %s", msg.params["power"], e)
 
     def handleLocally(self, msg):
         if "action" in msg:
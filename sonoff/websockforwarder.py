@@ -4,15 +4,21 @@ from gevent import pywsgi
 from geventwebsocket.handler import WebSocketHandler
 from sonoff.websocketsrv import WebSocketSrv
 from sonoff.websockclient import Websocketclient
+from sonoff.dispatchforwarder import DispatchForwarder
+from sonoff.trafficrecorder import FROM_RELAY
 from config.config import Config
 import json
-import requests
 import threading
 
 import sonoff.wsclientglb
+import sonoff.asynclog
+
+logger = sonoff.asynclog.getLogger(__name__)
 
 flaskapp = Flask(__name__)
 socket = Sockets(flaskapp)
+dispatchForwarder = None
+dispatchForwarderLock = threading.Lock()
 
 @flaskapp.route('/')
 def home():
@@ -29,47 +35,59 @@ def sonoffDispatchDevicePost():
     print("REST: Relay attempts to get websocket serever address from POST /dispatch/device")
     print("got the following params: "+json.dumps(request.get_json()))
     jsonresult = {"error":0,"reason":"ok","IP":"192.168.1.2","port":443}
-    ## Make the actual request to Sonoff
+    ## Make the actual request to Sonoff in the background, the reply to the relay doesn't depend on it
     try:
         sonoffDispatchDeviceForward(json.dumps(request.get_json()))
     except Exception as e:
-        print("Failed to dispatch to central server, but that's ok " + str(e))
+        print("Failed to schedule dispatch to central server, but that's ok " + str(e))
     print("REST: Returning to WiFi Relay:"+ json.dumps(jsonresult) ) 
     return json.dumps(jsonresult)
 
 @socket.route('/api/ws')
 def server_socket(ws):
-    srv = WebSocketSrv(ws,sonoff.wsclientglb.webSockClientForwarder)
+    srv = WebSocketSrv(ws,sonoff.wsclientglb.webSockClientForwarder,sonoff.wsclientglb.powerTelemetry)
     # set the new socket in the client forwarder to be able to send replys
     print("Service main : Incoming websocket connection")
     while not ws.closed:
         message = ws.receive()
+        if sonoff.wsclientglb.trafficRecorder is not None:
+            sonoff.wsclientglb.trafficRecorder.record(FROM_RELAY, message)
         sonoff.wsclientglb.webSockClientForwarder.wsToRelay = srv
-        print("Set the ws srv object to :" + str(sonoff.wsclientglb.webSockClientForwarder.wsToRelay) )
         srv.on_message(message)
-        print("Completed on_message now ws srv object is :" + str(sonoff.wsclientglb.webSockClientForwarder.wsToRelay) )
     print("SOCKET CONN CLOSED removing srv object")
     del srv
 
 
 def sonoffDispatchDeviceForward(requestdata):
-    main_config = Config()
-    url = "https://" + main_config.configOpt["sonoff_server"] + ":" + main_config.configOpt["sonoff_port"] + "/dispatch/device"
-    res = requests.post(url=url, data=requestdata, verify=False, timeout=30)
-    print("Sent to " + url + " data " + requestdata  + " got back:")
-    print(res.text)
-    return res
+    return getDispatchForwarder().forwardAsync(requestdata)
+
+
+def getDispatchForwarder():
+    global dispatchForwarder
+    ## requests are served concurrently, only one forwarder (and session) may be built
+    with dispatchForwarderLock:
+        if dispatchForwarder is None:
+            dispatchForwarder = DispatchForwarder()
+        return dispatchForwarder
 
 
-def main():
+def main(listen_address=None, ws_port=None, cloud_host=None, cloud_port=None, cloud_scheme="wss"):
+    """
+    Arguments default to the config file, they are only overridden when running
+    against the stand-in cloud (see sonoff.benchmark)
+    """
     main_config = Config()
+    sonoff.asynclog.setLevel(main_config.log_level)
+    getDispatchForwarder()
     print("Connecting to remote WS server to forward request")
     # webSockClientForwarder.connectToHost()
-    t = threading.Thread(target=sonoff.wsclientglb.webSockClientForwarder.connectToHost)
+    t = threading.Thread(target=sonoff.wsclientglb.webSockClientForwarder.connectToHost, args=(cloud_host, cloud_port, cloud_scheme))
     t.start()
 
-    ws_port = int(main_config.configOpt["listen_port_websock"])
-    listen_address = main_config.configOpt["listen_address"]
+    if ws_port is None:
+        ws_port = int(main_config.configOpt["listen_port_websock"])
+    if listen_address is None:
+        listen_address = main_config.configOpt["listen_address"]
     print('INFO: WSforwarder main : Starting websocket listener...')
     server = pywsgi.WSGIServer((listen_address, ws_port), flaskapp, handler_class=WebSocketHandler)
     server.serve_forever()
@@ -1,7 +1,29 @@
 from sonoff.websockclient import Websocketclient
+from sonoff.trafficrecorder import TrafficRecorder
+from sonoff.telemetry import PowerTelemetry
+from sonoff.lanclient import SonoffLanClient
+from config.config import Config
 global webSockClientForwarder
+global trafficRecorder
+global powerTelemetry
+global lanClient
+trafficRecorder = None
+powerTelemetry = None
+lanClient = None
 
 def init():
     global webSockClientForwarder
+    global trafficRecorder
+    global powerTelemetry
+    global lanClient
     webSockClientForwarder = Websocketclient()
-
+    powerTelemetry = PowerTelemetry()
+    conf = Config().configOpt
+    if conf.get("sonoff_lan", "on") == "on":
+        lanClient = SonoffLanClient(conf.get("sonoff_deviceid", ""), conf.get("sonoff_lan_ip", ""),
+                                    conf.get("sonoff_lan_port", "8081"))
+    record_path = conf.get("sonoff_record_path", "")
+    if record_path:
+        print("INFO: recording relay/cloud websocket traffic to " + record_path)
+        trafficRecorder = TrafficRecorder(record_path)
+        webSockClientForwarder.trafficRecorder = trafficRecorder
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compares FLAC encoding of a recorded command the old way (flac command with
+temp files, after recording) with the in-process encoder fed while
+recording. What matters for latency is the time left after the last chunk
+is recorded, that is what "after recording" shows.
+
+    python3 flac_benchmark.py --duration 3 --sample-rate 48000 --levels 0 5 8
+    python3 flac_benchmark.py --wav command.wav
+"""
+
+import time
+import wave
+import shutil
+import argparse
+
+import numpy as np
+
+from voice_control_modern import SpeechRecognizer, IncrementalFlacEncoder, SOUNDFILE_AVAILABLE
+
+
+def synthetic_command(duration: float, sample_rate: int) -> bytes:
+    """Background noise with a few seconds of speech-like bursts in the middle"""
+    rng = np.random.default_rng(1)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    audio = rng.normal(0, 60, len(t))
+    speech = (t > 0.3) & (t < duration - 0.7)
+    # Syllables: harmonics of a gliding pitch, switched on and off 4 times a second
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    audio += speech * envelope * voiced * 4000
+    return np.clip(audio, -32768, 32767).astype(np.int16).tobytes()
+
+
+def read_wav(path: str):
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise SystemExit("Need a 16 bit mono WAV file")
+        return wav.readframes(wav.getnframes()), wav.getframerate()
+
+
+def bench_command(recognizer: SpeechRecognizer, audio: bytes, sample_rate: int, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = recognizer._compress_with_flac_command(audio, sample_rate)
+        times.append(time.perf_counter() - start)
+    return len(data), min(times), 0.0
+
+
+def bench_incremental(level: int, audio: bytes, sample_rate: int, chunk_ms: int, repeat: int):
+    chunk_bytes = int(sample_rate * chunk_ms / 1000) * 2
+    chunks = [audio[i:i + chunk_bytes] for i in range(0, len(audio), chunk_bytes)]
+    finish_times = []
+    write_times = []
+    for _ in range(repeat):
+        encoder = IncrementalFlacEncoder(sample_rate, level)
+        start = time.perf_counter()
+        for chunk in chunks:
+            encoder.write(chunk)
+        write_times.append((time.perf_counter() - start) / len(chunks))
+        start = time.perf_counter()
+        data = encoder.finish()
+        finish_times.append(time.perf_counter() - start)
+    return len(data), min(finish_times), min(write_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FLAC encoding benchmark: flac command vs in-process encoder")
+    parser.add_argument('--wav', default=None, help='16 bit mono WAV to encode (default: synthetic command)')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds of synthetic audio (default: 3)')
+    parser.add_argument('--sample-rate', type=int, default=16000, help='Synthetic audio sample rate (default: 16000)')
+    parser.add_argument('--chunk-ms', type=int, default=80, help='Recorded chunk length in ms (default: 80)')
+    parser.add_argument('--levels', type=int, nargs='+', default=[0, 5, 8], help='Compression levels 0-8')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the fastest counts (default: 5)')
+    args = parser.parse_args()
+
+    if args.wav:
+        audio, sample_rate = read_wav(args.wav)
+    else:
+        audio, sample_rate = synthetic_command(args.duration, args.sample_rate), args.sample_rate
+
+    print(f"{len(audio):,} bytes of LINEAR16, {len(audio) / 2 / sample_rate:.2f}s at {sample_rate} Hz\n")
+    print(f"{'encoder':<22} {'level':>5} {'bytes':>9} {'ratio':>6} {'after recording':>16} {'per chunk':>10}")
+
+    for level in args.levels:
+        rows = []
+        if shutil.which('flac'):
+            recognizer = SpeechRecognizer("", flac_compression_level=level)
+            rows.append(("flac command", bench_command(recognizer, audio, sample_rate, args.repeat)))
+        if SOUNDFILE_AVAILABLE:
+            rows.append(("in-process incremental",
+                         bench_incremental(level, audio, sample_rate, args.chunk_ms, args.repeat)))
+        for name, (size, after, per_chunk) in rows:
+            print(f"{name:<22} {level:>5} {size:>9,} {size / len(audio):>6.2f} "
+                  f"{after * 1000:>13.1f} ms {per_chunk * 1000:>7.2f} ms")
+
+    if not shutil.which('flac'):
+        print("\nflac command not installed (sudo apt-get install flac), nothing to compare with")
+    if not SOUNDFILE_AVAILABLE:
+        print("\nsoundfile not installed (pip install soundfile), only the flac command was measured")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Records samples of the voice commands for the on-device command spotter
+(CommandSpotter in voice_control_modern.py) and checks how well they can be
+told apart.
+
+Record 5 samples of each command, saying it the way you would after the wake word:
+    python3 record_spotter_samples.py --count 5 "вдигни щори" "пусни щори" "гаси ламп"
+
+Check the samples, each one is matched against all the others:
+    python3 record_spotter_samples.py --evaluate
+
+The phrases must be the keys of CommandProcessor.commands, samples go to
+samples_dir/<phrase>/<n>.wav.
+"""
+
+import os
+import wave
+import argparse
+
+import numpy as np
+
+from voice_control_modern import AudioRecorder, CommandSpotter, VoiceControlConfig
+
+
+def record(samples_dir: str, phrases, count: int, device_index, silence_threshold: int):
+    recorder = AudioRecorder(device_index=device_index)
+    try:
+        for phrase in phrases:
+            directory = os.path.join(samples_dir, phrase)
+            os.makedirs(directory, exist_ok=True)
+            existing = len([name for name in os.listdir(directory) if name.endswith(".wav")])
+            for number in range(existing + 1, existing + count + 1):
+                input(f"\nPress Enter, then say '{phrase}' ({number - existing}/{count})")
+                audio_data = recorder.record_until_silence(
+                    max_duration=4,
+                    silence_duration=0.7,
+                    device_index=device_index,
+                    silence_threshold=silence_threshold
+                )
+                path = os.path.join(directory, f"{number}.wav")
+                with wave.open(path, 'wb') as wav:
+                    wav.setnchannels(1)
+                    wav.setsampwidth(2)
+                    wav.setframerate(recorder.sample_rate)
+                    wav.writeframes(audio_data)
+                print(f"Saved {path}")
+    finally:
+        recorder.close()
+
+
+def evaluate(samples_dir: str, max_distance: float, min_confidence: float):
+    spotter = CommandSpotter(samples_dir, max_distance=max_distance, min_confidence=min_confidence)
+    right = wrong = unsure = 0
+    for phrase in sorted(os.listdir(samples_dir)):
+        directory = os.path.join(samples_dir, phrase)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".wav"):
+                continue
+            audio_array, sample_rate = CommandSpotter.read_wav(os.path.join(directory, name))
+            features = spotter._features(audio_array, sample_rate)
+            if features is None:
+                print(f"{phrase}/{name}: no speech found")
+                continue
+
+            # Leave the sample out of its own templates
+            distances = {}
+            for other, templates in spotter.templates.items():
+                candidates = [template for template in templates
+                              if not (other == phrase and template.shape == features.shape
+                                      and np.array_equal(template, features))]
+                distances[other] = min((spotter.dtw_distance(features, template) for template in candidates),
+                                       default=np.inf)
+            ranked = sorted(distances, key=distances.get)
+            best, runner_up = distances[ranked[0]], distances[ranked[1]]
+            confidence = 1.0 - best / runner_up if np.isfinite(runner_up) and runner_up > 0 else 1.0
+
+            if best > max_distance or confidence < min_confidence:
+                unsure += 1
+                verdict = "unsure, goes to speech recognition"
+            elif ranked[0] == phrase:
+                right += 1
+                verdict = "ok"
+            else:
+                wrong += 1
+                verdict = f"WRONG: {ranked[0]}"
+            print(f"{phrase}/{name}: distance {best:.2f}, next '{ranked[1]}' {runner_up:.2f}, "
+                  f"confidence {confidence:.2f} - {verdict}")
+
+    total = right + wrong + unsure
+    if total:
+        print(f"\n{right}/{total} spotted, {wrong} wrong, {unsure} left to speech recognition")
+        if wrong:
+            print("Raise --min-confidence or lower --max-distance, or record more samples")
+
+
+def main():
+    config = VoiceControlConfig()
+    parser = argparse.ArgumentParser(description="Record and check samples for the on-device command spotter")
+    parser.add_argument('phrases', nargs='*', help='Command phrases to record')
+    parser.add_argument('--samples-dir', default=config.get('spotter_samples_dir',
+                                                            '/usr/local/bin/home-iot/spotter_samples'),
+                        help='Sample directory (default: spotter_samples_dir from config)')
+    parser.add_argument('--count', type=int, default=5, help='Samples to record per command (default: 5)')
+    parser.add_argument('--device-index', type=int, default=None, help='Audio input device index')
+    parser.add_argument('--silence-threshold', type=int, default=700,
+                        help='RMS volume below which recording counts as silence (default: 700)')
+    parser.add_argument('--evaluate', action='store_true', help='Match every sample against the others')
+    parser.add_argument('--max-distance', type=float, default=float(config.get('spotter_max_distance', '1.8')))
+    parser.add_argument('--min-confidence', type=float, default=float(config.get('spotter_min_confidence', '0.3')))
+    args = parser.parse_args()
+
+    if args.phrases:
+        record(args.samples_dir, args.phrases, args.count, args.device_index, args.silence_threshold)
+    if args.evaluate:
+        evaluate(args.samples_dir, args.max_distance, args.min_confidence)
+    if not args.phrases and not args.evaluate:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
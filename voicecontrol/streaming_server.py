@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a streaming speech recognition server, to test and time
+streaming recognition without Google. It speaks the protocol of
+HttpChunkedStream in voice_control_modern.py: LINEAR16 audio comes in as a
+chunked POST, results go out as newline-delimited JSON while the audio is
+still arriving.
+
+It does not recognize anything. It finds the speech by volume, sends the
+words of --transcript as interim results while the speech goes on and the
+final result once it has heard --end-silence seconds of silence after the
+speech (like Google's single_utterance), or when the audio ends.
+
+    python3 streaming_server.py --port 8765 --transcript "пусни щори"
+
+and in conf.ini:
+    speech_streaming = http
+    speech_streaming_url = http://localhost:8765/recognize
+"""
+
+import json
+import time
+import logging
+import argparse
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("streaming_server")
+
+
+class StreamingRecognizeHandler(BaseHTTPRequestHandler):
+    """Handles one streamed utterance per request"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            self.send_error(411, "Chunked transfer encoding required")
+            return
+
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        sample_rate = int(params.get("sampleRateHertz", ["16000"])[0])
+        options = self.server.options
+        words = options.transcript.split()
+
+        # Answer right away, results are written as the audio comes in
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        started = time.time()
+        samples = 0
+        speech_samples = 0
+        silence_samples = 0
+        words_sent = 0
+        final_sent = False
+        pending = b""
+
+        for chunk in self._read_chunks():
+            pending += chunk
+            # int16 samples, keep an odd byte for the next chunk
+            usable = len(pending) - len(pending) % 2
+            audio = np.frombuffer(pending[:usable], dtype=np.int16)
+            pending = pending[usable:]
+            if final_sent or not len(audio):
+                continue
+
+            samples += len(audio)
+            rms = np.sqrt(np.mean(audio.astype(np.float32) ** 2))
+            if rms >= options.speech_threshold:
+                speech_samples += len(audio)
+                silence_samples = 0
+            elif speech_samples:
+                silence_samples += len(audio)
+
+            # One more word per --word-time seconds of speech
+            spoken = min(len(words), int(speech_samples / sample_rate / options.word_time) + 1) if speech_samples else 0
+            if spoken > words_sent and spoken < len(words):
+                words_sent = spoken
+                self._send_result(" ".join(words[:words_sent]), False)
+
+            if speech_samples and silence_samples >= options.end_silence * sample_rate:
+                logger.info(f"End of speech after {samples / sample_rate:.2f}s of audio")
+                self._send_result(options.transcript, True)
+                final_sent = True
+
+        if not final_sent:
+            self._send_result(options.transcript if speech_samples else "", True)
+        self._write_chunk(b"")
+        logger.info(f"Utterance done: {samples / sample_rate:.2f}s of audio in {time.time() - started:.2f}s")
+
+    def _read_chunks(self):
+        """Yield the chunks of a chunked request body as they arrive"""
+        while True:
+            size_line = self.rfile.readline()
+            if not size_line:
+                return
+            size = int(size_line.split(b";")[0].strip(), 16)
+            if size == 0:
+                # Trailers end with an empty line
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            data = self.rfile.read(size)
+            self.rfile.readline()
+            yield data
+
+    def _send_result(self, transcript: str, is_final: bool):
+        if self.server.options.latency:
+            time.sleep(self.server.options.latency)
+        result = {"alternatives": [{"transcript": transcript}], "isFinal": is_final}
+        if is_final:
+            result["alternatives"][0]["confidence"] = 0.9
+        self._write_chunk(json.dumps({"results": [result]}, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in streaming speech recognition server")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--transcript', default='пусни щори', help='Text "recognized" in every utterance')
+    parser.add_argument('--speech-threshold', type=int, default=500,
+                        help='RMS volume above which audio counts as speech (default: 500)')
+    parser.add_argument('--end-silence', type=float, default=0.5,
+                        help='Seconds of silence after speech that end the utterance (default: 0.5)')
+    parser.add_argument('--word-time', type=float, default=0.4,
+                        help='Seconds of speech per word of interim results (default: 0.4)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Extra seconds before every result, to simulate the network (default: 0)')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StreamingRecognizeHandler)
+    server.options = args
+    logger.info(f"Streaming recognition stand-in on http://{args.host}:{args.port}/recognize")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,21 @@ export SDL_AUDIODRIVER=alsa ; export AUDIODEV=plughw:1,0
 import os
 import sys
 import time
+import math
 import wave
 import logging
 import json
 import struct
+import re
 import random
+import queue
+import shutil
+from collections import OrderedDict
+import subprocess
+import http.client
+import urllib.parse
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Callable
 import threading
 
 import pyaudio
@@ -23,6 +31,7 @@ import requests
 import paho.mqtt.client as mqtt
 import numpy as np
 import base64
+import io
 
 # Configure logging first
 logging.basicConfig(
@@ -48,6 +57,34 @@ except ImportError:
     WEBRTC_AVAILABLE = False
     logger.warning("webrtcvad not available, using volume-based VAD fallback")
 
+# Try to import soundfile (libsndfile) for in-process FLAC encoding, the flac command is used otherwise
+try:
+    import soundfile
+    SOUNDFILE_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError: the python package is there but libsndfile is not
+    SOUNDFILE_AVAILABLE = False
+
+# Try to import the local speech recognition engines, only needed for offline recognition
+try:
+    import vosk
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+# Try to import the Google Cloud Speech client, only needed for gRPC streaming recognition
+try:
+    from google.cloud import speech as google_speech
+    GOOGLE_SPEECH_GRPC_AVAILABLE = True
+except ImportError:
+    GOOGLE_SPEECH_GRPC_AVAILABLE = False
+
 
 class VoiceControlConfig:
     """Configuration management for voice control system"""
@@ -72,7 +109,10 @@ class VoiceControlConfig:
                 "mqtt_broker": "localhost",
                 "google_api_key": "",
                 "audio_dir": "voicecontrol/VoiceCommands/",
-                "wakeword_threshold": "0.5"
+                "wakeword_threshold": "0.5",
+                "speech_recognizer": "cloud",
+                "speech_streaming": "off",
+                "speech_streaming_url": "http://localhost:8765/recognize"
             }
 
     def get(self, key: str, default: Optional[str] = None) -> str:
@@ -81,76 +121,248 @@ class VoiceControlConfig:
 
 
 class AudioPlayer:
-    """Handles audio feedback playback"""
-
-    def __init__(self, audio_dir: str = "voicecontrol/VoiceCommands/"):
+    """
+    Handles audio feedback playback. The reply clips in audio_dir are decoded
+    once at startup and played from memory through an output stream that stays
+    open, on a playback thread, so play_reply returns right away.
+    """
+
+    CLIP_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg")
+    # Decoders for clips soundfile cannot read (libsndfile before 1.1 has no mp3)
+    DECODERS = [
+        ("ffmpeg", ["ffmpeg", "-loglevel", "quiet", "-i", "{file}", "-f", "s16le", "-ac", "1", "-ar", "{rate}", "-"]),
+        ("mpg123", ["mpg123", "-q", "-m", "-r", "{rate}", "-s", "{file}"])
+    ]
+    # Players for when no output stream can be opened, they play the files
+    PLAYERS = [
+        ("mpg123", ["mpg123", "-q"]),
+        ("ffplay", ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"]),
+        ("cvlc", ["cvlc", "--play-and-exit", "--quiet"]),
+        ("paplay", ["paplay"])
+    ]
+
+    def __init__(self, audio_dir: str = "voicecontrol/VoiceCommands/", output_device_index: Optional[int] = None,
+                 sample_rate: Optional[int] = None, chunk_size: int = 1024):
+        """
+        Args:
+            audio_dir: Directory with the reply clips, <name><variant>.mp3
+            output_device_index: Audio output device index (default: system default)
+            sample_rate: Output sample rate, by default the rate of the first clip
+            chunk_size: Frames per output buffer
+        """
         self.audio_dir = audio_dir
-        # Detect available audio player
-        self.player = self._detect_audio_player()
+        self.output_device_index = output_device_index
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.audio = None
+        self.stream = None
+        self.player = None
+        self.decoder = self._find_program(self.DECODERS)
+
+        # name (e.g. "Yes1") -> int16 mono PCM at self.sample_rate
+        self.clips = self._load_clips()
+        if self.clips:
+            self._open_output_stream()
+
+        # Also plays the clips that could not be decoded while the stream is open
+        self.player = self._find_program(self.PLAYERS)
+        if self.stream:
+            logger.info(f"Playing {len(self.clips)} preloaded clips at {self.sample_rate} Hz")
         if self.player:
-            logger.info(f"Using audio player: {self.player}")
-        else:
+            logger.info(f"Using audio player{' for clips not preloaded' if self.stream else ''}: {self.player[0]}")
+        elif not self.stream:
             logger.warning("No audio player found (tried: mpg123, ffplay, cvlc, paplay)")
 
-    def _detect_audio_player(self):
-        """Detect which audio player is available"""
-        import subprocess
-        players = [
-            ("mpg123", ["mpg123", "-q"]),
-            ("ffplay", ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"]),
-            ("cvlc", ["cvlc", "--play-and-exit", "--quiet"]),
-            ("paplay", ["paplay"])
-        ]
-
-        for name, cmd in players:
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._playback_loop, name="audio-player", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _find_program(programs):
+        """First of (name, command) whose program is installed"""
+        for name, cmd in programs:
+            if shutil.which(name):
+                return (name, cmd)
+        return None
+
+    def _load_clips(self) -> dict:
+        """Decode every clip in audio_dir to PCM at one sample rate"""
+        clips = {}
+        if not os.path.isdir(self.audio_dir):
+            logger.warning(f"Audio directory not found: {self.audio_dir}")
+            return clips
+
+        start = time.time()
+        for name in sorted(os.listdir(self.audio_dir)):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() not in self.CLIP_EXTENSIONS or stem in clips:
+                continue
             try:
-                result = subprocess.run(
-                    ["which", name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
-                )
-                if result.returncode == 0:
-                    return (name, cmd)
-            except:
+                clip = self._decode_clip(os.path.join(self.audio_dir, name))
+            except Exception as e:
+                logger.warning(f"Cannot decode {name}: {e}")
                 continue
-        return None
+            if clip is not None:
+                clips[stem] = clip
 
-    def play_reply(self, speech_text: str, max_variants: int = 1):
-        """Play audio feedback"""
-        import subprocess
+        if clips:
+            seconds = sum(len(clip) for clip in clips.values()) / self.sample_rate
+            logger.info(f"Decoded {len(clips)} reply clips ({seconds:.1f}s of audio) in {time.time() - start:.2f}s")
+        return clips
 
-        if not self.player:
+    def _decode_clip(self, path: str) -> Optional[np.ndarray]:
+        """Decode one clip to int16 mono at self.sample_rate, None if there is no way to"""
+        if SOUNDFILE_AVAILABLE:
+            try:
+                data, rate = soundfile.read(path, dtype='int16', always_2d=True)
+            except Exception as e:
+                logger.debug(f"soundfile cannot read {path}: {e}")
+            else:
+                clip = data[:, 0] if data.shape[1] == 1 else data.mean(axis=1).astype(np.int16)
+                if self.sample_rate is None:
+                    self.sample_rate = rate
+                elif rate != self.sample_rate:
+                    clip = PolyphaseResampler(rate, self.sample_rate).process(clip).copy()
+                return np.ascontiguousarray(clip)
+
+        if not self.decoder:
+            return None
+        if self.sample_rate is None:
+            self.sample_rate = 22050
+        name, cmd = self.decoder
+        cmd = [arg.format(file=path, rate=self.sample_rate) for arg in cmd]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+        if result.returncode != 0:
+            raise RuntimeError(f"{name} returned error code: {result.returncode}")
+        return np.frombuffer(result.stdout[:len(result.stdout) // 2 * 2], dtype=np.int16)
+
+    def _open_output_stream(self):
+        """Open the output stream once, it is started and stopped around playback"""
+        try:
+            self.audio = pyaudio.PyAudio()
+            self.stream = self.audio.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=self.sample_rate,
+                output=True,
+                output_device_index=self.output_device_index,
+                frames_per_buffer=self.chunk_size,
+                start=False
+            )
+        except Exception as e:
+            logger.warning(f"Cannot open audio output stream, playing files instead: {e}")
+            if self.audio:
+                self.audio.terminate()
+            self.audio = None
+            self.stream = None
+
+    def play_reply(self, speech_text: str, max_variants: int = 1, wait: bool = False,
+                   started: Optional[threading.Event] = None) -> threading.Event:
+        """
+        Play audio feedback, after the replies already queued
+
+        Args:
+            speech_text: Clip name without the variant number, e.g. "Yes"
+            max_variants: A random one of <speech_text>1 .. <speech_text><max_variants> is played
+            wait: Return only once the clip has played
+            started: Set when this clip (not the replies queued before it) starts playing
+
+        Returns:
+            Event set when the clip has played (or could not be played)
+        """
+        done = threading.Event()
+
+        # Random selection if multiple variants exist
+        variant = random.randint(1, max_variants)
+        name = f"{speech_text}{variant}"
+
+        if self.stream and name in self.clips:
+            self.jobs.put((name, self.clips[name], started, done))
+        elif self.player:
+            audio_file = self._clip_file(name)
+            if audio_file:
+                self.jobs.put((name, audio_file, started, done))
+            else:
+                logger.warning(f"Audio file not found: {name} in {self.audio_dir}")
+                print(f"⚠️  Audio file not found: {name} in {self.audio_dir}")
+                done.set()
+        elif self.stream:
+            logger.warning(f"Reply clip not preloaded and no audio player to play it: {name}")
+            done.set()
+        else:
             logger.debug(f"No audio player available, skipping: {speech_text}")
-            return
+            done.set()
 
-        try:
-            # Random selection if multiple variants exist
-            variant = random.randint(1, max_variants)
-            audio_file = os.path.join(self.audio_dir, f"{speech_text}{variant}.mp3")
+        if wait:
+            done.wait()
+        return done
 
+    def _clip_file(self, name: str) -> Optional[str]:
+        """Path of the clip file for name, None if there is none"""
+        for extension in self.CLIP_EXTENSIONS:
+            audio_file = os.path.join(self.audio_dir, name + extension)
             if os.path.exists(audio_file):
-                logger.info(f"Playing audio: {audio_file}")
-                print(f"🔊 Playing: {os.path.basename(audio_file)}")
-
-                # Use detected audio player
-                player_name, player_cmd = self.player
-                cmd = player_cmd + [audio_file]
-
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    timeout=10
-                )
-                if result.returncode != 0:
-                    logger.warning(f"{player_name} returned error code: {result.returncode}")
-            else:
-                logger.warning(f"Audio file not found: {audio_file}")
-                print(f"⚠️  Audio file not found: {audio_file}")
+                return audio_file
+        return None
+
+    def _playback_loop(self):
+        """Play queued replies one after the other"""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            name, audio, started, done = job
+            try:
+                if started is not None:
+                    started.set()
+                logger.info(f"Playing audio: {name}")
+                print(f"🔊 Playing: {name}")
+                if isinstance(audio, np.ndarray):
+                    self._play_clip(audio)
+                else:
+                    self._play_file(audio)
+            except Exception as e:
+                logger.error(f"Error playing audio: {e}")
+            finally:
+                done.set()
+                self.jobs.task_done()
+
+    def busy(self) -> bool:
+        """True while a reply is playing or queued"""
+        return self.jobs.unfinished_tasks > 0
+
+    def _play_clip(self, clip: np.ndarray):
+        if self.stream.is_stopped():
+            self.stream.start_stream()
+        self.stream.write(clip.tobytes(), len(clip))
+        if self.jobs.empty():
+            # Stopping waits for the buffered audio to play out
+            self.stream.stop_stream()
+
+    def _play_file(self, audio_file: str):
+        player_name, player_cmd = self.player
+        try:
+            result = subprocess.run(
+                player_cmd + [audio_file],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=10
+            )
+            if result.returncode != 0:
+                logger.warning(f"{player_name} returned error code: {result.returncode}")
         except subprocess.TimeoutExpired:
             logger.error(f"Audio playback timeout for {audio_file}")
-        except Exception as e:
-            logger.error(f"Error playing audio: {e}")
+
+    def close(self):
+        """Play what is queued, then close the output stream"""
+        self.jobs.put(None)
+        self.thread.join(timeout=10)
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.audio:
+            self.audio.terminate()
+            self.audio = None
 
 
 class VoiceActivityDetector:
@@ -201,38 +413,299 @@ class VoiceActivityDetector:
             return False
 
 
+class PolyphaseResampler:
+    """
+    Streaming resampler for a fixed rate pair (e.g. 48000 or 44100 Hz to 16000 Hz).
+
+    A Kaiser windowed sinc low-pass, split into one filter per phase of the
+    from_rate:to_rate ratio, so every output sample is a short dot product
+    with the input and the anti-aliasing comes for free. Filter banks are
+    computed once per rate pair and shared, the last input samples of a chunk
+    are kept for the next one so consecutive chunks join without clicks, and
+    the work buffers are allocated once per chunk size and reused.
+    """
+
+    _filter_banks = {}
+
+    def __init__(self, from_rate: int, to_rate: int, zero_crossings: int = 8, rolloff: float = 0.9,
+                 beta: float = 8.0):
+        """
+        Args:
+            from_rate: Input sample rate
+            to_rate: Output sample rate
+            zero_crossings: Filter length in zero crossings on each side, longer = sharper cutoff
+            rolloff: Cutoff as a fraction of the lower Nyquist frequency
+            beta: Kaiser window shape, higher = more stopband attenuation
+        """
+        divisor = math.gcd(from_rate, to_rate)
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        self.bank = self._filter_bank(self.up, self.down, zero_crossings, rolloff, beta)
+        self.taps = self.bank.shape[1]
+        self.history = self.taps - 1
+        # Whole periods of up outputs per matrix row, at least 16 so integer ratios get a real matrix product
+        self.row_outputs = self.up * -(-16 // self.up)
+        self.buffer = np.zeros(self.history + 4096, dtype=np.float32)
+        self.plans = {}
+        self.reset()
+
+    @classmethod
+    def _filter_bank(cls, up: int, down: int, zero_crossings: int, rolloff: float, beta: float) -> np.ndarray:
+        """Polyphase filter bank, bank[phase] holds the taps of that phase in input order"""
+        key = (up, down, zero_crossings, rolloff, beta)
+        bank = cls._filter_banks.get(key)
+        if bank is None:
+            factor = max(up, down)
+            half = zero_crossings * factor
+            n = np.arange(-half, half + 1)
+            cutoff = rolloff / factor
+            # Gain up makes up for the zeros stuffed between input samples
+            prototype = up * cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), beta)
+
+            taps = -(-len(prototype) // up)
+            padded = np.zeros(taps * up)
+            padded[:len(prototype)] = prototype
+            # Tap k of phase p multiplies the input k samples back, reversed to match a window of the input
+            bank = padded.reshape(taps, up).T[:, ::-1].astype(np.float32)
+            cls._filter_banks[key] = bank
+        return bank
+
+    def reset(self):
+        """Forget the previous chunks, e.g. when the audio continues after a gap"""
+        self.buffer[:self.history] = 0
+        self.position = 0  # Next output time, at the upsampled rate, from the start of the next chunk
+
+    def _plan(self, length: int):
+        """
+        Output positions, weights and work buffers for a chunk of length samples.
+
+        The phases repeat every up outputs, which take down input samples, so
+        a row of row_outputs outputs is one stretch of input times a weight
+        matrix holding the taps of every output at its offset. All rows of a
+        chunk then go through one matrix product on a strided view of the
+        input, without copying out windows. Outputs after the last complete
+        row are computed window by window.
+        """
+        key = (length, self.position)
+        plan = self.plans.get(key)
+        if plan is None:
+            end = length * self.up
+            count = max(0, -(-(end - self.position) // self.down))
+            times = self.position + np.arange(count) * self.down
+            starts = times // self.up
+            phases = times % self.up
+            rows = count // self.row_outputs
+            row_outputs = rows * self.row_outputs
+
+            weights = None
+            if rows:
+                offsets = starts[:self.row_outputs] - starts[0]
+                weights = np.zeros((offsets[-1] + self.taps, self.row_outputs), dtype=np.float32)
+                for column in range(self.row_outputs):
+                    weights[offsets[column]:offsets[column] + self.taps, column] = self.bank[phases[column]]
+
+            tail = count - row_outputs
+            plan = {
+                "first": int(starts[0]) if count else 0,
+                "rows": rows,
+                "weights": weights,
+                "frames": None,
+                "frames_buffer": None,
+                "tail_starts": starts[row_outputs:],
+                "tail_coefficients": self.bank[phases[row_outputs:]],
+                "tail_windows": np.empty((tail, self.taps), dtype=np.float32),
+                "output": np.empty(count, dtype=np.float32),
+                "samples": np.empty(count, dtype=np.int16),
+                "next_position": self.position + count * self.down - end
+            }
+            # Recorded chunks have one or two sizes, more means someone is feeding odd sizes
+            if len(self.plans) >= 16:
+                self.plans.clear()
+            self.plans[key] = plan
+        return plan
+
+    def process(self, audio_array: np.ndarray) -> np.ndarray:
+        """
+        Resample the next chunk
+
+        Args:
+            audio_array: Input audio as numpy array (int16)
+
+        Returns:
+            Resampled audio as numpy array (int16), reused by the next call for the same chunk size
+        """
+        length = len(audio_array)
+        if self.up == self.down:
+            return audio_array
+        if len(self.buffer) < self.history + length:
+            grown = np.zeros(self.history + length, dtype=np.float32)
+            grown[:self.history] = self.buffer[:self.history]
+            self.buffer = grown
+
+        plan = self._plan(length)
+        end = self.history + length
+        self.buffer[self.history:end] = audio_array
+        output = plan["output"]
+
+        rows = plan["rows"]
+        row_outputs = rows * self.row_outputs
+        if rows:
+            frames = plan["frames"]
+            if frames is None or plan["frames_buffer"] is not self.buffer:
+                # Made once per buffer, the view sees every new chunk copied into the buffer
+                itemsize = self.buffer.itemsize
+                frames = np.lib.stride_tricks.as_strided(
+                    self.buffer[plan["first"]:], shape=(rows, plan["weights"].shape[0]),
+                    strides=(self.down * self.row_outputs // self.up * itemsize, itemsize), writeable=False
+                )
+                plan["frames"] = frames
+                plan["frames_buffer"] = self.buffer
+            np.dot(frames, plan["weights"], out=output[:row_outputs].reshape(rows, self.row_outputs))
+
+        if len(plan["tail_starts"]):
+            windows = np.lib.stride_tricks.sliding_window_view(self.buffer[:end], self.taps)
+            np.take(windows, plan["tail_starts"], axis=0, out=plan["tail_windows"])
+            np.einsum('ij,ij->i', plan["tail_windows"], plan["tail_coefficients"], out=output[row_outputs:])
+
+        np.rint(output, out=output)
+        np.maximum(output, -32768, out=output)
+        np.minimum(output, 32767, out=output)
+        plan["samples"][:] = output
+
+        self.buffer[:self.history] = self.buffer[length:end]
+        self.position = plan["next_position"]
+        return plan["samples"]
+
+
+class IncrementalFlacEncoder:
+    """
+    In-process FLAC encoder (libsndfile through soundfile) fed chunk by chunk
+    while recording, so the compressed audio is ready when recording stops
+    instead of being encoded afterwards. Only the last partial FLAC block is
+    left to encode in finish().
+    """
+
+    def __init__(self, sample_rate: int, compression_level: int = 5):
+        """
+        Args:
+            sample_rate: Audio sample rate
+            compression_level: 0 (fastest) to 8 (smallest), as the flac command's -0 to -8
+        """
+        self.sample_rate = sample_rate
+        self.buffer = io.BytesIO()
+        self.pending = b""
+        self.samples = 0
+        self.error = None
+        try:
+            self.file = soundfile.SoundFile(self.buffer, mode='w', samplerate=sample_rate, channels=1,
+                                            subtype='PCM_16', format='FLAC',
+                                            compression_level=min(max(compression_level, 0), 8) / 8.0)
+        except TypeError:
+            # soundfile < 0.12 has no compression_level, libsndfile uses its default
+            self.file = soundfile.SoundFile(self.buffer, mode='w', samplerate=sample_rate, channels=1,
+                                            subtype='PCM_16', format='FLAC')
+
+    def write(self, chunk: bytes):
+        """Encode one chunk of LINEAR16 audio, errors are kept for finish() so recording goes on"""
+        if self.error is not None:
+            return
+        data = self.pending + chunk
+        usable = len(data) - len(data) % 2
+        self.pending = data[usable:]
+        if usable:
+            try:
+                samples = np.frombuffer(data[:usable], dtype=np.int16)
+                self.file.write(samples)
+                self.samples += len(samples)
+            except Exception as e:
+                logger.error(f"FLAC encoding error: {e}")
+                self.error = e
+
+    def finish(self) -> bytes:
+        """Flush the last block and return the complete FLAC file"""
+        self.file.close()
+        if self.error is not None:
+            raise RuntimeError(f"FLAC encoding failed: {self.error}")
+        return self.buffer.getvalue()
+
+
 class SpeechRecognizer:
     """Google Speech-to-Text REST API integration"""
 
-    def __init__(self, api_key: str, language_code: str = "bg-BG"):
+    def __init__(self, api_key: str, language_code: str = "bg-BG", flac_compression_level: int = 5,
+                 max_alternatives: int = 1):
         """
         Initialize Google Speech client
 
         Args:
             api_key: Google API key for Speech-to-Text
             language_code: Language code (default: bg-BG for Bulgarian)
+            flac_compression_level: FLAC compression 0 (fastest) to 8 (smallest upload)
+            max_alternatives: Transcription alternatives to ask for
         """
         self.api_key = api_key
         self.language_code = language_code
+        self.flac_compression_level = flac_compression_level
+        self.max_alternatives = max_alternatives
         self.api_url = f"https://speech.googleapis.com/v1/speech:recognize?key={api_key}"
+        # Keep-alive TLS connection to Google, reused by every utterance
+        self.session = requests.Session()
 
-    def transcribe_audio(self, audio_data: bytes, sample_rate: int = 16000) -> Optional[str]:
+    def prewarm(self):
+        """Open the connection to Google before the audio is ready, a request to it costs one round trip"""
+        self.session.head("https://speech.googleapis.com/", timeout=5)
+
+    def start_flac_encoder(self, sample_rate: int) -> Optional[IncrementalFlacEncoder]:
+        """
+        Start encoding a recording while it is made
+
+        Returns:
+            Encoder to feed with recorded chunks, None if soundfile is not installed
+        """
+        if not SOUNDFILE_AVAILABLE:
+            return None
+        try:
+            return IncrementalFlacEncoder(sample_rate, self.flac_compression_level)
+        except Exception as e:
+            logger.error(f"Cannot start FLAC encoder: {e}")
+            return None
+
+    def transcribe_audio(self, audio_data: bytes, sample_rate: int = 16000,
+                         flac_data: Optional[bytes] = None) -> Optional[str]:
         """
         Transcribe audio using Google Speech-to-Text REST API
 
         Args:
             audio_data: Raw audio bytes (LINEAR16 format)
             sample_rate: Audio sample rate
+            flac_data: The same audio already encoded to FLAC while recording, if available
 
         Returns:
             Transcribed text or None if recognition failed
         """
+        alternatives = self.transcribe_alternatives(audio_data, sample_rate, flac_data)
+        return alternatives[0][0] if alternatives else None
+
+    def transcribe_alternatives(self, audio_data: bytes, sample_rate: int = 16000,
+                                flac_data: Optional[bytes] = None) -> List[tuple]:
+        """
+        Transcribe audio, with up to max_alternatives alternatives
+
+        Returns:
+            List of (text, confidence or None), most likely first, empty if recognition failed
+        """
         try:
             original_size = len(audio_data)
 
-            # Try to compress audio to FLAC format for much smaller upload
-            print(f"💾 Optimizing audio ({original_size:,} bytes)...")
-            compressed_data, actual_sample_rate, encoding = self._optimize_audio(audio_data, sample_rate)
+            if flac_data and len(flac_data) < original_size * 0.9:
+                # Encoded while recording, nothing left to do
+                compressed_data, actual_sample_rate, encoding = flac_data, sample_rate, "FLAC"
+            else:
+                # Try to compress audio to FLAC format for much smaller upload
+                print(f"💾 Optimizing audio ({original_size:,} bytes)...")
+                compressed_data, actual_sample_rate, encoding = self._optimize_audio(audio_data, sample_rate)
             optimized_size = len(compressed_data)
             compression_ratio = (1 - optimized_size / original_size) * 100 if optimized_size < original_size else 0
             if compression_ratio > 0:
@@ -249,6 +722,7 @@ class SpeechRecognizer:
                     "encoding": encoding,
                     "sampleRateHertz": actual_sample_rate,
                     "languageCode": self.language_code,
+                    "maxAlternatives": self.max_alternatives,
                     "enableAutomaticPunctuation": False
                 },
                 "audio": {
@@ -259,7 +733,7 @@ class SpeechRecognizer:
             logger.info(f"Sending {optimized_size:,} bytes to Google Speech-to-Text API...")
 
             # Make API request with longer timeout
-            response = requests.post(
+            response = self.session.post(
                 self.api_url,
                 json=request_data,
                 headers={"Content-Type": "application/json; charset=utf-8"},
@@ -271,26 +745,30 @@ class SpeechRecognizer:
                 logger.debug(f"Google API response: {result}")
 
                 if "results" in result and len(result["results"]) > 0:
-                    transcript = result["results"][0]["alternatives"][0]["transcript"]
-                    logger.info(f"Transcription: {transcript}")
-                    return transcript.lower()
+                    # Only the first alternative has a confidence
+                    alternatives = [(alternative.get("transcript", "").lower(), alternative.get("confidence"))
+                                    for alternative in result["results"][0]["alternatives"]]
+                    logger.info(f"Transcription: {alternatives[0][0]}")
+                    if len(alternatives) > 1:
+                        logger.debug(f"Alternatives: {[text for text, _ in alternatives[1:]]}")
+                    return alternatives
                 else:
                     logger.warning(f"No transcription results. Full response: {result}")
                     # Check for error in response
                     if "error" in result:
                         logger.error(f"Google API error: {result['error']}")
-                    return None
+                    return []
             else:
                 logger.error(f"API error: {response.status_code} - {response.text}")
-                return None
+                return []
 
         except requests.exceptions.Timeout:
             logger.error("Google API timeout - audio file may be too large or network is slow")
             print("❌ Google API timeout - try speaking less or check your network connection")
-            return None
+            return []
         except Exception as e:
             logger.error(f"Speech recognition error: {e}")
-            return None
+            return []
 
     def _optimize_audio(self, audio_data: bytes, sample_rate: int) -> tuple:
         """
@@ -323,6 +801,28 @@ class SpeechRecognizer:
         """
         Compress raw LINEAR16 audio to FLAC format, or downsample if FLAC not available
 
+        Args:
+            audio_data: Raw LINEAR16 PCM audio bytes
+            sample_rate: Sample rate in Hz
+
+        Returns:
+            FLAC compressed audio bytes (or downsampled LINEAR16)
+        """
+        # In process when soundfile is installed, no temp files or flac process
+        encoder = self.start_flac_encoder(sample_rate)
+        if encoder is not None:
+            try:
+                encoder.write(audio_data)
+                return encoder.finish()
+            except Exception as e:
+                logger.error(f"FLAC encoding error: {e}, trying the flac command")
+
+        return self._compress_with_flac_command(audio_data, sample_rate)
+
+    def _compress_with_flac_command(self, audio_data: bytes, sample_rate: int) -> bytes:
+        """
+        Compress raw LINEAR16 audio with the flac command through temp files
+
         Args:
             audio_data: Raw LINEAR16 PCM audio bytes
             sample_rate: Sample rate in Hz
@@ -355,7 +855,7 @@ class SpeechRecognizer:
             # Use flac command to compress
             cmd = [
                 'flac',
-                '-f', '-s', '--best',
+                '-f', '-s', f'-{min(max(self.flac_compression_level, 0), 8)}',
                 '--endian=little',
                 '--channels=1',
                 '--bps=16',
@@ -413,9 +913,8 @@ class SpeechRecognizer:
             # Convert bytes to numpy array
             audio_array = np.frombuffer(audio_data, dtype=np.int16)
 
-            # Simple decimation (take every Nth sample)
-            decimation_factor = from_rate // to_rate
-            downsampled = audio_array[::decimation_factor]
+            # Low-pass filtered, so nothing above the new Nyquist frequency folds back into speech
+            downsampled = PolyphaseResampler(from_rate, to_rate).process(audio_array)
 
             return downsampled.tobytes()
         except Exception as e:
@@ -423,13 +922,972 @@ class SpeechRecognizer:
             return audio_data
 
 
+class VoskEngine:
+    """Kaldi model through Vosk, e.g. a Bulgarian model unpacked to model_path"""
+
+    name = "vosk"
+    sample_rate = 16000
+
+    def __init__(self, model_path: str, language_code: str = "bg-BG"):
+        if not VOSK_AVAILABLE:
+            raise RuntimeError("vosk not installed - install with: pip install vosk")
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(model_path)
+
+    def recognize(self, audio_array: np.ndarray) -> tuple:
+        """
+        Returns:
+            Tuple of (text, confidence 0-1)
+        """
+        recognizer = vosk.KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.SetWords(True)
+        recognizer.AcceptWaveform(audio_array.tobytes())
+        result = json.loads(recognizer.FinalResult())
+        words = result.get("result", [])
+        confidence = float(np.mean([word.get("conf", 0.0) for word in words])) if words else 0.0
+        return result.get("text", ""), confidence
+
+
+class WhisperEngine:
+    """Whisper model through faster-whisper (CTranslate2), model_path is a converted model or a size like 'small'"""
+
+    name = "whisper"
+    sample_rate = 16000
+
+    def __init__(self, model_path: str, language_code: str = "bg-BG"):
+        if not FASTER_WHISPER_AVAILABLE:
+            raise RuntimeError("faster-whisper not installed - install with: pip install faster-whisper")
+        self.language = language_code.split("-")[0]
+        self.model = WhisperModel(model_path, device="cpu", compute_type="int8")
+
+    def recognize(self, audio_array: np.ndarray) -> tuple:
+        """
+        Returns:
+            Tuple of (text, confidence 0-1)
+        """
+        segments, _ = self.model.transcribe(
+            audio_array.astype(np.float32) / 32768.0,
+            language=self.language,
+            beam_size=1,
+            without_timestamps=True
+        )
+        segments = list(segments)
+        text = " ".join(segment.text.strip() for segment in segments)
+        confidence = float(np.exp(np.mean([segment.avg_logprob for segment in segments]))) if segments else 0.0
+        return text, confidence
+
+
+class LocalSpeechRecognizer:
+    """
+    Offline speech recognition with a model loaded from disk.
+
+    A worker thread loads the model once and keeps it in memory, utterances
+    are queued to it, so a command needs neither the network nor a model load.
+    Recognition that takes longer than timeout (or a model still loading)
+    gives up with None, so a fallback to the cloud isn't held up, and its
+    job is cancelled so a backlog doesn't build up behind a slow utterance.
+    """
+
+    ENGINES = {"vosk": VoskEngine, "whisper": WhisperEngine}
+
+    def __init__(self, engine: str = "vosk", model_path: str = "", language_code: str = "bg-BG",
+                 timeout: float = 5.0):
+        """
+        Args:
+            engine: vosk or whisper
+            model_path: Model directory (for whisper also a model size, e.g. 'small')
+            language_code: Language code, whisper uses the language part
+            timeout: Seconds to wait for a transcription
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown local speech engine '{engine}', expected one of {', '.join(self.ENGINES)}")
+        self.engine_name = engine
+        self.timeout = timeout
+        self.engine = None
+        self.error = None
+        self.ready = threading.Event()
+        self.jobs = queue.Queue()
+        self.worker = threading.Thread(
+            target=self._run,
+            args=(self.ENGINES[engine], model_path, language_code),
+            daemon=True
+        )
+        self.worker.start()
+
+    def _run(self, engine_class, model_path: str, language_code: str):
+        start = time.time()
+        try:
+            self.engine = engine_class(model_path, language_code)
+            logger.info(f"Local speech model loaded ({self.engine_name}: {model_path}) in {time.time() - start:.1f}s")
+        except Exception as e:
+            self.error = e
+            logger.error(f"Failed to load local speech model {model_path}: {e}")
+        finally:
+            self.ready.set()
+        if self.error is not None:
+            return
+
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            if job["cancelled"].is_set():
+                # The caller gave up waiting, don't keep the next utterance behind it
+                logger.debug("Skipping cancelled local speech recognition")
+                job["done"].set()
+                continue
+            try:
+                job["result"] = self.engine.recognize(job["audio"])
+            except Exception as e:
+                logger.error(f"Local speech recognition error: {e}")
+            finally:
+                job["done"].set()
+
+    def recognize(self, audio_data: bytes, sample_rate: int = 16000) -> Optional[tuple]:
+        """
+        Recognize one utterance on the worker thread
+
+        Returns:
+            Tuple of (text, confidence 0-1) or None if recognition failed
+        """
+        if not self.ready.wait(self.timeout):
+            logger.warning("Local speech model still loading")
+            return None
+        if self.error is not None:
+            return None
+
+        audio_array = np.frombuffer(audio_data, dtype=np.int16)
+        if sample_rate != self.engine.sample_rate:
+            audio_array = PolyphaseResampler(sample_rate, self.engine.sample_rate).process(audio_array).copy()
+
+        job = {"audio": audio_array, "result": None, "done": threading.Event(), "cancelled": threading.Event()}
+        self.jobs.put(job)
+        if not job["done"].wait(self.timeout):
+            job["cancelled"].set()
+            logger.warning(f"Local speech recognition took longer than {self.timeout}s")
+            return None
+        return job["result"]
+
+    def transcribe_audio(self, audio_data: bytes, sample_rate: int = 16000,
+                         flac_data: Optional[bytes] = None) -> Optional[str]:
+        """
+        Transcribe audio, same interface as SpeechRecognizer
+
+        Returns:
+            Transcribed text or None if recognition failed
+        """
+        alternatives = self.transcribe_alternatives(audio_data, sample_rate, flac_data)
+        return alternatives[0][0] if alternatives else None
+
+    def transcribe_alternatives(self, audio_data: bytes, sample_rate: int = 16000,
+                                flac_data: Optional[bytes] = None) -> List[tuple]:
+        """
+        Transcribe audio, same interface as SpeechRecognizer, the models give one alternative
+
+        Returns:
+            List of (text, confidence), empty if recognition failed
+        """
+        result = self.recognize(audio_data, sample_rate)
+        if not result or not result[0]:
+            return []
+        return [(result[0].lower(), result[1])]
+
+    def start_flac_encoder(self, sample_rate: int) -> Optional[IncrementalFlacEncoder]:
+        """Nothing is uploaded, no encoding needed"""
+        return None
+
+    def close(self):
+        """Stop the worker"""
+        self.jobs.put(None)
+
+
+class PolicySpeechRecognizer:
+    """
+    Picks the recognizer for each utterance:
+        cloud       - Google only
+        local       - the local model only, works without network
+        local-first - the local model, Google when the local result is empty,
+                      below min_confidence or fails
+    Same interface as SpeechRecognizer.
+    """
+
+    CLOUD = "cloud"
+    LOCAL = "local"
+    LOCAL_FIRST = "local-first"
+    POLICIES = (CLOUD, LOCAL, LOCAL_FIRST)
+
+    def __init__(self, policy: str, cloud: Optional[SpeechRecognizer] = None,
+                 local: Optional[LocalSpeechRecognizer] = None, min_confidence: float = 0.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown speech recognition policy '{policy}', expected one of {', '.join(self.POLICIES)}")
+        if policy != self.LOCAL and cloud is None:
+            raise ValueError(f"Speech recognition policy '{policy}' needs the cloud recognizer")
+        if policy != self.CLOUD and local is None:
+            raise ValueError(f"Speech recognition policy '{policy}' needs the local recognizer")
+        self.policy = policy
+        self.cloud = cloud
+        self.local = local
+        self.min_confidence = min_confidence
+
+    def transcribe_audio(self, audio_data: bytes, sample_rate: int = 16000,
+                         flac_data: Optional[bytes] = None) -> Optional[str]:
+        """
+        Transcribe audio with the recognizers the policy allows
+
+        Returns:
+            Transcribed text or None if recognition failed
+        """
+        alternatives = self.transcribe_alternatives(audio_data, sample_rate, flac_data)
+        return alternatives[0][0] if alternatives else None
+
+    def transcribe_alternatives(self, audio_data: bytes, sample_rate: int = 16000,
+                                flac_data: Optional[bytes] = None) -> List[tuple]:
+        """
+        Transcribe audio with the recognizers the policy allows
+
+        Returns:
+            List of (text, confidence or None), most likely first, empty if recognition failed
+        """
+        if self.policy != self.CLOUD:
+            start = time.time()
+            result = self.local.recognize(audio_data, sample_rate)
+            elapsed = time.time() - start
+            if result and result[0]:
+                text, confidence = result
+                if self.policy == self.LOCAL or confidence >= self.min_confidence:
+                    logger.info(f"Local transcription in {elapsed:.2f}s (confidence {confidence:.2f}): {text}")
+                    return [(text.lower(), confidence)]
+                logger.info(f"Local transcription '{text}' below confidence {self.min_confidence:.2f} "
+                            f"({confidence:.2f}), asking Google")
+            elif self.policy == self.LOCAL_FIRST:
+                logger.info(f"No local transcription after {elapsed:.2f}s, asking Google")
+
+            if self.policy == self.LOCAL:
+                logger.warning("No transcription from the local model")
+                return []
+
+        return self.cloud.transcribe_alternatives(audio_data, sample_rate=sample_rate, flac_data=flac_data)
+
+    def start_flac_encoder(self, sample_rate: int) -> Optional[IncrementalFlacEncoder]:
+        """Encode for upload only when the cloud may be asked"""
+        if self.policy == self.LOCAL:
+            return None
+        return self.cloud.start_flac_encoder(sample_rate)
+
+    def prewarm(self):
+        """Connect to the cloud recognizer when it may be asked"""
+        if self.policy != self.LOCAL:
+            self.cloud.prewarm()
+
+    def close(self):
+        """Stop the local worker"""
+        if self.local:
+            self.local.close()
+
+
+class HttpChunkedStream:
+    """
+    Streams LINEAR16 audio as a chunked HTTP POST and reads the results while
+    the upload is still running. The response is newline-delimited JSON in the
+    shape of Google's StreamingRecognizeResponse, one object per update, e.g.
+    {"results": [{"alternatives": [{"transcript": "..."}], "isFinal": false}]}
+    Works with a streaming proxy in front of Google or with the local stand-in
+    in streaming_server.py.
+    """
+
+    def __init__(self, url: str, sample_rate: int, language_code: str,
+                 on_result: Callable[[str, bool], None], on_error: Callable[[Exception], None],
+                 timeout: float = 10):
+        self.on_result = on_result
+        self.on_error = on_error
+        self.done = threading.Event()
+
+        parsed = urllib.parse.urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.connection = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+
+        query = urllib.parse.urlencode({
+            "encoding": "LINEAR16",
+            "sampleRateHertz": sample_rate,
+            "languageCode": language_code
+        })
+        path = (parsed.path or "/") + "?" + (parsed.query + "&" if parsed.query else "") + query
+
+        self.connection.putrequest("POST", path)
+        self.connection.putheader("Content-Type", f"audio/l16; rate={sample_rate}")
+        self.connection.putheader("Transfer-Encoding", "chunked")
+        self.connection.endheaders()
+
+        # Results are read in parallel with the upload, the server answers before the body ends
+        self.reader = threading.Thread(target=self._read_results, daemon=True)
+        self.reader.start()
+
+    def send(self, chunk: bytes):
+        """Send one chunk of audio"""
+        self.connection.send(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+
+    def close(self):
+        """End the audio, the server sends its final result and closes the response"""
+        self.connection.send(b"0\r\n\r\n")
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for the last result"""
+        return self.done.wait(timeout)
+
+    def _read_results(self):
+        try:
+            response = self.connection.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"Streaming API error: {response.status} - {response.read()[:200]!r}")
+            for line in response:
+                line = line.strip()
+                if not line:
+                    continue
+                message = json.loads(line.decode("utf-8"))
+                if "error" in message:
+                    raise RuntimeError(f"Streaming API error: {message['error']}")
+                for result in message.get("results", []):
+                    alternatives = result.get("alternatives", [])
+                    if alternatives:
+                        self.on_result(alternatives[0].get("transcript", ""), bool(result.get("isFinal", False)))
+        except Exception as e:
+            self.on_error(e)
+        finally:
+            self.done.set()
+            self.connection.close()
+
+
+class GrpcStream:
+    """Streams LINEAR16 audio to Google's streamingRecognize over gRPC (google-cloud-speech)"""
+
+    def __init__(self, client, sample_rate: int, language_code: str,
+                 on_result: Callable[[str, bool], None], on_error: Callable[[Exception], None]):
+        self.client = client
+        self.on_result = on_result
+        self.on_error = on_error
+        self.done = threading.Event()
+        self.chunks = queue.Queue()
+
+        recognition_config = google_speech.RecognitionConfig(
+            encoding=google_speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=language_code
+        )
+        # single_utterance makes Google send the final result as soon as the speech ends
+        self.streaming_config = google_speech.StreamingRecognitionConfig(
+            config=recognition_config,
+            interim_results=True,
+            single_utterance=True
+        )
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def send(self, chunk: bytes):
+        """Send one chunk of audio"""
+        self.chunks.put(chunk)
+
+    def close(self):
+        """End the audio"""
+        self.chunks.put(None)
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for the last result"""
+        return self.done.wait(timeout)
+
+    def _requests(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            yield google_speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    def _run(self):
+        try:
+            for response in self.client.streaming_recognize(self.streaming_config, self._requests()):
+                for result in response.results:
+                    if result.alternatives:
+                        self.on_result(result.alternatives[0].transcript, result.is_final)
+        except Exception as e:
+            self.on_error(e)
+        finally:
+            self.done.set()
+
+
+class StreamingSession:
+    """
+    One utterance streamed to the recognizer while it is being recorded.
+    Feed it with send() from the recording loop, then finish() returns the
+    transcription. If the stream fails the recorded audio goes through the
+    batch recognizer instead, so a command is never lost to the streaming path.
+    """
+
+    def __init__(self, recognizer: "StreamingSpeechRecognizer", sample_rate: int):
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.chunks = []
+        self.final_parts = []
+        self.interim = ""
+        self.error = None
+        self.final = threading.Event()
+        self.lock = threading.Lock()
+        self.stream = None
+        try:
+            self.stream = recognizer.open_stream(sample_rate, self._on_result, self._on_error)
+        except Exception as e:
+            self._on_error(e)
+
+    def send(self, chunk: bytes):
+        """Queue one recorded chunk for recognition"""
+        self.chunks.append(chunk)
+        if self.stream is not None and self.error is None:
+            try:
+                self.stream.send(chunk)
+            except Exception as e:
+                self._on_error(e)
+
+    def has_final(self) -> bool:
+        """True once the recognizer has decided the utterance is over"""
+        return self.final.is_set()
+
+    def finish(self, timeout: float = 5.0) -> Optional[str]:
+        """
+        End the audio and wait for the final result
+
+        Returns:
+            Transcribed text or None if recognition failed
+        """
+        if self.stream is not None and self.error is None:
+            try:
+                self.stream.close()
+                if not self.stream.wait(timeout):
+                    self._on_error(TimeoutError(f"no final result {timeout}s after the end of audio"))
+            except Exception as e:
+                self._on_error(e)
+
+        with self.lock:
+            if self.final_parts:
+                transcript = " ".join(self.final_parts).strip()
+                logger.info(f"Transcription: {transcript}")
+                return transcript.lower()
+            error = self.error
+            interim = self.interim
+
+        if error is not None:
+            logger.warning(f"Streaming recognition failed ({error}), sending the recording in one request")
+            return self.recognizer.fallback.transcribe_audio(b''.join(self.chunks), sample_rate=self.sample_rate)
+        if interim:
+            logger.info(f"No final result, using interim transcription: {interim}")
+            return interim.lower()
+        logger.warning("No transcription results")
+        return None
+
+    def _on_result(self, transcript: str, is_final: bool):
+        with self.lock:
+            if is_final:
+                self.final_parts.append(transcript)
+                self.interim = ""
+            else:
+                self.interim = transcript
+        if is_final:
+            logger.debug(f"Final result: {transcript}")
+            self.final.set()
+        else:
+            logger.debug(f"Interim result: {transcript}")
+
+    def _on_error(self, error: Exception):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        logger.error(f"Streaming recognition error: {error}")
+
+
+class StreamingSpeechRecognizer:
+    """
+    Speech recognition while recording: audio goes out chunk by chunk as it is
+    recorded and results come back incrementally, so the transcription is
+    ready about one round trip after the speech ends instead of after the
+    upload and recognition of the whole recording.
+
+    Transports:
+        grpc - Google streamingRecognize, needs google-cloud-speech
+        http - chunked HTTP POST to url, see HttpChunkedStream
+    """
+
+    def __init__(self, api_key: str, language_code: str = "bg-BG", transport: str = "http",
+                 url: str = "http://localhost:8765/recognize", fallback: Optional[SpeechRecognizer] = None):
+        self.api_key = api_key
+        self.language_code = language_code
+        self.url = url
+        self.fallback = fallback or SpeechRecognizer(api_key, language_code)
+        self.client = None
+
+        if transport == "grpc" and not GOOGLE_SPEECH_GRPC_AVAILABLE:
+            logger.warning("google-cloud-speech not installed - install with: pip install google-cloud-speech")
+            logger.warning("Using HTTP streaming transport instead")
+            transport = "http"
+        self.transport = transport
+
+        if self.transport == "grpc":
+            client_options = {"api_key": api_key} if api_key else None
+            self.client = google_speech.SpeechClient(client_options=client_options)
+            logger.info("Streaming recognition over gRPC (Google streamingRecognize)")
+        else:
+            logger.info(f"Streaming recognition over HTTP: {self.url}")
+
+    def open_stream(self, sample_rate: int, on_result: Callable[[str, bool], None],
+                    on_error: Callable[[Exception], None]):
+        """Open a transport stream for one utterance"""
+        if self.transport == "grpc":
+            return GrpcStream(self.client, sample_rate, self.language_code, on_result, on_error)
+        return HttpChunkedStream(self.url, sample_rate, self.language_code, on_result, on_error)
+
+    def start(self, sample_rate: int = 16000) -> StreamingSession:
+        """Start streaming a new utterance"""
+        return StreamingSession(self, sample_rate)
+
+
+class MfccExtractor:
+    """
+    MFCC features of 16 bit audio, numpy only. The window, mel filter bank
+    and DCT matrix are computed once. Silence before and after the speech is
+    trimmed and the coefficients are mean and variance normalized per
+    utterance, so the microphone and the distance to it matter less.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 25, hop_ms: int = 10,
+                 mel_bands: int = 26, coefficients: int = 13, trim_db: float = 30.0):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.hop = int(sample_rate * hop_ms / 1000)
+        self.fft_size = 1 << (self.frame_length - 1).bit_length()
+        self.trim_db = trim_db
+        self.window = np.hamming(self.frame_length).astype(np.float32)
+
+        # Triangular filters evenly spaced on the mel scale from 0 Hz to Nyquist
+        def to_mel(hz):
+            return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+        def to_hz(mel):
+            return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+        edges = to_hz(np.linspace(0, to_mel(sample_rate / 2), mel_bands + 2))
+        bins = np.floor((self.fft_size + 1) * edges / sample_rate).astype(int)
+        self.mel_filters = np.zeros((mel_bands, self.fft_size // 2 + 1), dtype=np.float32)
+        for band in range(mel_bands):
+            left, center, right = bins[band], bins[band + 1], bins[band + 2]
+            if center > left:
+                self.mel_filters[band, left:center] = (np.arange(left, center) - left) / (center - left)
+            if right > center:
+                self.mel_filters[band, center:right] = (right - np.arange(center, right)) / (right - center)
+
+        # DCT-II, without c0 (loudness)
+        n = np.arange(mel_bands)
+        self.dct = np.cos(np.pi / mel_bands * (n[None, :] + 0.5) * np.arange(1, coefficients)[:, None])
+        self.dct = self.dct.astype(np.float32)
+
+    def features(self, audio_array: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Args:
+            audio_array: 16 bit audio at sample_rate
+
+        Returns:
+            Array of (frames, coefficients - 1), None if there is no speech in it
+        """
+        if len(audio_array) < self.frame_length:
+            return None
+        frames = np.lib.stride_tricks.sliding_window_view(audio_array, self.frame_length)[::self.hop]
+        frames = frames.astype(np.float32) * self.window
+        power = np.abs(np.fft.rfft(frames, self.fft_size)) ** 2
+
+        # Trim quiet frames at both ends
+        energy_db = 10 * np.log10(power.sum(axis=1) + 1e-10)
+        loud = np.nonzero(energy_db > energy_db.max() - self.trim_db)[0]
+        power = power[loud[0]:loud[-1] + 1]
+        if len(power) < 5:
+            return None
+
+        mfcc = np.log(power @ self.mel_filters.T + 1e-10) @ self.dct.T
+        return (mfcc - mfcc.mean(axis=0)) / (mfcc.std(axis=0) + 1e-5)
+
+
+class CommandSpotter:
+    """
+    Recognizes the fixed command phrases on the device, without speech to
+    text, by comparing the utterance with a few recorded samples of every
+    command (MFCC templates, dynamic time warping).
+
+    Samples are 16 bit mono WAV files in samples_dir/<command phrase>/, the
+    phrase being a key of CommandProcessor.commands, recorded with
+    record_spotter_samples.py. A match is only reported when it is close
+    (max_distance) and clearly closer than any other command (min_confidence),
+    everything else goes to speech recognition as before.
+    """
+
+    def __init__(self, samples_dir: str, commands: Optional[List[str]] = None,
+                 max_distance: float = 1.8, min_confidence: float = 0.3):
+        """
+        Args:
+            samples_dir: Directory with a subdirectory of WAV samples per command
+            commands: Command phrases to load, None loads every subdirectory
+            max_distance: Largest average frame distance that can still match
+            min_confidence: How much closer the best command must be than the next one (0-1)
+        """
+        self.samples_dir = samples_dir
+        self.max_distance = max_distance
+        self.min_confidence = min_confidence
+        self.extractor = MfccExtractor()
+        self.templates = {}
+        self._load(commands)
+
+    def _load(self, commands: Optional[List[str]]):
+        if not os.path.isdir(self.samples_dir):
+            logger.warning(f"Command spotter samples not found at {self.samples_dir}")
+            return
+        for phrase in sorted(os.listdir(self.samples_dir)):
+            directory = os.path.join(self.samples_dir, phrase)
+            if not os.path.isdir(directory):
+                continue
+            if commands is not None and phrase not in commands:
+                logger.warning(f"Command spotter samples for unknown command '{phrase}', skipped")
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith(".wav"):
+                    continue
+                try:
+                    audio_array, sample_rate = self.read_wav(os.path.join(directory, name))
+                    features = self._features(audio_array, sample_rate)
+                    if features is not None:
+                        self.templates.setdefault(phrase, []).append(features)
+                except Exception as e:
+                    logger.warning(f"Cannot load spotter sample {name} of '{phrase}': {e}")
+        samples = sum(len(templates) for templates in self.templates.values())
+        logger.info(f"Command spotter: {samples} samples of {len(self.templates)} commands")
+        if len(self.templates) < 2:
+            logger.warning("Command spotter needs samples of at least 2 commands to tell them apart")
+
+    @staticmethod
+    def read_wav(path: str) -> tuple:
+        """
+        Returns:
+            Tuple of (int16 audio array, sample rate)
+        """
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError("not a 16 bit mono WAV")
+            return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16), wav.getframerate()
+
+    def _features(self, audio_array: np.ndarray, sample_rate: int) -> Optional[np.ndarray]:
+        if sample_rate != self.extractor.sample_rate:
+            audio_array = PolyphaseResampler(sample_rate, self.extractor.sample_rate).process(audio_array)
+        return self.extractor.features(audio_array)
+
+    @staticmethod
+    def dtw_distance(utterance: np.ndarray, template: np.ndarray) -> float:
+        """
+        Average frame distance along the best alignment. Each utterance frame
+        moves 0, 1 or 2 template frames on, so a row of the cost matrix only
+        depends on the row before and is computed as one vector operation.
+        """
+        if len(utterance) > 2.5 * len(template) or len(template) > 2.5 * len(utterance):
+            return np.inf
+        # Euclidean frame distances through one matrix product
+        squared = ((utterance ** 2).sum(axis=1)[:, None] + (template ** 2).sum(axis=1)[None, :]
+                   - 2 * utterance @ template.T)
+        cost = np.sqrt(np.maximum(squared, 0))
+
+        previous = np.full(len(template) + 2, np.inf)
+        previous[2] = cost[0, 0]
+        current = np.full(len(template) + 2, np.inf)
+        for row in cost[1:]:
+            np.minimum(previous[2:], previous[1:-1], out=current[2:])
+            np.minimum(current[2:], previous[:-2], out=current[2:])
+            current[2:] += row
+            previous, current = current, previous
+        return previous[-1] / len(utterance)
+
+    def spot(self, audio_data: bytes, sample_rate: int = 16000) -> Optional[tuple]:
+        """
+        Match an utterance against the command samples
+
+        Returns:
+            Tuple of (command phrase, confidence 0-1) for a sure match, None otherwise
+        """
+        if len(self.templates) < 2:
+            return None
+        start = time.time()
+        features = self._features(np.frombuffer(audio_data, dtype=np.int16), sample_rate)
+        if features is None:
+            return None
+
+        distances = {
+            phrase: min(self.dtw_distance(features, template) for template in templates)
+            for phrase, templates in self.templates.items()
+        }
+        ranked = sorted(distances, key=distances.get)
+        best, runner_up = distances[ranked[0]], distances[ranked[1]]
+        confidence = 1.0 - best / runner_up if np.isfinite(runner_up) and runner_up > 0 else 1.0
+        elapsed = time.time() - start
+
+        if best <= self.max_distance and confidence >= self.min_confidence:
+            logger.info(f"Command spotted in {elapsed * 1000:.0f}ms: '{ranked[0]}' "
+                        f"(distance {best:.2f}, confidence {confidence:.2f})")
+            return ranked[0], confidence
+        logger.info(f"No sure command match in {elapsed * 1000:.0f}ms (best '{ranked[0]}' "
+                    f"distance {best:.2f}, confidence {confidence:.2f})")
+        return None
+
+
+class CommandMatcher:
+    """
+    Finds command phrases in transcriptions.
+
+    Words are reduced to stems (lower case, Bulgarian article, plural and
+    imperative endings removed), so "светни лампите" matches the phrase
+    "светни лампа". The phrases are compiled into an Aho-Corasick automaton
+    over stems, so one pass over the words finds every phrase in them however
+    many phrases there are. Words that are not stems of any phrase are
+    corrected to the closest one within a few edits, found through an index of
+    deletions (no scan of the vocabulary). "{number}" in a phrase matches a
+    number, "лампа {number} процента" matches "лампа 30%" with the parameter 30.
+    """
+
+    NUMBER = "{number}"
+    # Longest first, a stem keeps at least MIN_STEM letters
+    SUFFIXES = ("ищата", "ището", "овете", "ите", "ата", "ята", "ето", "ове", "еве", "ища", "ете",
+                "ът", "ят", "та", "то", "те", "а", "я", "е", "и", "о", "у", "ъ")
+    MIN_STEM = 3
+    # Corrections of unknown words kept, least recently used ones are forgotten
+    CORRECTIONS_SIZE = 4096
+    WORD = re.compile(r"\{number\}|[-+−]?\d+|%|[^\W\d_]+")
+
+    def __init__(self, phrases: List[str], edit_penalty: float = 0.75, alternative_penalty: float = 0.9):
+        """
+        Args:
+            phrases: Command phrases
+            edit_penalty: Score taken off a match per corrected letter, a phrase word scores 1
+            alternative_penalty: Score factor per place a transcription alternative is further down
+        """
+        self.phrases = []
+        self.edit_penalty = edit_penalty
+        self.alternative_penalty = alternative_penalty
+
+        self.vocabulary = {}   # stem -> id
+        self.stems = []        # id -> stem
+        self.deletions = {}    # stem with letters deleted -> ids of the stems it comes from
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        seen = {}
+        for phrase in phrases:
+            ids = tuple(self._stem_id(stem) for stem, _ in self.normalize(phrase))
+            if not ids:
+                continue
+            if ids in seen:
+                logger.warning(f"Command phrases '{seen[ids]}' and '{phrase}' are the same after normalization")
+                continue
+            seen[ids] = phrase
+            self._add_phrase(len(self.phrases), ids)
+            self.phrases.append((phrase, ids))
+        self._link()
+        self.corrections = OrderedDict()
+
+    @classmethod
+    def stem(cls, word: str) -> str:
+        for suffix in cls.SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= cls.MIN_STEM:
+                return word[:-len(suffix)]
+        return word
+
+    @classmethod
+    def normalize(cls, text: str) -> List[tuple]:
+        """
+        Split text into stems
+
+        Returns:
+            List of (stem, number or None), numbers have the stem NUMBER, signed ones the number None
+        """
+        words = []
+        for word in cls.WORD.findall(text.lower()):
+            if word.isdigit():
+                words.append((cls.NUMBER, int(word)))
+            elif word[1:].isdigit():
+                # Signed numbers are no valid parameter, "-5%" is rejected rather than read as 5%
+                words.append((cls.NUMBER, None))
+            elif word == cls.NUMBER:
+                words.append((cls.NUMBER, None))
+            elif word == "%":
+                words.append((cls.stem("процента"), None))
+            else:
+                words.append((cls.stem(word), None))
+        return words
+
+    @staticmethod
+    def max_edits(stem: str) -> int:
+        """Corrected letters allowed for a stem, short stems must match exactly"""
+        if len(stem) < 3:
+            return 0
+        return 1 if len(stem) < 7 else 2
+
+    @staticmethod
+    def _deletions(word: str, edits: int) -> set:
+        """The word with up to edits letters deleted"""
+        result = {word}
+        current = {word}
+        for _ in range(edits):
+            current = {item[:i] + item[i + 1:] for item in current for i in range(len(item))}
+            result |= current
+        return result
+
+    @staticmethod
+    def edit_distance(a: str, b: str, limit: int) -> int:
+        """Levenshtein distance, anything above limit is returned as limit + 1"""
+        if abs(len(a) - len(b)) > limit:
+            return limit + 1
+        previous = list(range(len(b) + 1))
+        for i, ca in enumerate(a, 1):
+            current = [i]
+            for j, cb in enumerate(b, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+            if min(current) > limit:
+                return limit + 1
+            previous = current
+        return previous[-1]
+
+    def _stem_id(self, stem: str) -> int:
+        if stem not in self.vocabulary:
+            self.vocabulary[stem] = len(self.stems)
+            self.stems.append(stem)
+            if stem != self.NUMBER:
+                for deletion in self._deletions(stem, self.max_edits(stem)):
+                    self.deletions.setdefault(deletion, []).append(self.vocabulary[stem])
+        return self.vocabulary[stem]
+
+    def _add_phrase(self, index: int, ids: tuple):
+        node = 0
+        for stem_id in ids:
+            if stem_id not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][stem_id] = len(self.goto) - 1
+            node = self.goto[node][stem_id]
+        self.output[node].append(index)
+
+    def _link(self):
+        """Failure links, breadth first"""
+        pending = list(self.goto[0].values())
+        while pending:
+            node = pending.pop(0)
+            for stem_id, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and stem_id not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(stem_id, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+                pending.append(child)
+
+    def correct(self, stem: str) -> tuple:
+        """
+        Closest phrase stem
+
+        Returns:
+            Tuple of (stem id, corrected letters), (None, 0) if none is close enough
+        """
+        if stem in self.vocabulary:
+            return self.vocabulary[stem], 0
+        if stem == self.NUMBER:
+            return None, 0
+        if stem in self.corrections:
+            self.corrections.move_to_end(stem)
+        else:
+            best = (None, 0)
+            if len(stem) >= 3:
+                candidates = {stem_id for deletion in self._deletions(stem, 2)
+                              for stem_id in self.deletions.get(deletion, ())}
+                for stem_id in sorted(candidates):
+                    limit = self.max_edits(self.stems[stem_id])
+                    distance = self.edit_distance(stem, self.stems[stem_id], limit)
+                    if distance <= limit and (best[0] is None or distance < best[1]):
+                        best = (stem_id, distance)
+            self.corrections[stem] = best
+            if len(self.corrections) > self.CORRECTIONS_SIZE:
+                self.corrections.popitem(last=False)
+        return self.corrections[stem]
+
+    def match_text(self, text: str) -> Optional[tuple]:
+        """
+        Best phrase in one transcription
+
+        Returns:
+            Tuple of (phrase, parameters, score) or None
+        """
+        words = self.normalize(text)
+        best = None
+        node = 0
+        edits = [0]
+        for position, (stem, number) in enumerate(words):
+            stem_id, distance = self.correct(stem)
+            edits.append(edits[-1] + distance)
+            if stem_id is None:
+                node = 0
+                continue
+            while node and stem_id not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(stem_id, 0)
+
+            for index in self.output[node]:
+                phrase, ids = self.phrases[index]
+                start = position + 1 - len(ids)
+                score = len(ids) - self.edit_penalty * (edits[position + 1] - edits[start])
+                if score > 0 and (best is None or score > best[2]):
+                    parameters = tuple(words[start + i][1] for i, stem_id in enumerate(ids)
+                                       if self.stems[stem_id] == self.NUMBER)
+                    best = (phrase, parameters, score)
+        return best
+
+    def match(self, alternatives: List[tuple]) -> Optional[tuple]:
+        """
+        Best phrase in any of the transcription alternatives
+
+        Args:
+            alternatives: (text, confidence or None), most likely first
+
+        Returns:
+            Tuple of (phrase, parameters, score) or None
+        """
+        best = None
+        for rank, (text, _) in enumerate(alternatives):
+            found = self.match_text(text or "")
+            if found:
+                phrase, parameters, score = found
+                score *= self.alternative_penalty ** rank
+                if best is None or score > best[2]:
+                    best = (phrase, parameters, score)
+        return best
+
+
 class CommandProcessor:
     """Process voice commands and execute actions"""
 
-    def __init__(self, config: VoiceControlConfig, audio_player: AudioPlayer):
+    COMMANDS_PATH = "/usr/local/bin/home-iot/voice_commands.ini"
+
+    def __init__(self, config: VoiceControlConfig, audio_player: AudioPlayer, api_app=None):
+        """
+        Args:
+            config: Voice control configuration
+            audio_player: Plays the replies
+            api_app: The home-iot Flask app when running in the API server process,
+                     its views are then called directly instead of over HTTP
+        """
         self.config = config
         self.audio_player = audio_player
         self.api_base_url = f"http://{config.get('api_server_address')}:{config.get('listen_port')}"
+        # Keep-alive connections to the API server, reused by every command
+        self.session = requests.Session()
+        self.api_client = api_app.test_client() if api_app is not None else None
 
         # MQTT setup
         self.mqtt_client = mqtt.Client()
@@ -441,26 +1899,83 @@ class CommandProcessor:
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
 
-        # Define command mappings (Bulgarian commands)
-        self.commands = {
+        # Actions the command phrases can run, the ones with {number} get the number
+        self.actions = {
             # Shutters
-            "вдигни щори": self._open_shutters,
-            "пусни щори": self._close_shutters,
+            "open_shutters": self._open_shutters,
+            "close_shutters": self._close_shutters,
+            "shutters_position": self._shutters_position,
 
             # Lights
-            "светни ламп": self._lights_on,
-            "пусни ламп": self._lights_on,
-            "гаси ламп": self._lights_off,
-            "мека светлина": self._lights_soft,
-            "романтика": self._lights_soft,
-            "намали ламп": self._lights_soft,
-            "усили ламп": self._lights_bright,
+            "lights_on": self._lights_on,
+            "lights_off": self._lights_off,
+            "lights_soft": self._lights_soft,
+            "lights_bright": self._lights_bright,
+            "lights_brightness": self._lights_brightness,
 
             # Vacuum
-            "пусни прахосмукачка": self._vacuum_start,
-            "при прахосмукачка": self._vacuum_dock,
+            "vacuum_start": self._vacuum_start,
+            "vacuum_dock": self._vacuum_dock,
+        }
+        # Accepted range of the number of the actions that take one, checked before the reply plays
+        self.parameter_ranges = {
+            "shutters_position": (0, 100),
+            "lights_brightness": (1, 100),
         }
 
+        # Command phrases (Bulgarian) -> action, read again when the file changes
+        self.commands_path = config.get('voice_commands', self.COMMANDS_PATH)
+        if not os.path.exists(self.commands_path):
+            logger.info(f"{self.commands_path} not found, using the default voice commands")
+            self.commands_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default_voice_commands.ini')
+        self.commands_mtime = None
+        self.commands = {}
+        self.matcher = CommandMatcher([])
+        self.reload_commands()
+
+    def reload_commands(self) -> bool:
+        """
+        Read the command phrases again if the file has changed
+
+        Returns:
+            True if they were read
+        """
+        import configparser
+
+        try:
+            mtime = os.stat(self.commands_path).st_mtime
+        except OSError as e:
+            if self.commands_mtime is None:
+                logger.error(f"Cannot read voice commands: {e}")
+                self.commands_mtime = 0
+            return False
+        if mtime == self.commands_mtime:
+            return False
+        self.commands_mtime = mtime
+
+        try:
+            parser = configparser.ConfigParser()
+            parser.read(self.commands_path, encoding='utf-8')
+            commands = {}
+            for action in parser.sections():
+                if action not in self.actions:
+                    logger.error(f"Unknown action [{action}] in {self.commands_path}, "
+                                 f"expected one of {', '.join(self.actions)}")
+                    continue
+                for phrase in parser[action].get('phrases', '').splitlines():
+                    phrase = phrase.strip().lower()
+                    if phrase:
+                        commands[phrase] = action
+            matcher = CommandMatcher(list(commands))
+        except Exception as e:
+            logger.error(f"Cannot load voice commands from {self.commands_path}, keeping the old ones: {e}")
+            return False
+
+        self.commands = commands
+        self.matcher = matcher
+        logger.info(f"Loaded {len(commands)} command phrases from {self.commands_path}")
+        return True
+
     def process_command(self, text: str) -> bool:
         """
         Process transcribed text and execute matching command
@@ -470,26 +1985,63 @@ class CommandProcessor:
         """
         if not text:
             return False
+        return self.process_alternatives([(text, None)])
+
+    def process_alternatives(self, alternatives: List[tuple]) -> bool:
+        """
+        Execute the command found in any of the transcription alternatives
 
-        text = text.lower().strip()
-        logger.info(f"Processing command: {text}")
+        Args:
+            alternatives: (text, confidence or None), most likely first
 
-        # Check each command pattern
-        for pattern, action in self.commands.items():
-            if pattern in text:
-                logger.info(f"Command recognized: {pattern}")
-                self.audio_player.play_reply("CommandAccepted", 2)
-                try:
-                    action()
-                    return True
-                except Exception as e:
-                    logger.error(f"Error executing command: {e}")
-                    return False
+        Returns:
+            True if command was recognized, False otherwise
+        """
+        self.reload_commands()
+        logger.info(f"Processing command: {' | '.join(text for text, _ in alternatives)}")
+
+        start = time.time()
+        match = self.matcher.match(alternatives)
+        if match:
+            phrase, parameters, score = match
+            logger.debug(f"Matched '{phrase}' {parameters} (score {score:.2f}) in {(time.time() - start) * 1000:.1f}ms")
+            return self.execute_command(phrase, parameters)
 
         logger.info("No command recognized")
         self.audio_player.play_reply("UnknownCommand", 4)
         return False
 
+    def execute_command(self, pattern: str, parameters: tuple = ()) -> bool:
+        """
+        Execute a recognized command
+
+        Args:
+            pattern: Key of self.commands
+            parameters: Numbers said for the {number} places of the phrase
+
+        Returns:
+            True if the command ran, False if it failed
+        """
+        logger.info(f"Command recognized: {pattern} {' '.join(map(str, parameters))}".rstrip())
+        action = self.commands[pattern]
+        limits = self.parameter_ranges.get(action)
+        if None in parameters:
+            logger.warning(f"{action}: signed numbers are not supported")
+            self.audio_player.play_reply("UnknownCommand", 4)
+            return False
+        if limits and not all(limits[0] <= value <= limits[1] for value in parameters):
+            logger.warning(f"{action}: {' '.join(map(str, parameters))} out of range {limits[0]}-{limits[1]}")
+            self.audio_player.play_reply("UnknownCommand", 4)
+            return False
+        # Returns right away, the device is switched while the confirmation plays
+        self.audio_player.play_reply("CommandAccepted", 2)
+        try:
+            self.actions[action](*parameters)
+            return True
+        except Exception as e:
+            logger.error(f"Error executing command: {e}")
+            return False
+
     # Command implementations using API and MQTT
 
     def _open_shutters(self):
@@ -502,6 +2054,11 @@ class CommandProcessor:
         self.mqtt_client.publish('shutters/command', 'CLOSE')
         logger.info("Sent CLOSE to shutters/command")
 
+    def _shutters_position(self, percent: int):
+        """Move shutters to a position via MQTT, percent open"""
+        self.mqtt_client.publish('shutters/command', f'POSITION {percent}%')
+        logger.info(f"Sent POSITION {percent}% to shutters/command")
+
     def _lights_on(self):
         """Turn lights on via API"""
         self.audio_player.play_reply("Lights", 1)
@@ -522,6 +2079,11 @@ class CommandProcessor:
         self.audio_player.play_reply("Lights", 1)
         self._call_api("/homeiot/api/v1.0/lightsbrighten", method="GET")
 
+    def _lights_brightness(self, percent: int):
+        """Turn lights on at a brightness via API"""
+        self.audio_player.play_reply("Lights", 1)
+        self._call_api("/homeiot/api/v1.0/lights", {"state": "ON", "brightness": percent})
+
     def _vacuum_start(self):
         """Start vacuum via API"""
         self._call_api("/homeiot/api/v1.0/mirobo/clean", method="GET")
@@ -530,16 +2092,31 @@ class CommandProcessor:
         """Send vacuum to dock via API"""
         self._call_api("/homeiot/api/v1.0/mirobo/dock", method="GET")
 
+    def prewarm(self):
+        """Open the connection to the API server before the command is known"""
+        if self.api_client is None:
+            self.session.get(f"{self.api_base_url}/homeiot/api/v1.0/test", timeout=2)
+
     def _call_api(self, endpoint: str, data: dict = None, method: str = "POST"):
         """Make API call to home-iot server"""
         try:
+            if self.api_client is not None:
+                # Same process as the API server, no HTTP
+                logger.info(f"Calling API in process: {method} {endpoint}")
+                response = self.api_client.open(endpoint, method=method, data=data)
+                if response.status_code < 400:
+                    logger.info(f"API call successful: {response.get_json()}")
+                else:
+                    logger.error(f"API call failed: {response.status_code}")
+                return
+
             url = f"{self.api_base_url}{endpoint}"
             logger.info(f"Calling API: {method} {url}")
 
             if method == "POST":
-                response = requests.post(url, data=data, timeout=10)
+                response = self.session.post(url, data=data, timeout=10)
             else:
-                response = requests.get(url, timeout=10)
+                response = self.session.get(url, timeout=10)
 
             if response.ok:
                 logger.info(f"API call successful: {response.json()}")
@@ -700,6 +2277,326 @@ class AudioRecorder:
         self.audio.terminate()
 
 
+class AudioRingBuffer:
+    """
+    The last capacity samples of the microphone in a preallocated array.
+    position counts every sample ever written, readers keep their own
+    position in that count, so several of them can read the same audio and
+    go back in time as far as the capacity allows.
+
+    There is one writer and no locks, the PyAudio callback never waits: the
+    writer publishes write_end before copying samples in and position after,
+    readers poll position and check that what they copied was not overwritten
+    meanwhile. With shared=True the samples and counters are in shared memory,
+    so the writer can be another process (CaptureProcess).
+    """
+
+    # Counters in front of the samples
+    POSITION, WRITE_END, CLOSED, OVERFLOWS, DROPPED, STOP = range(6)
+    COUNTERS = 6
+
+    def __init__(self, capacity: int, shared: bool = False, name: Optional[str] = None,
+                 poll_interval: float = 0.005):
+        """
+        Args:
+            capacity: Samples kept
+            shared: Allocate in shared memory
+            name: Attach to the shared memory of an existing ring instead (in another process)
+            poll_interval: Seconds between checks while readers wait for audio
+        """
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.shm = None
+        size = self.COUNTERS * 8 + capacity * 2
+        if shared or name:
+            from multiprocessing import shared_memory
+            self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+            memory = self.shm.buf
+        else:
+            memory = bytearray(size)
+        self.counters = np.ndarray((self.COUNTERS,), dtype=np.int64, buffer=memory)
+        self.buffer = np.ndarray((capacity,), dtype=np.int16, buffer=memory, offset=self.COUNTERS * 8)
+        if name is None:
+            self.counters[:] = 0
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.shm.name if self.shm else None
+
+    def _load(self, index: int) -> int:
+        # A 64 bit store is two stores on 32 bit ARM, read until two reads agree
+        while True:
+            value = int(self.counters[index])
+            if value == int(self.counters[index]):
+                return value
+
+    @property
+    def position(self) -> int:
+        return self._load(self.POSITION)
+
+    @property
+    def write_end(self) -> int:
+        """Where the write in progress ends, samples before write_end - capacity may be overwritten already"""
+        return self._load(self.WRITE_END)
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.counters[self.CLOSED])
+
+    @property
+    def overflows(self) -> int:
+        """Times the audio device lost input because it was not read in time"""
+        return self._load(self.OVERFLOWS)
+
+    @property
+    def dropped(self) -> int:
+        """Samples readers skipped because they fell more than the capacity behind"""
+        return self._load(self.DROPPED)
+
+    def write(self, samples: np.ndarray):
+        """Append samples, overwriting the oldest"""
+        position = self.position
+        end = position + len(samples)
+        if len(samples) > self.capacity:
+            # Only the last capacity samples fit, the positions still count all of them
+            samples = samples[-self.capacity:]
+        self.counters[self.WRITE_END] = end
+        start = (end - len(samples)) % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.counters[self.POSITION] = end
+
+    def add_overflow(self):
+        self.counters[self.OVERFLOWS] += 1
+
+    def add_dropped(self, samples: int):
+        self.counters[self.DROPPED] += samples
+
+    def close(self):
+        """No more audio, wake up the readers"""
+        self.counters[self.CLOSED] = 1
+
+    def request_stop(self):
+        """Ask the capture process to stop"""
+        self.counters[self.STOP] = 1
+
+    @property
+    def stop_requested(self) -> bool:
+        return bool(self.counters[self.STOP])
+
+    def release(self, unlink: bool = True):
+        """Free the shared memory, unlink it only in the process that created it"""
+        if self.shm:
+            self.counters = self.counters.copy()
+            self.buffer = self.buffer.copy()
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+            self.shm = None
+
+    def wait_for(self, position: int, timeout: float) -> bool:
+        """Wait until the audio up to position is written"""
+        deadline = time.monotonic() + timeout
+        while self.position < position:
+            if self.closed or time.monotonic() >= deadline:
+                return self.position >= position
+            time.sleep(self.poll_interval)
+        return True
+
+    def oldest(self) -> int:
+        """Position of the oldest sample that is still in the buffer and not being overwritten"""
+        return max(0, self.write_end - self.capacity)
+
+    def copy(self, start: int, out: np.ndarray) -> bool:
+        """
+        Copy the samples from position start into out
+
+        Returns:
+            False if part of them was overwritten meanwhile
+        """
+        if start < self.oldest():
+            return False
+        offset = start % self.capacity
+        first = min(len(out), self.capacity - offset)
+        out[:first] = self.buffer[offset:offset + first]
+        out[first:] = self.buffer[:len(out) - first]
+        # The writer may have lapped us while copying
+        return start >= self.oldest()
+
+    def history(self, start: int, end: int) -> np.ndarray:
+        """Copy of the samples between two positions, clipped to what is still buffered"""
+        start = max(start, self.oldest())
+        end = min(end, self.position)
+        out = np.empty(max(0, end - start), dtype=np.int16)
+        if len(out) and not self.copy(start, out):
+            return out[:0]
+        return out
+
+
+class AudioCapture:
+    """Fills an AudioRingBuffer from the PyAudio callback, so no audio is lost while the
+    reading side is busy (wake word inference, playing a reply, recognizing speech)"""
+
+    def __init__(self, audio, ring: AudioRingBuffer, sample_rate: int, chunk_size: int,
+                 device_index: Optional[int] = None):
+        self.audio = audio
+        self.ring = ring
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.device_index = device_index
+        self.stream = None
+
+    def start(self):
+        self.stream = self.audio.open(
+            rate=self.sample_rate,
+            channels=1,
+            format=pyaudio.paInt16,
+            input=True,
+            frames_per_buffer=self.chunk_size,
+            input_device_index=self.device_index,
+            stream_callback=self._callback
+        )
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            self.ring.add_overflow()
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        return None, pyaudio.paContinue
+
+    def is_active(self) -> bool:
+        return self.stream is not None and self.stream.is_active()
+
+    def stop(self):
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception as e:
+                logger.error(f"Error closing audio capture: {e}")
+            self.stream = None
+        self.ring.close()
+
+
+def _run_capture_process(ring_name: str, capacity: int, sample_rate: int, chunk_size: int,
+                         device_index: Optional[int]):
+    """Body of CaptureProcess, runs the capture until the ring asks it to stop"""
+    ring = AudioRingBuffer(capacity, name=ring_name)
+    audio = pyaudio.PyAudio()
+    capture = AudioCapture(audio, ring, sample_rate, chunk_size, device_index)
+    try:
+        capture.start()
+        while not ring.stop_requested and capture.is_active():
+            time.sleep(0.1)
+    except Exception as e:
+        logger.error(f"Audio capture process error: {e}")
+    finally:
+        capture.stop()
+        audio.terminate()
+        ring.release(unlink=False)
+
+
+class CaptureProcess:
+    """
+    Runs AudioCapture in a child process writing into a shared memory ring.
+    The callback then never waits for the interpreter lock of the process
+    doing wake word inference, VAD and recording, and the two run on
+    different cores.
+
+    The child is spawned, so it imports the script that was started again:
+    that script must only start things under if __name__ == "__main__"
+    (voice_control_modern.py and main.py do).
+    """
+
+    def __init__(self, ring: AudioRingBuffer, sample_rate: int, chunk_size: int,
+                 device_index: Optional[int] = None):
+        if ring.name is None:
+            raise ValueError("CaptureProcess needs a ring buffer in shared memory")
+        self.ring = ring
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.device_index = device_index
+        self.process = None
+
+    def start(self):
+        import multiprocessing
+
+        # A fresh interpreter, PortAudio does not survive fork
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=_run_capture_process,
+            args=(self.ring.name, self.ring.capacity, self.sample_rate, self.chunk_size, self.device_index),
+            name="audio-capture",
+            daemon=True
+        )
+        self.process.start()
+        logger.info(f"Audio capture process started (pid {self.process.pid})")
+
+    def stop(self):
+        self.ring.request_stop()
+        if self.process:
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        self.ring.close()
+
+
+class RingBufferReader:
+    """
+    Reads an AudioRingBuffer like a PyAudio input stream, from a position on.
+    A reader that falls more than the capacity behind skips to the oldest
+    buffered audio and counts the samples it lost in dropped.
+    """
+
+    def __init__(self, ring: AudioRingBuffer, position: Optional[int] = None, timeout: float = 2.0):
+        self.ring = ring
+        self.position = ring.position if position is None else position
+        self.timeout = timeout
+        self.dropped = 0
+        self.buffers = {}
+
+    def read_array(self, frames: int) -> np.ndarray:
+        """
+        Next frames samples, in a buffer reused by the next read of the same size
+
+        Raises:
+            ValueError: if frames is more than the ring holds
+            IOError: if the capture stopped or no audio arrived within timeout
+        """
+        if frames > self.ring.capacity:
+            raise ValueError(f"Cannot read {frames} samples at once from a ring buffer of {self.ring.capacity}")
+        out = self.buffers.get(frames)
+        if out is None:
+            out = self.buffers[frames] = np.empty(frames, dtype=np.int16)
+        while True:
+            if not self.ring.wait_for(self.position + frames, self.timeout):
+                raise IOError("Audio capture stopped" if self.ring.closed else "No audio from the microphone")
+            oldest = self.ring.oldest()
+            if self.position < oldest:
+                logger.warning(f"Audio reader fell behind, skipping {oldest - self.position} samples")
+                self.dropped += oldest - self.position
+                self.ring.add_dropped(oldest - self.position)
+                self.position = oldest
+                continue
+            if self.ring.copy(self.position, out):
+                self.position += frames
+                return out
+
+    def read(self, frames: int, exception_on_overflow: bool = False) -> bytes:
+        """Same as PyAudio's Stream.read"""
+        return self.read_array(frames).tobytes()
+
+    def seek(self, position: int):
+        """Continue reading from position, e.g. the current ring position to skip audio"""
+        self.position = position
+
+    def backlog(self) -> int:
+        """Samples written but not read yet"""
+        return self.ring.position - self.position
+
+
 class WakeWordDetector:
     """Wake word detection using OpenWakeWord or simple volume-based detection"""
 
@@ -710,7 +2607,9 @@ class WakeWordDetector:
         device_index: Optional[int] = None,
         volume_threshold: int = 2000,
         show_volume_meter: bool = False,
-        force_sample_rate: Optional[int] = None
+        force_sample_rate: Optional[int] = None,
+        ring_seconds: float = 10.0,
+        capture_process: bool = False
     ):
         """
         Initialize wake word detector
@@ -725,8 +2624,15 @@ class WakeWordDetector:
             volume_threshold: RMS volume threshold for simple detection
             show_volume_meter: Show live audio volume meter during wake word detection
             force_sample_rate: Force a specific sample rate (e.g., 16000) instead of auto-detection
+            ring_seconds: Seconds of microphone audio kept in the ring buffer, covers the audio before
+                          the wake word and everything recorded while a reply plays
+            capture_process: Capture the microphone in a separate process (shared memory ring buffer),
+                             so detection and recording get this process and core to themselves
         """
         self.device_index = device_index
+        self.ring_seconds = ring_seconds
+        self.capture_process = capture_process
+        self.ring = None
         self.threshold = threshold
         self.show_volume_meter = show_volume_meter
         self.audio = pyaudio.PyAudio()
@@ -748,6 +2654,7 @@ class WakeWordDetector:
             logger.info(f"Using auto-detected sample rate: {self.sample_rate} Hz")
 
         self.chunk_size = int(self.sample_rate * 0.08)  # 80ms chunks
+        self.resampler = None
 
         self.use_openwakeword = OPENWAKEWORD_AVAILABLE
 
@@ -1027,7 +2934,10 @@ class WakeWordDetector:
 
     def _resample_audio(self, audio_array: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
         """
-        Resample audio to target sample rate using simple linear interpolation
+        Resample the next chunk of the stream to target sample rate
+
+        The resampler keeps the end of each chunk for the next one, so call
+        this with consecutive chunks and reset self.resampler after a gap.
 
         Args:
             audio_array: Input audio as numpy array (int16)
@@ -1035,29 +2945,52 @@ class WakeWordDetector:
             to_rate: Target sample rate
 
         Returns:
-            Resampled audio as numpy array (int16)
+            Resampled audio as numpy array (int16), overwritten by the next call
         """
         if from_rate == to_rate:
             return audio_array
 
-        # Calculate resampling ratio
-        duration = len(audio_array) / from_rate
-        target_length = int(duration * to_rate)
+        if (self.resampler is None or self.resampler.from_rate != from_rate
+                or self.resampler.to_rate != to_rate):
+            self.resampler = PolyphaseResampler(from_rate, to_rate)
+        return self.resampler.process(audio_array)
 
-        # Use numpy's interp for simple linear interpolation
-        x_old = np.linspace(0, duration, len(audio_array))
-        x_new = np.linspace(0, duration, target_length)
+    def _start_capture(self):
+        """
+        Open the microphone and keep filling self.ring from it in the PyAudio callback
 
-        # Interpolate and convert back to int16
-        resampled = np.interp(x_new, x_old, audio_array.astype(np.float32))
-        return resampled.astype(np.int16)
+        Returns:
+            AudioCapture, or CaptureProcess running it in another process
+        """
+        self.ring = AudioRingBuffer(int(self.sample_rate * self.ring_seconds), shared=self.capture_process)
+        if self.capture_process:
+            capture = CaptureProcess(self.ring, self.sample_rate, self.chunk_size, self.device_index)
+        else:
+            capture = AudioCapture(self.audio, self.ring, self.sample_rate, self.chunk_size, self.device_index)
+        capture.start()
+        return capture
+
+    def _stop_capture(self, capture):
+        capture.stop()
+        self.ring.release()
+
+    def capture_stats(self) -> dict:
+        """Microphone capture counters, empty before listening starts"""
+        if self.ring is None:
+            return {}
+        return {
+            "captured_seconds": round(self.ring.position / self.sample_rate, 1),
+            "input_overflows": self.ring.overflows,
+            "dropped_samples": self.ring.dropped
+        }
 
     def start_listening(self, callback):
         """
         Start listening for wake word
 
         Args:
-            callback: Function to call when wake word is detected
+            callback: Function to call when wake word is detected, with a RingBufferReader
+                      that reads the microphone from the moment of detection on
         """
         if self.use_openwakeword:
             self._listen_openwakeword(callback)
@@ -1079,14 +3012,8 @@ class WakeWordDetector:
         if needs_resampling:
             logger.info(f"🔄 Will resample audio: {self.sample_rate}Hz → {model_sample_rate}Hz")
 
-        stream = self.audio.open(
-            rate=self.sample_rate,
-            channels=1,
-            format=pyaudio.paInt16,
-            input=True,
-            frames_per_buffer=self.chunk_size,
-            input_device_index=self.device_index
-        )
+        capture = self._start_capture()
+        reader = RingBufferReader(self.ring)
 
         # Track scores for debugging
         score_log_counter = 0
@@ -1095,11 +3022,8 @@ class WakeWordDetector:
 
         try:
             while True:
-                # Read audio chunk
-                audio_data = stream.read(self.chunk_size, exception_on_overflow=False)
-
-                # Convert to numpy array (int16)
-                audio_array = np.frombuffer(audio_data, dtype=np.int16)
+                # Read audio chunk (int16) captured by the PyAudio callback
+                audio_array = reader.read_array(self.chunk_size)
 
                 # Resample to 16kHz if needed (OpenWakeWord requirement)
                 if needs_resampling:
@@ -1144,11 +3068,14 @@ class WakeWordDetector:
                         logger.info(f"✓ Wake word '{wake_word}' detected! (score: {score:.3f} >= threshold: {self.threshold:.3f})")
                         print(f"✓ Wake word detected! (score: {score:.3f})")
 
-                        # Call the callback with the active stream (DON'T close it!)
-                        callback(stream)
+                        # Call the callback with the audio from the moment of detection on
+                        callback(RingBufferReader(self.ring, reader.position))
 
-                        # Reset model state and counters
+                        # Skip the audio read by the callback, reset model state and counters
+                        reader.seek(self.ring.position)
                         self.oww_model.reset()
+                        if self.resampler:
+                            self.resampler.reset()
                         score_log_counter = 0
                         max_score_window = 0.0
                         volume_display_counter = 0
@@ -1162,8 +3089,7 @@ class WakeWordDetector:
                 print("\n")
             logger.info("Stopping...")
         finally:
-            stream.stop_stream()
-            stream.close()
+            self._stop_capture(capture)
 
     def _listen_volume_based(self, callback):
         """Listen using simple volume-based detection (2 claps)"""
@@ -1173,23 +3099,14 @@ class WakeWordDetector:
             print(f"\n💡 TIP: Watch the volume levels below. Clap or speak loudly to see what levels you get.")
             print(f"    If claps don't reach {self.volume_threshold}, adjust with --volume-threshold\n")
 
-        stream = self.audio.open(
-            rate=self.sample_rate,
-            channels=1,
-            format=pyaudio.paInt16,
-            input=True,
-            frames_per_buffer=self.chunk_size,
-            input_device_index=self.device_index
-        )
+        capture = self._start_capture()
+        reader = RingBufferReader(self.ring)
 
         last_print_time = time.time()
         try:
             while True:
-                # Read audio chunk
-                audio_data = stream.read(self.chunk_size, exception_on_overflow=False)
-
-                # Convert to numpy array and calculate RMS
-                audio_array = np.frombuffer(audio_data, dtype=np.int16)
+                # Read audio chunk (int16) captured by the PyAudio callback and calculate RMS
+                audio_array = reader.read_array(self.chunk_size)
                 rms = np.sqrt(np.mean(audio_array.astype(np.float32) ** 2))
 
                 current_time = time.time()
@@ -1220,10 +3137,11 @@ class WakeWordDetector:
                         logger.info("Wake signal detected (2 loud sounds)!")
                         self.clap_history = []  # Reset
 
-                        # Call the callback with the active stream (DON'T close it!)
-                        callback(stream)
+                        # Call the callback with the audio from the moment of detection on
+                        callback(RingBufferReader(self.ring, reader.position))
 
-                        # Reset for next wake word detection
+                        # Skip the audio read by the callback, reset for next wake word detection
+                        reader.seek(self.ring.position)
                         if self.show_volume_meter:
                             print("\n📊 Listening for wake signal again...")
                         last_print_time = time.time()
@@ -1232,8 +3150,7 @@ class WakeWordDetector:
             print("\n")
             logger.info("Stopping...")
         finally:
-            stream.stop_stream()
-            stream.close()
+            self._stop_capture(capture)
 
     def close(self):
         """Clean up resources"""
@@ -1252,7 +3169,9 @@ class VoiceControlSystem:
         volume_threshold: int = 2000,
         recording_silence_threshold: int = 200,
         show_volume_meter: bool = False,
-        force_sample_rate: Optional[int] = None
+        force_sample_rate: Optional[int] = None,
+        speech_recognizer: Optional[str] = None,
+        api_app=None
     ):
         """
         Initialize voice control system
@@ -1270,15 +3189,29 @@ class VoiceControlSystem:
             recording_silence_threshold: RMS volume threshold for silence during recording (default: 200)
             show_volume_meter: Show live audio volume meter during wake word detection
             force_sample_rate: Force a specific sample rate (e.g., 16000) to avoid resampling
+            speech_recognizer: cloud, local or local-first, if None reads speech_recognizer from config
+            api_app: The home-iot Flask app when running in the API server process (main.py),
+                     commands then call its views directly instead of over HTTP
         """
         self.recording_silence_threshold = recording_silence_threshold
         self.device_index = device_index  # Store device index to use for recording
         self.config = VoiceControlConfig(config_path)
-        self.audio_player = AudioPlayer(self.config.get('audio_dir', 'voicecontrol/VoiceCommands/'))
+        output_device = self.config.get('audio_output_device', '').strip()
+        self.audio_player = AudioPlayer(
+            self.config.get('audio_dir', 'voicecontrol/VoiceCommands/'),
+            output_device_index=int(output_device) if output_device else None
+        )
 
         # Get Google API key from config
+        # Speech recognition policy: cloud, local or local-first
+        if speech_recognizer is None:
+            speech_recognizer = self.config.get('speech_recognizer', 'cloud').strip().lower()
+        if speech_recognizer not in PolicySpeechRecognizer.POLICIES:
+            raise ValueError(f"Unknown speech_recognizer '{speech_recognizer}', "
+                             f"expected one of {', '.join(PolicySpeechRecognizer.POLICIES)}")
+
         google_api_key = self.config.get('google_api_key')
-        if not google_api_key:
+        if not google_api_key and speech_recognizer != PolicySpeechRecognizer.LOCAL:
             raise ValueError("google_api_key not found in config file!")
 
         # Get threshold from config if not provided as argument
@@ -1286,8 +3219,60 @@ class VoiceControlSystem:
             threshold = float(self.config.get('wakeword_threshold', '0.5'))
             logger.info(f"Using wakeword threshold from config: {threshold}")
 
-        self.speech_recognizer = SpeechRecognizer(google_api_key)
-        self.command_processor = CommandProcessor(self.config, self.audio_player)
+        self.cloud_recognizer = None
+        if speech_recognizer != PolicySpeechRecognizer.LOCAL:
+            self.cloud_recognizer = SpeechRecognizer(
+                google_api_key,
+                flac_compression_level=int(self.config.get('flac_compression_level', '5')),
+                max_alternatives=int(self.config.get('speech_max_alternatives', '5'))
+            )
+
+        # Model is loaded in the background and kept in memory
+        self.local_recognizer = None
+        if speech_recognizer != PolicySpeechRecognizer.CLOUD:
+            self.local_recognizer = LocalSpeechRecognizer(
+                engine=self.config.get('local_speech_engine', 'vosk').strip().lower(),
+                model_path=self.config.get('local_speech_model', '/usr/local/bin/home-iot/vosk-model-bg'),
+                timeout=float(self.config.get('local_speech_timeout', '5'))
+            )
+
+        self.speech_recognizer = PolicySpeechRecognizer(
+            speech_recognizer,
+            cloud=self.cloud_recognizer,
+            local=self.local_recognizer,
+            min_confidence=float(self.config.get('local_speech_min_confidence', '0.6'))
+        )
+        logger.info(f"Speech recognition: {speech_recognizer}")
+
+        # Streaming recognition while recording (off, http or grpc)
+        self.streaming_recognizer = None
+        streaming = self.config.get('speech_streaming', 'off').strip().lower()
+        if streaming in ('http', 'grpc') and speech_recognizer != PolicySpeechRecognizer.CLOUD:
+            logger.warning(f"speech_streaming is only used with speech_recognizer = cloud, ignoring it")
+        elif streaming in ('http', 'grpc'):
+            self.streaming_recognizer = StreamingSpeechRecognizer(
+                google_api_key,
+                transport=streaming,
+                url=self.config.get('speech_streaming_url', 'http://localhost:8765/recognize'),
+                fallback=self.cloud_recognizer
+            )
+        elif streaming not in ('', 'off'):
+            logger.warning(f"Unknown speech_streaming '{streaming}', expected off, http or grpc")
+        self.command_processor = CommandProcessor(self.config, self.audio_player, api_app=api_app)
+
+        # On-device matching of the command phrases, speech recognition only for the rest
+        self.command_spotter = None
+        if self.config.get('command_spotter', 'off').strip().lower() == 'on':
+            if self.streaming_recognizer:
+                logger.warning("command_spotter is not used with speech_streaming, ignoring it")
+            else:
+                self.command_spotter = CommandSpotter(
+                    self.config.get('spotter_samples_dir', '/usr/local/bin/home-iot/spotter_samples'),
+                    commands=[phrase for phrase in self.command_processor.commands
+                              if CommandMatcher.NUMBER not in phrase],
+                    max_distance=float(self.config.get('spotter_max_distance', '1.8')),
+                    min_confidence=float(self.config.get('spotter_min_confidence', '0.3'))
+                )
         self.audio_recorder = AudioRecorder(device_index=device_index)
 
         self.wake_word_detector = WakeWordDetector(
@@ -1296,49 +3281,171 @@ class VoiceControlSystem:
             device_index=device_index,
             volume_threshold=volume_threshold,
             show_volume_meter=show_volume_meter,
-            force_sample_rate=force_sample_rate
+            force_sample_rate=force_sample_rate,
+            capture_process=self.config.get('audio_capture_process', 'off').strip().lower() == 'on'
         )
 
+        self.prewarm_thread = None
+        self.stopping = threading.Event()
+        self.stats_interval = float(self.config.get('audio_stats_interval', '60'))
+
+        # Recognition and command execution run here, while the wake word detector listens again
+        self.processing_jobs = queue.Queue()
+        self.processing_thread = threading.Thread(target=self._processing_loop, name="command-processing",
+                                                  daemon=True)
+        self.processing_thread.start()
+
     def on_wake_word_detected(self, audio_stream):
         """
         Callback when wake word is detected
 
+        Records the command while the acknowledgment plays and hands the recording to the
+        processing thread, so the wake word detector listens again as soon as recording ends.
+
         Args:
-            audio_stream: The active audio stream from wake word detector (stays open!)
+            audio_stream: RingBufferReader of the microphone from the moment of detection on
         """
+        if not self.wake_word_detector.use_openwakeword and self.audio_player.busy():
+            # The volume-based detector hears our own replies
+            logger.info("Ignoring wake word while a reply is playing")
+            return
+
         logger.info("Wake word detected - ready for command")
+        self._prewarm_connections()
 
-        # Play acknowledgment sound
-        self.audio_player.play_reply("Yes", 3)
+        actual_sample_rate = self.wake_word_detector.sample_rate
+        background_rms = self._background_level(audio_stream.ring, audio_stream.position, actual_sample_rate)
+
+        # Acknowledge while already recording, only the audio read while the clip itself plays is left out,
+        # not the command said while replies queued ahead of it still play
+        ack_started = threading.Event()
+        ack = self.audio_player.play_reply("Yes", 3, started=ack_started)
+        ack_playing = lambda: ack_started.is_set() and not ack.is_set()
+
+        if self.streaming_recognizer:
+            # Recognize while recording, stop as soon as the recognizer has the final result
+            session = self.streaming_recognizer.start(actual_sample_rate)
+            self._record_from_stream(
+                audio_stream,
+                max_duration=7,
+                silence_duration=0.7,
+                silence_threshold=self.recording_silence_threshold,
+                show_volume_meter=self.wake_word_detector.show_volume_meter,
+                on_chunk=session.send,
+                stop_when=session.has_final,
+                background_rms=background_rms,
+                vad_paused=ack_playing
+            )
+            self.processing_jobs.put((self._process_stream, (session,)))
+        else:
+            # Compress while recording, so the upload is ready when the silence is detected
+            encoder = self.speech_recognizer.start_flac_encoder(actual_sample_rate)
+
+            # Record command using the SAME stream (don't close/reopen!)
+            audio_data = self._record_from_stream(
+                audio_stream,
+                max_duration=7,
+                silence_duration=0.7,
+                silence_threshold=self.recording_silence_threshold,
+                show_volume_meter=self.wake_word_detector.show_volume_meter,
+                on_chunk=encoder.write if encoder else None,
+                background_rms=background_rms,
+                vad_paused=ack_playing
+            )
+            self.processing_jobs.put((self._process_recording, (audio_data, actual_sample_rate, encoder)))
 
-        # Record command using the SAME stream (don't close/reopen!)
-        audio_data = self._record_from_stream(
-            audio_stream,
-            max_duration=7,
-            silence_duration=0.7,
-            silence_threshold=self.recording_silence_threshold,
-            show_volume_meter=self.wake_word_detector.show_volume_meter
-        )
+    def _prewarm_connections(self):
+        """Connect to Google and the API server while the command is being recorded"""
+        if self.prewarm_thread and self.prewarm_thread.is_alive():
+            return
+        self.prewarm_thread = threading.Thread(target=self._prewarm, name="prewarm", daemon=True)
+        self.prewarm_thread.start()
 
-        # Transcribe with the correct sample rate!
-        actual_sample_rate = self.wake_word_detector.sample_rate
-        logger.info(f"Sending to Google with sample rate: {actual_sample_rate} Hz, language: bg-BG")
-        text = self.speech_recognizer.transcribe_audio(audio_data, sample_rate=actual_sample_rate)
+    def _prewarm(self):
+        start = time.time()
+        for client in (self.speech_recognizer, self.command_processor):
+            try:
+                client.prewarm()
+            except Exception as e:
+                logger.debug(f"Pre-warming {type(client).__name__} failed: {e}")
+        logger.debug(f"Connections pre-warmed in {time.time() - start:.2f}s")
+
+    def _processing_loop(self):
+        """Recognize and execute the recorded commands one after the other"""
+        while True:
+            job = self.processing_jobs.get()
+            if job is None:
+                break
+            function, args = job
+            try:
+                function(*args)
+            except Exception as e:
+                logger.error(f"Error processing command: {e}")
+
+    def _process_stream(self, session: StreamingSession):
+        """Wait for the final result of a streamed command and execute it"""
+        text = session.finish()
+        self._execute_transcription([(text, None)] if text else [])
+
+    def _process_recording(self, audio_data: bytes, sample_rate: int, encoder: Optional[IncrementalFlacEncoder]):
+        """Recognize a recorded command and execute it"""
+        # Known command phrases are recognized on the device, no speech to text needed
+        if self.command_spotter:
+            match = self.command_spotter.spot(audio_data, sample_rate)
+            if match:
+                self.command_processor.execute_command(match[0])
+                return
+
+        flac_data = None
+        if encoder is not None:
+            try:
+                flac_data = encoder.finish()
+            except Exception as e:
+                logger.error(f"FLAC encoding error: {e}")
 
-        # Process command
-        if text:
-            self.command_processor.process_command(text)
+        # Transcribe with the correct sample rate!
+        logger.info(f"Transcribing ({self.speech_recognizer.policy}) with sample rate: {sample_rate} Hz, language: bg-BG")
+        alternatives = self.speech_recognizer.transcribe_alternatives(audio_data, sample_rate=sample_rate,
+                                                                      flac_data=flac_data)
+        self._execute_transcription(alternatives)
+
+    def _execute_transcription(self, alternatives: List[tuple]):
+        """Process command"""
+        if alternatives:
+            self.command_processor.process_alternatives(alternatives)
         else:
             logger.warning("No speech recognized")
             self.audio_player.play_reply("UnknownCommand", 4)
 
+    def _background_level(self, ring: AudioRingBuffer, detection: int, sample_rate: int) -> Optional[float]:
+        """
+        Background noise level from the audio before the wake word
+
+        Uses the 3rd to last second before the detection, the wake word itself is in the last one.
+        The quieter quarter of 30ms chunks counts, so a word said meanwhile doesn't raise it.
+
+        Returns:
+            RMS level, None if there is not enough audio before the wake word yet
+        """
+        audio_array = ring.history(detection - 3 * sample_rate, detection - sample_rate)
+        chunk = int(sample_rate * 0.03)
+        if len(audio_array) < 10 * chunk:
+            return None
+        chunks = audio_array[:len(audio_array) // chunk * chunk].reshape(-1, chunk).astype(np.float32)
+        return float(np.percentile(np.sqrt(np.mean(chunks ** 2, axis=1)), 25))
+
     def _record_from_stream(
         self,
         stream,
         max_duration: int = 10,
         silence_duration: float = 1.0,
         silence_threshold: int = 200,
-        show_volume_meter: bool = False
+        show_volume_meter: bool = False,
+        on_chunk: Optional[Callable[[bytes], None]] = None,
+        stop_when: Optional[Callable[[], bool]] = None,
+        background_rms: Optional[float] = None,
+        vad_paused: Optional[Callable[[], bool]] = None,
+        speech_timeout: float = 2.0
     ) -> bytes:
         """
         Record from an existing stream without closing it
@@ -1349,32 +3456,62 @@ class VoiceControlSystem:
             silence_duration: Duration of silence to stop recording
             silence_threshold: RMS volume threshold for silence
             show_volume_meter: Show live volume meter during recording
+            on_chunk: Called with every chunk as soon as it is read (e.g. streaming recognition)
+            stop_when: Checked after every chunk, recording stops early when it returns True
+            background_rms: Background noise level measured before the wake word, skips the calibration
+            vad_paused: While it returns True chunks are read but left out of the recording and not passed
+                        to on_chunk (the acknowledgment sound playing), they don't count for max_duration
+            speech_timeout: Seconds to wait for the speech to start before silence can end the recording
 
         Returns:
             Raw audio bytes
         """
         logger.info(f"Recording (max {max_duration}s, stop after {silence_duration}s silence)...")
-        if show_volume_meter:
+        if show_volume_meter and background_rms is None:
             print(f"Speak now! Calibrating silence threshold...")
 
-        chunk_duration = 30  # ms
         chunk_size = self.wake_word_detector.chunk_size
         sample_rate = self.wake_word_detector.sample_rate
+        chunk_duration = chunk_size * 1000 / sample_rate  # ms
 
         frames = []
         silent_chunks = 0
-        silence_chunks_needed = int(silence_duration * 1000 / chunk_duration)
+        heard_speech = False
+        silence_chunks_needed = max(1, int(silence_duration * 1000 / chunk_duration))
+        speech_wait_chunks = max(silence_chunks_needed, int(speech_timeout * 1000 / chunk_duration))
         max_chunks = int(max_duration * 1000 / chunk_duration)
+        skipped_chunks = 0
 
-        # Adaptive silence threshold: measure background noise for first 0.3 seconds
-        calibration_chunks = int(0.3 * 1000 / chunk_duration)  # 10 chunks
+        # Adaptive silence threshold: from the noise before the wake word, or measured for the first 0.3 seconds
+        calibration_chunks = int(0.3 * 1000 / chunk_duration)
         calibration_levels = []
         adaptive_threshold = silence_threshold
+        if background_rms is not None:
+            calibration_chunks = 0
+            adaptive_threshold = max(silence_threshold, background_rms * 2.5)
+            logger.info(f"Adaptive silence threshold: {int(adaptive_threshold)} (background before wake word: {int(background_rms)})")
+            if show_volume_meter:
+                print(f"\n✓ Silence threshold: {int(adaptive_threshold)} | Speak now, stops after {silence_duration}s silence")
 
         try:
-            for i in range(max_chunks):
+            while len(frames) < max_chunks:
                 chunk = stream.read(chunk_size, exception_on_overflow=False)
+
+                # Read while the acknowledgment played, our own voice is no command
+                if vad_paused and skipped_chunks < max_chunks and vad_paused():
+                    skipped_chunks += 1
+                    continue
                 frames.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+
+                if stop_when and stop_when():
+                    if show_volume_meter:
+                        print("\nEnd of speech reported by the recognizer, processing...")
+                    logger.info("Recognizer reported the end of speech, stopping recording")
+                    break
+
+                i = len(frames) - 1
 
                 # Calculate volume (RMS)
                 audio_data = np.frombuffer(chunk, dtype=np.int16)
@@ -1398,20 +3535,21 @@ class VoiceControlSystem:
                     silent_chunks += 1
                 else:
                     silent_chunks = 0  # Reset on any sound
+                    heard_speech = True
 
                 # Visual feedback every few chunks (only if show_volume_meter is enabled)
                 if show_volume_meter and i % 5 == 0:
                     bar_length = int(min(rms / 50, 40))
                     bar = "█" * bar_length
-                    silent_bar = int((silent_chunks / silence_chunks_needed) * 20)
+                    silent_bar = min(20, int((silent_chunks / silence_chunks_needed) * 20))
                     silent_progress = "▓" * silent_bar + "░" * (20 - silent_bar)
                     status = "🔇" if is_silent else "🗣️"
 
                     print(f"\r{status} Vol: {int(rms):4d} [{bar:40s}] | Silence: [{silent_progress}] {silent_chunks}/{silence_chunks_needed}",
                           end="", flush=True)
 
-                # Stop if we've had enough continuous silence
-                if silent_chunks >= silence_chunks_needed:
+                # Stop if we've had enough continuous silence, waiting longer for the speech to start
+                if silent_chunks >= (silence_chunks_needed if heard_speech else speech_wait_chunks):
                     if show_volume_meter:
                         print(f"\n{silence_duration}s of silence detected, processing...")
                     logger.info(f"Silence detected ({silent_chunks} chunks), stopping recording")
@@ -1423,6 +3561,8 @@ class VoiceControlSystem:
                 print()
 
         duration = len(frames) * chunk_duration / 1000
+        if skipped_chunks:
+            logger.debug(f"Left out {skipped_chunks * chunk_duration / 1000:.2f}s of acknowledgment")
         logger.info(f"Recorded {duration:.2f} seconds")
         if show_volume_meter:
             print(f"Recorded {duration:.2f} seconds of audio")
@@ -1434,6 +3574,9 @@ class VoiceControlSystem:
         logger.info(f"API Server: {self.config.get('api_server_address')}:{self.config.get('listen_port')}")
         logger.info(f"MQTT Broker: {self.config.get('mqtt_broker')}")
 
+        if self.stats_interval > 0:
+            threading.Thread(target=self._stats_loop, name="audio-stats", daemon=True).start()
+
         try:
             self.wake_word_detector.start_listening(self.on_wake_word_detected)
         except KeyboardInterrupt:
@@ -1441,11 +3584,31 @@ class VoiceControlSystem:
         finally:
             self.cleanup()
 
+    def _stats_loop(self):
+        """Log and publish the microphone capture counters to voicecontrol/audio_stats"""
+        last = {}
+        while not self.stopping.wait(self.stats_interval):
+            stats = self.wake_word_detector.capture_stats()
+            if not stats:
+                continue
+            if (stats["input_overflows"] > last.get("input_overflows", 0)
+                    or stats["dropped_samples"] > last.get("dropped_samples", 0)):
+                logger.warning(f"Microphone audio lost: {stats['input_overflows']} input overflows, "
+                               f"{stats['dropped_samples']} samples dropped by slow readers")
+            self.command_processor.mqtt_client.publish('voicecontrol/audio_stats', json.dumps(stats), retain=True)
+            last = stats
+
     def cleanup(self):
         """Clean up resources"""
         logger.info("Cleaning up resources...")
+        self.stopping.set()
         self.wake_word_detector.close()
         self.audio_recorder.close()
+        # Let the command being processed finish
+        self.processing_jobs.put(None)
+        self.processing_thread.join(timeout=15)
+        self.speech_recognizer.close()
+        self.audio_player.close()
         self.command_processor.mqtt_client.loop_stop()
         self.command_processor.mqtt_client.disconnect()
 
@@ -1513,6 +3676,14 @@ def main():
              'If not set, auto-detects best rate for your device.'
     )
 
+    parser.add_argument(
+        '--recognizer',
+        choices=['cloud', 'local', 'local-first'],
+        default=None,
+        help='Speech recognition: cloud (Google), local (offline model) or local-first (local, Google when unsure). '
+             'If not set, reads speech_recognizer from config file.'
+    )
+
     args = parser.parse_args()
 
     # List audio devices if requested
@@ -1548,7 +3719,8 @@ def main():
         volume_threshold=args.volume_threshold,
         recording_silence_threshold=args.recording_silence_threshold,
         show_volume_meter=args.show_volume_meter,
-        force_sample_rate=args.sample_rate
+        force_sample_rate=args.sample_rate,
+        speech_recognizer=args.recognizer
     )
 
     system.run()